@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - 16 motors on port expanders. One bus transaction per chip per tick vs a write per pin
+
+    mcp23017   4 chips on a fake I2C bus, 4 motors per chip
+    74hc595    8 chip chain on a fake SPI bus, 2 motors per chip
+    per pin    the same 64 pins written one I2C transaction per changed pin (how a pin by pin driver would do it)
+
+Reports ticks/sec and bus transactions per tick. On a real 400kHz I2C bus a 3 byte write is about 70 µs,
+so transactions per tick sets how fast the motors can step, not the python time shown here.
+Also checks the expander outputs follow the coil pattern of every motor.
+
+$ python3 benchmarks/bench_expander.py [ticks]
+"""
+
+import logging, sys
+from os import path
+from time import perf_counter
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import stepper28byj
+from stepper28byj.expander import MCP23017Driver, HC595Driver, FakeI2CBus, FakeSPIBus
+
+MOTORS = 16
+PINS = [[4*m, 4*m+1, 4*m+2, 4*m+3] for m in range(MOTORS)]
+
+class PinByPinDriver(MCP23017Driver):
+    ''' MCP23017s written one pin at a time. The read-modify-write a per pin GPIO API ends up doing '''
+    def write(self, setmask, clrmask):
+        levels = (self.levels | setmask) & ~clrmask
+        changed = levels ^ self.levels
+        pin = 0
+        while changed:
+            if changed & 1:
+                self.levels ^= 1 << pin
+                port = (self.levels >> (pin & ~15)) & 0xFFFF
+                self.bus.write_i2c_block_data(self.addresses[pin >> 4], self.OLATA, [port & 0xFF, port >> 8])
+                self.writes += 1
+            changed >>= 1
+            pin += 1
+
+def run(motor, driver, count):
+    ''' Tick count times, every motor in halfstep (odd motors reversed). Returns (ticks/sec, transactions/tick) '''
+    controls = {"delay":[0.8,1.0], "speed":[3]*MOTORS, "mode":[0]*MOTORS, "inverse":[m % 2 == 1 for m in range(MOTORS)], "step":[2038]*MOTORS, "startstep":[0]*MOTORS}
+    writes = driver.writes
+    t0 = perf_counter()
+    for x in range(count):
+        motor.tick(controls)
+    return count / (perf_counter() - t0), (driver.writes - writes) / count
+
+def coils(motor):
+    ''' Expected pin levels from each motor's coils '''
+    levels = 0
+    for m in motor.mach.stepper:
+        for pin, on in zip(m.pins, m.coils):
+            levels |= bool(on) << pin
+    return levels
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    addresses = (0x20, 0x21, 0x22, 0x23)
+    for name, bus, makedriver, outputs in (
+            ("mcp23017", FakeI2CBus(), lambda bus: MCP23017Driver(bus, addresses), lambda bus: sum(bus.outputs(a) << 16 * k for k, a in enumerate(addresses))),
+            ("74hc595", FakeSPIBus(), lambda bus: HC595Driver(bus, chips=8), lambda bus: bus.outputs()),
+            ("per pin", FakeI2CBus(), lambda bus: PinByPinDriver(bus, addresses), lambda bus: sum(bus.outputs(a) << 16 * k for k, a in enumerate(addresses)))):
+        driver = makedriver(bus)
+        motor = stepper28byj.Stepper(*PINS, logger=logger, driver=driver)
+        rate, writes = run(motor, driver, count)
+        print("{0:<9} {1} motors {2:>8,.0f} ticks/sec  {3:5.2f} bus transactions/tick  outputs match coils: {4}".format(name, MOTORS, rate, writes, outputs(bus) == coils(motor)))
+        motor.cleanupGPIO()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - RPi.GPIO driver (one call per changed pin) vs gpiomem driver (one SET + one CLR register write per step)
+
+gpiomem runs against a plain file standing in for /dev/gpiomem. The RPi.GPIO stub does no work
+so on a real Pi the per pin writes cost more than shown here.
+
+$ python3 benchmarks/bench_gpiomem.py
+"""
+
+import logging, sys, tempfile
+from os import path
+from time import perf_counter
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import fakegpio
+GPIO = fakegpio.install()
+import stepper28byj
+from stepper28byj.gpiomem import EmulatedGPIOMem
+
+PINS = [[12, 16, 20, 21], [19, 13, 6, 5], [2, 3, 4, 17], [27, 22, 10, 9], [11, 0, 1, 7], [8, 25, 24, 23]]
+
+def run(motor, count):
+    ''' Tick count times with every motor in halfstep. Returns steps/sec '''
+    command = {"delay":[0.8,1.0], "speed":[3 for x in motor.mach.stepper], "mode":[0 for x in motor.mach.stepper], "inverse":[False for x in motor.mach.stepper],
+               "step":[2038 for x in motor.mach.stepper], "startstep":[0 for x in motor.mach.stepper]}
+    t0 = perf_counter()
+    for x in range(count):
+        motor.tick(command)
+    return count / (perf_counter() - t0)
+
+if __name__ == "__main__":
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.INFO)
+    count = 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        for motors in (1, 2, 6):
+            gpio = stepper28byj.Stepper(*PINS[:motors], logger=logger)
+            gpiomem = stepper28byj.Stepper(*PINS[:motors], logger=logger, driver=EmulatedGPIOMem(path.join(tmp, "gpiomem")))
+            print("{0} motor(s)  RPi.GPIO stub: {1:>8,.0f} steps/sec  gpiomem file: {2:>8,.0f} steps/sec".format(motors, run(gpio, count), run(gpiomem, count)))
+            gpiomem.cleanupGPIO()
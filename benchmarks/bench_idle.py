@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - StepperThread with every motor stopped. Ticking all day vs blocking until a command
+
+    ticking   idle detection off (Stepper.idle patched to False). The loop keeps ticking every 0.8 ms
+    blocking  StepperThread as is. Coils off once, then waits on the wake event
+Reported for 2 motors on the sim driver
+    cpu %       process cpu time over SECONDS stopped (main thread sleeping)
+    writes/s    driver writes while stopped
+    wake p50/max  time from setcontrols (speed 3) to the first coil write (µs), WAKES times
+The step period is 800 µs, wake up should be well under it.
+Also checks a stopped shard worker (stepper28byj.shard) reports idlei 1 and a stepping one 0.
+
+$ python3 benchmarks/bench_idle.py [seconds]
+"""
+
+import logging, sys, time
+from os import path
+from time import sleep, perf_counter_ns
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import stepper28byj
+from stepper28byj.shard import ShardSupervisor
+
+SECONDS = 3
+WAKES = 50
+STOP = {"delay":[0.8,1.0], "speed":[2,2], "mode":[0,0], "inverse":[False,True], "step":[2038,2038], "startstep":[0,0]}
+RUN = dict(STOP, speed=[3,3])
+
+def run(blocking, seconds, logger):
+    motor = stepper28byj.Stepper([12, 16, 20, 21], [19, 13, 6, 5], logger=logger, driver="sim")
+    if not blocking:
+        motor.idle = lambda: False
+    thread = stepper28byj.StepperThread(motor, STOP)
+    thread.start()
+    try:
+        sleep(0.2)
+        writes, cpu0, t0 = motor.gpio.count, time.process_time(), time.perf_counter()
+        sleep(seconds)
+        cpu = 100 * (time.process_time() - cpu0) / (time.perf_counter() - t0)
+        rate = (motor.gpio.count - writes) / seconds
+        wakes = []
+        for x in range(WAKES):
+            thread.setcontrols(STOP)
+            sleep(0.02)                        # Stopped (and blocking when idle detection is on)
+            count = motor.gpio.count
+            tset = perf_counter_ns()
+            thread.setcontrols(RUN)
+            while motor.gpio.levels == 0 or motor.gpio.count == count:   # First write with a coil on
+                sleep(0)
+            history = motor.gpio.history()
+            wakes.append(next(t for t, levels in history if t >= tset and levels) - tset)
+        wakes.sort()
+    finally:
+        thread.stop()
+    return cpu, rate, wakes[len(wakes) // 2] / 1000, wakes[-1] / 1000
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    print("{0:<9} {1:>6} {2:>9} {3:>9} {4:>9}".format("", "cpu %", "writes/s", "wake p50", "max µs"))
+    for name, blocking in (("ticking", False), ("blocking", True)):
+        cpu, rate, p50, worst = run(blocking, seconds, logger)
+        print("{0:<9} {1:>6.1f} {2:>9,.0f} {3:>9.0f} {4:>9.0f}".format(name, cpu, rate, p50, worst))
+    supervisor = ShardSupervisor([[12, 16, 20, 21], [19, 13, 6, 5]], STOP, shards=1, logger=logger)
+    supervisor.start()
+    try:
+        sleep(1)
+        stopped = supervisor.getdata()["idlei"]
+        supervisor.setcontrols(RUN)
+        sleep(0.2)
+        stepping = supervisor.getdata()["idlei"]
+    finally:
+        supervisor.stop()
+    print("shard idlei stopped {0} stepping {1}: {2}".format(stopped, stepping, "ok" if (stopped, stepping) == (1, 0) else "WRONG"))
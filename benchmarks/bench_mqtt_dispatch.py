@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - demoMQTT.on_message under a flood of dashboard slider updates
+
+    regex    the previous on_message: re.match on the topic, json.loads, controls dict passed on as is,
+             payload decoded a second time at DEBUG (copied here)
+    dispatch demoMQTT.on_message: topic -> handler table, payload decoded once into a checked Controls
+
+The flood runs on its own thread (like the paho network thread) while a StepperThread steps two
+motors on the sim driver, so the GIL is shared the same way it is in demoMQTT.
+    msgs/sec  messages handled by the callback thread. Best of 3 runs
+    missed    steps the stepper thread started more than MISSNS late during the 3 floods
+
+$ python3 benchmarks/bench_mqtt_dispatch.py [messages]
+"""
+
+import json, logging, re, sys, threading
+from os import path
+from time import perf_counter
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import fakemqtt
+mqttclient = fakemqtt.install()
+import demoMQTT
+import stepper28byj
+
+LVL1 = "nred2pi"
+MQTT_REGEX = LVL1 + '/([^/]+)/([^/]+)'
+CONTROLS = {"delay":[0.8,1.0], "speed":[3,3], "mode":[0,0], "inverse":[False,True], "step":[2038, 2038], "startstep":[0,0], "accel":[3000,3000], "startdelay":[2.0,2.0], "jerk":[0,0]}
+
+def regex_on_message(client, userdata, msg):
+    ''' on_message before the dispatch table '''
+    global mqtt_controlsD, mqtt_stepreset
+    mqtt_logger.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
+    msgmatch = re.match(MQTT_REGEX, msg.topic)   # Check for match to subscribed topics
+    if msgmatch:
+        mqtt_payload = json.loads(str(msg.payload.decode("utf-8", "ignore")))
+        mqtt_topic = [msgmatch.group(0), msgmatch.group(1), msgmatch.group(2), type(mqtt_payload)]
+        if mqtt_topic[2] == 'controls':
+            mqtt_controlsD = mqtt_payload
+            motorthread.setcontrols(mqtt_controlsD)
+        elif mqtt_topic[2] == 'stepreset':
+            mqtt_stepreset = mqtt_payload
+    if mqtt_logger.getEffectiveLevel() == 10:
+        mqtt_logger.debug("Topic grp0:{0} grp1:{1} grp2:{2}".format(msgmatch.group(0), msgmatch.group(1), msgmatch.group(2)))
+        mqtt_payload = json.loads(str(msg.payload.decode("utf-8", "ignore")))
+        mqtt_logger.debug("Payload type:{0}".format(type(mqtt_payload)))
+        if isinstance(mqtt_payload, (str, bool, int, float)):
+            mqtt_logger.debug(mqtt_payload)
+        elif isinstance(mqtt_payload, list):
+            mqtt_logger.debug(mqtt_payload)
+        elif isinstance(mqtt_payload, dict):
+            for key, value in mqtt_payload.items():
+                mqtt_logger.debug("{0}:{1}".format(key, value))
+
+def flood(count):
+    ''' Slider updates. The delay and accel sliders are dragged back and forth, speed flips now and then '''
+    messages = []
+    for k in range(count):
+        controls = dict(CONTROLS)
+        controls["delay"] = [round(0.8 + (k % 200) / 1000, 3), 1.0]
+        controls["accel"] = [1000 + (k % 50) * 100, 3000]
+        controls["speed"] = [3 if (k // 500) % 2 == 0 else 1, 3]
+        messages.append(mqttclient.MQTTMessage(LVL1 + "/stepperZCMD/controls", json.dumps(controls).encode()))
+    return messages
+
+def run(callback, messages):
+    ''' Handle every message on a callback thread while the stepper thread runs. Returns (msgs/sec, missed steps) '''
+    missed = motorthread.missed
+    elapsed = []
+    def callbackthread():
+        t0 = perf_counter()
+        for msg in messages:
+            callback(None, None, msg)
+        elapsed.append(perf_counter() - t0)
+    thread = threading.Thread(target=callbackthread)
+    thread.start()
+    thread.join()
+    return len(messages) / elapsed[0], motorthread.missed - missed
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    mqtt_logger = logger
+    motor = stepper28byj.Stepper([12, 16, 20, 21], [19, 13, 6, 5], logger=logger, driver='sim')
+    motorthread = stepper28byj.StepperThread(motor, dict(CONTROLS))
+    demoMQTT.mqtt_logger = logger                # demoMQTT globals normally set up in main()
+    demoMQTT.motorthread = motorthread
+    demoMQTT.mqtt_controlsD = dict(CONTROLS)
+    demoMQTT.MQTT_HANDLERS = {LVL1 + "/stepperZCMD/controls": demoMQTT.on_controls, LVL1 + "/stepperZCMD/stepreset": demoMQTT.on_stepreset}
+    messages = flood(count)
+    motorthread.start()
+    try:
+        for level in (logging.INFO, logging.DEBUG):
+            logger.setLevel(level)
+            for name, callback in (("regex", regex_on_message), ("dispatch", demoMQTT.on_message)):
+                runs = [run(callback, messages) for x in range(3)]
+                rate, missed = max(r[0] for r in runs), sum(r[1] for r in runs)
+                print("{0:<6} {1:<9} {2:>9,.0f} msgs/sec  missed steps {3}".format(logging.getLevelName(level), name, rate, missed))
+        bad = [mqttclient.MQTTMessage(LVL1 + "/stepperZCMD/controls", payload) for payload in
+               (b'{"delay":[0,1]}', b'{"delay":[0.8,1], "speed":[7,3], "mode":[0,0], "inverse":[false,true], "step":[1,1], "startstep":[0,0]}', b'not json', b'[1,2]')]
+        logger.setLevel(logging.CRITICAL)
+        passed = 0
+        for msg in bad:
+            controls = demoMQTT.mqtt_controlsD
+            demoMQTT.on_message(None, None, msg)
+            passed += demoMQTT.mqtt_controlsD is not controls
+        print("malformed controls passed to the stepper: {0} of {1}".format(passed, len(bad)))
+    finally:
+        motorthread.stop()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - array rotation (slicing) vs phase table lookup in Stepper.step
+
+Runs both engines with the loop delay removed and reports steps/sec. The slicing engine
+writes to a stub RPi.GPIO, the phase table engine to the in memory 'sim' driver.
+Also checks both engines send exactly the same coil sequence to the pins.
+
+$ python3 benchmarks/bench_phase_engine.py
+"""
+
+import logging, random, sys
+from os import path
+from time import perf_counter, perf_counter_ns
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import fakegpio
+GPIO = fakegpio.install(record=True)
+import stepper28byj
+from faketimer import NoWait
+
+sleep = lambda seconds: None   # Remove the slicing engine's loop delay. Only measure coil logic + GPIO call
+
+class SlicingStepper(stepper28byj.Stepper):
+    ''' The original Stepper.step (array rotation by slicing). Kept here as the "before" reference '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for i in range(len(self.mach.stepper)):
+            self.mach.stepper[i].speed = [0,0,[0,0,0,0],0,0]
+            self.mach.stepper[i].coils = {"Harr1":[[0,0,1,1],[0,0,1,1]], "Farr1":[[0,0,1,1],[0,0,1,1]], "arr2":[[0,0,0,1],[0,0,0,1]], "arr3":[[0,0,1,0],[0,0,1,0]], "HarrOUT":[0,1], "FarrOUT":[0,1]}
+
+    def step(self, incomingD):
+        ''' LOOP THRU EACH STEPPER AND THE TWO ROTATIONS (CW/CCW) AND SEND COIL ARRAY (HIGH PULSES) '''
+        self.command = incomingD
+        self.delay = self.command["delay"][0]        # First delay is half step loop pause. Second value is add-on for full step.
+        for i in range(len(self.mach.stepper)):   # Loop thru each stepper
+            self.timens[i] = perf_counter_ns() # time counter for monitoring how long the loop takes
+            stepspeed = self.command["speed"][i]         # stepspeed is a temporary variable for this loop
+            if stepspeed > 2:
+                rotation = 0 if self.command["inverse"][i] else 1
+            elif stepspeed < 2:
+                rotation = 1 if self.command["inverse"][i] else 0
+                
+            if stepspeed == 3 or stepspeed == 1:  # Half step calculation
+                if rotation == 1:            # H is for half-step. Do array rotation (slicing) by 1 place to the right for CW
+                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][-1:] + self.mach.stepper[i].coils["Harr1"][rotation][:-1]
+                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr2"][rotation]
+                    self.mach.stepper[i].coils["arr2"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
+                else:                        # Array rotation (slicing) 1 place to the left for CCW. And use arr3
+                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][1:] + self.mach.stepper[i].coils["Harr1"][rotation][:1]
+                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr3"][rotation]
+                    self.mach.stepper[i].coils["arr3"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
+            if stepspeed == 4 or stepspeed == 0:  # Full step calculation          
+                self.delay = self.command["delay"][0] + self.command["delay"][1] # Add extra delay for full step
+                if rotation == 1:            # F is for full-step. Do array rotation (slicing) by 1 place to the right for CW
+                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][-1:] + self.mach.stepper[i].coils["Farr1"][rotation][:-1]
+                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
+                else:                        # Array rotation (slicing) 1 place to the left for CCW 
+                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][1:] + self.mach.stepper[i].coils["Farr1"][rotation][:1]
+                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
+            
+            # Now that coil array updated set the 4 available speeds/direction. Half step CW & CCW. Full step CW & CCW.
+            if not self.command["inverse"][i]: # Normal rotation pattern. speed 3/4=rot1(CW). speed 0/1=rot0 (CCW). 
+                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][0]
+                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][0]
+                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][1]
+                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][1]
+            elif self.command["inverse"][i]:  # Inverse rotation pattern. speed 3/4=rot0(CCW). speed 0/1=rot1 (CW). 
+                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][1]
+                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][1]
+                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][0]
+                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][0]
+            
+
+            # If mode is 1 (incremental stepping) and startstep has been flagged from node-red gui then startstepping
+            if self.command["mode"][i] == 1 and stepspeed != 2 and self.command["startstep"][i] == 1:
+                self.startstepping[i] = True
+                self.command["startstep"][i] = 0 # startstepping triggered and targetstep calculated. So turn off this if cond
+                if stepspeed > 2: # moving CW 
+                    if abs(self.mach.stepper[i].step) + self.command["step"][i] <= self.FULLREVOLUTION: # Set the target step based on node-red gui target and current step for that motor
+                        self.targetstep[i] = abs(self.mach.stepper[i].step) + self.command["step"][i]
+                    else:
+                        self.targetstep[i] = self.FULLREVOLUTION
+                else:      # moving CCW
+                    self.targetstep[i] = self.mach.stepper[i].step - self.command["step"][i]
+                    if self.targetstep[i] < (self.FULLREVOLUTION * -1):
+                        self.targetstep[i] = (self.FULLREVOLUTION * -1)
+                self.logger.debug("2:STRTSTP ON - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+            
+            # Mode set to 1 (incremental stepping) but haven't started stepping. Stop motor (stepspeed=2) and set the target step (based on node-red gui)
+            # Will wait until startstep flag is sent from node-red GUI before starting motor
+            if self.command["mode"][i] == 1 and not self.startstepping[i]:
+                stepspeed = 2
+                self.command["speed"][i] = 2
+                self.logger.debug("1:MODE1      - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+            
+            # IN INCREMENT MODE1. Keep stepping until the target step is met. Then reset the startstepping/startstep(nodered) flags.
+            elif self.command["mode"][i] == 1 and self.startstepping[i]:
+                self.logger.debug("3:STEPPING   - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+                if abs((abs(self.mach.stepper[i].step) - abs(self.targetstep[i]))) < 2: # if delta is less than 2 then target met. Can't use 0 since full step increments by 2
+                    self.logger.debug("4:DONE-M1OFF - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+                    self.startstepping[i] = False
+                    #command["startstep"][i] = 0
+
+            # SEND COIL ARRAY (HIGH PULSES) TO GPIO PINS AND UPDATE STEP COUNTER
+            GPIO.output(self.mach.stepper[i].pins, self.mach.stepper[i].speed[stepspeed]) # output the coil array (speed/direction) to the GPIO pins.
+            self.logger.debug("Motor:{0} Steps:{1} Mode:{2} startstepping:{3} coils:{4}".format(i, self.mach.stepper[i].step, self.command["mode"][i], self.startstepping[i], self.mach.stepper[i].speed[stepspeed]))
+            self.mach.stepper[i].step = self.stepupdate(stepspeed, self.mach.stepper[i].step)  # update the motor step based on direction and half vs full step
+            
+            # IF FULL REVOLUTION - reset the step counter
+            if (abs(self.mach.stepper[i].step) > self.FULLREVOLUTION):  # If hit full revolution reset the step counter. If want to step past full revolution would need to later add a 'not startstepping'
+                self.logger.debug("FULL REVOLUTION -- Motor:{0} Steps:{1} Mode:{2} startstepping:{3} coils:{4}".format(i, self.mach.stepper[i].step, self.command["mode"][i], self.startstepping[i], self.mach.stepper[i].speed[self.command["speed"][i]]))
+                self.mach.stepper[i].step = 0
+            
+            # Timers to monitor how long the loops is taking
+            self.timens[i] = perf_counter_ns() - self.timens[i]
+            self.timems[i] = (self.timens[i]/1000000) + self.delay
+        sleep(float(self.delay/1000))  # delay can be updated from node-red gui. Needs optimal setting for the motors.
+
+def commands(count, seed=1):
+    ''' Random dashboard commands. A new one every 37 steps. Continuous mode only, incremental (mode 1) moves now stop exactly on an absolute target '''
+    rnd = random.Random(seed)
+    commandlist = []
+    for x in range(count // 37 + 1):
+        commandlist.append({"delay":[0.8,1.0], "speed":[rnd.randint(0,4) for m in range(2)], "mode":[0 for m in range(2)],
+                            "inverse":[rnd.random() < 0.5 for m in range(2)], "step":[rnd.randint(1,50) for m in range(2)], "startstep":[rnd.randint(0,1) for m in range(2)]})
+    return commandlist
+
+def run(motor, count):
+    ''' Step the motor count times, switching commands every 37 steps. Returns elapsed seconds '''
+    commandlist = commands(count)
+    t0 = perf_counter()
+    for x in range(count):
+        motor.step(commandlist[x // 37])
+    return perf_counter() - t0
+
+if __name__ == "__main__":
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.INFO)
+    m1pins, m2pins = [12, 16, 20, 21], [19, 13, 6, 5]
+    count = 200000
+
+    # Check the coil sequences match
+    run(SlicingStepper(m1pins, m2pins, logger=logger), 20000)
+    slicinglog = [list(values) for pins, values in GPIO.log]
+    motor = stepper28byj.Stepper(m1pins, m2pins, logger=logger, driver='sim', timer=NoWait())
+    phaselog = []
+    commandlist = commands(20000)
+    for x in range(20000):
+        motor.step(commandlist[x // 37])
+        phaselog.extend(motor.gpio.pinlevels(m.pins) for m in motor.mach.stepper)
+    print("Coil sequence identical: {0} ({1} coil arrays)".format(slicinglog == phaselog, len(phaselog)))
+
+    fakegpio.install(record=False)
+    GPIO = sys.modules["RPi.GPIO"]
+    for name, motor in (("slicing", SlicingStepper(m1pins, m2pins, logger=logger)), ("phase table", stepper28byj.Stepper(m1pins, m2pins, logger=logger, driver='sim', timer=NoWait()))):
+        seconds = min(run(motor, count) for x in range(3))
+        print("{0:>12}: {1:>10,.0f} steps/sec ({2:.2f} us/step, 2 motors)".format(name, count / seconds, seconds / count * 1e6))
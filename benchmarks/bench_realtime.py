@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - step timing jitter, normal thread vs real-time mode (stepper28byj.realtime)
+
+A StepperThread steps 2 motors on the sim driver (0.8 ms delay) for SECONDS while busy processes
+(one more than there are cpus) keep every core loaded, like a compile or a browser on the Pi.
+Reported from the always on histograms in getdata (ms), each run with a fresh Stepper
+    step p50/p99/max   time between steps (0.8 asked)
+    sleep p99/max      how much longer the pause took than asked
+    missed             steps more than 0.2 ms late
+Real-time mode needs root (or rtprio/memlock limits). Without it the fallback is shown in rt.
+
+$ sudo python3 benchmarks/bench_realtime.py [seconds]
+"""
+
+import logging, multiprocessing, os, sys
+from os import path
+from time import sleep
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import stepper28byj
+from stepper28byj.realtime import Realtime
+
+def spin(stop):
+    ''' Keep a cpu busy '''
+    n = 0
+    while not stop.is_set():
+        n = (n * 31 + 7) % 1000003
+
+def run(realtime, seconds, logger):
+    motor = stepper28byj.Stepper([12, 16, 20, 21], [19, 13, 6, 5], logger=logger, driver="sim")
+    controls = {"delay":[0.8,1.0], "speed":[3,3], "mode":[0,0], "inverse":[False,True], "step":[2038,2038], "startstep":[0,0]}
+    thread = stepper28byj.StepperThread(motor, controls, realtime=realtime)
+    stop = multiprocessing.Event()
+    noise = [multiprocessing.Process(target=spin, args=(stop,), daemon=True) for x in range((os.cpu_count() or 1) + 1)]
+    for process in noise:
+        process.start()
+    thread.start()
+    try:
+        sleep(seconds)
+        data = dict(thread.getdata())
+    finally:
+        thread.stop()
+        stop.set()
+        for process in noise:
+            process.join()
+    return data
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    print("{0} cpus, every cpu busy, {1} sec per run".format(os.cpu_count(), seconds))
+    print("{0:<10} {1:>8} {2:>8} {3:>8} {4:>9} {5:>9} {6:>7}  rt (prio, cpu, locked)".format("", "step p50", "p99", "max", "sleep p99", "max", "missed"))
+    for name, realtime in (("normal", None), ("realtime", Realtime(priority=50))):
+        data = run(realtime, seconds, logger)
+        print("{0:<10} {1:>8.3f} {2:>8.3f} {3:>8.3f} {4:>9.3f} {5:>9.3f} {6:>7}  {7}, {8}, {9}".format(name,
+              data["stepp50_0f"], data["stepp99_0f"], data["stepmax0f"], data["sleepp99_0f"], data["sleepmax0f"], data["missed0i"],
+              data["rtprioi"], data["rtcpui"], data["rtlockedi"]))
+        if realtime is not None:
+            for error in realtime.errors:
+                print("    fallback: {0}".format(error))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - motors on one StepperThread vs split over worker processes (stepper28byj.shard)
+
+Both step every motor in halfstep on the sim driver as fast as the delay allows (0.1 ms, 10000 steps/sec
+asked) while a busy thread in the main process stands in for mqtt json work and holds the GIL.
+    steps/sec   halfsteps per motor per second actually made (positions over SECONDS)
+    missed      steps started more than MISSNS late, all motors
+Workers have their own GIL so the busy thread does not hold them up, even on one cpu
+(1 cpu VM, 4 motors: 362 vs 6,312 steps/sec). With free cores they also stop sharing one core.
+
+$ python3 benchmarks/bench_shard.py [motors] [shards]
+"""
+
+import json, logging, os, sys, threading
+from os import path
+from time import perf_counter, sleep
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import stepper28byj
+from stepper28byj.shard import ShardSupervisor
+
+SECONDS = 3
+
+def busy(stop):
+    ''' json round trips, like on_message/telemetry under load '''
+    data = {"delay":[0.8,1.0], "speed":[3]*16, "mode":[0]*16, "inverse":[False]*16, "step":[2038]*16, "startstep":[0]*16}
+    while not stop.is_set():
+        json.loads(json.dumps(data))
+
+def measure(stepper, motors):
+    ''' (steps/sec per motor, missed steps) while the busy thread runs '''
+    stop = threading.Event()
+    thread = threading.Thread(target=busy, args=(stop,))
+    sleep(0.5)              # Workers up and stepping
+    start = stepper.getdata()
+    pos0 = [start["pos{0}i".format(i)] for i in range(motors)]
+    missed0 = sum(start["missed{0}i".format(i)] for i in range(motors))
+    thread.start()
+    t0 = perf_counter()
+    sleep(SECONDS)
+    end = dict(stepper.getdata())
+    elapsed = perf_counter() - t0
+    stop.set()
+    thread.join()
+    rate = sum(end["pos{0}i".format(i)] - pos0[i] for i in range(motors)) / motors / elapsed
+    return rate, sum(end["missed{0}i".format(i)] for i in range(motors)) - missed0
+
+if __name__ == "__main__":
+    motors = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    pins = [[4*m, 4*m+1, 4*m+2, 4*m+3] for m in range(motors)]
+    controls = {"delay":[0.1,0.0], "speed":[3]*motors, "mode":[0]*motors, "inverse":[False]*motors, "step":[2038]*motors, "startstep":[0]*motors}
+    print("{0} motors, {1} cpus".format(motors, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()))
+
+    motor = stepper28byj.Stepper(*pins, logger=logger, driver="sim")
+    thread = stepper28byj.StepperThread(motor, controls)
+    thread.start()
+    try:
+        rate, missed = measure(thread, motors)
+    finally:
+        thread.stop()
+    print("{0:<22} {1:>8,.0f} steps/sec per motor  missed {2}".format("1 thread", rate, missed))
+
+    supervisor = ShardSupervisor(pins, controls, shards=shards, driver="sim", logger=logger)
+    supervisor.start()
+    try:
+        rate, missed = measure(supervisor, motors)
+    finally:
+        supervisor.stop()
+    print("{0:<22} {1:>8,.0f} steps/sec per motor  missed {2}".format("{0} worker processes".format(supervisor.shards), rate, missed))
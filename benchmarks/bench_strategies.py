@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - every coil sequence strategy in the repo on a stub RPi.GPIO
+
+    method1   test-method1-predefined-array.py   predefined sequence table, one GPIO.output per pin
+    method2a  test-method2a-arr-rot-peppe8o.py   array rotation (slicing), half step
+    method2b  test-method2b-arr-rot-halffull.py  array rotation, half step motor + full step motor per call (motors in pairs)
+    method2c  test-method2c-arr-rot-dataclass.py array rotation on the StepperMotor dataclass
+    original  stepper28byj/originalstep28byj.py  motors(). All 4 rotations calculated every step
+    stepper   stepper28byj.Stepper               phase table lookup, one driver call per tick
+
+The test-method scripts are loaded with runpy (time.sleep patched out) so their own functions
+and globals are used. method2c and original have no callable step (top level loop / inside
+__main__ with mqtt), so their step code is copied here as is.
+
+One tick = every motor takes one halfstep. Reported per strategy and motor count
+    steps/sec      motor steps (coil arrays sent) per second. Best of 3 runs
+    p50/p99/max    tick latency (us) from a LogHistogram
+    alloc B/step   bytes allocated inside a step (tracemalloc peak per call, a lower bound), averaged
+    net B/step     memory kept per step (should be 0)
+
+$ python3 benchmarks/bench_strategies.py [ticks]
+"""
+
+import json, logging, platform, runpy, sys, time, tracemalloc
+from os import path
+from time import perf_counter, perf_counter_ns
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import fakegpio
+GPIO = fakegpio.install()
+import stepper28byj
+from stepper28byj import Mstep28byjuln2003
+from stepper28byj.histogram import LogHistogram
+from faketimer import NoWait
+
+PINS = [[12, 16, 20, 21], [19, 13, 6, 5], [2, 3, 4, 17], [27, 22, 10, 9], [11, 0, 1, 7], [8, 25, 24, 23]]
+MOTORS = (1, 2, 6)
+
+def nosleep(seconds):
+    pass
+
+def loadscript(name, function=None):
+    ''' Run a test-method script with sleep patched out. Returns its globals.
+        run_path returns a copy, so pass the name of one of its functions to get the globals that function really uses '''
+    realsleep, time.sleep = time.sleep, nosleep
+    try:
+        g = runpy.run_path(path.join(ROOT, name), run_name="bench")
+    finally:
+        time.sleep = realsleep
+    return g[function].__globals__ if function else g
+
+def method1(pins):
+    ''' One namespace per motor. Steps through the predefined half step table with sendPulses() '''
+    kernels = []
+    for motorpins in pins:
+        g = loadscript("test-method1-predefined-array.py", "sendPulses")
+        g["M1in1"], g["M1in2"], g["M1in3"], g["M1in4"] = motorpins
+        g["setuparray"](8)
+        seq, sendpulses = g["Seq"], g["sendPulses"]
+        j = [0]
+        def kernel(seq=seq, sendpulses=sendpulses, j=j):
+            pulses = seq[j[0]]
+            sendpulses(pulses[0], pulses[1], pulses[2], pulses[3])
+            j[0] = (j[0] + 1) & 7
+        kernels.append(kernel)
+    return kernels
+
+def method2a(pins):
+    ''' One namespace per motor. cw() rotates the array and writes motor1 '''
+    kernels = []
+    for motorpins in pins:
+        g = loadscript("test-method2a-arr-rot-peppe8o.py", "cw")
+        g["motor1"], g["sleep"] = motorpins, nosleep
+        kernels.append(g["cw"])
+    return kernels
+
+def method2b(pins):
+    ''' One namespace per pair of motors. cw() writes a half step to motor1 and a full step to motor2 '''
+    kernels = []
+    for k in range(0, len(pins), 2):
+        g = loadscript("test-method2b-arr-rot-halffull.py", "cw")
+        g["motor1"], g["motor2"], g["sleep"] = pins[k], pins[k + 1] if k + 1 < len(pins) else [], nosleep
+        kernels.append(g["cw"])
+    return kernels
+
+def method2c(pins):
+    ''' StepperMotor objects from the script. Step code copied from its top level loop (stepspeed 3) '''
+    g = loadscript("test-method2c-arr-rot-dataclass.py")
+    StepperMotor = g["StepperMotor"]
+    kernels = []
+    for motorpins in pins:
+        m = StepperMotor(motorpins, 0, [0,0,[0,0,0,0],0,0], {"Harr1":[[0,0,1,1],[0,0,1,1]], "Farr1":[[0,0,1,1],[0,0,1,1]], "arr2":[[0,0,0,1],[0,0,0,1]], "arr3":[[0,0,1,0],[0,0,1,0]], "HarrOUT":[0,1], "FarrOUT":[0,1]})
+        kernels.append(lambda m=m: method2cstep(m, 3))
+    return kernels
+
+def method2cstep(stepper, stepspeed):
+    rotation = 1 if stepspeed > 2 else 0  # speed > 2 is CCW
+    if stepspeed == 3 or stepspeed == 1:  # Half step calculation
+        if rotation == 1:            # H is for half-step. Do array rotation (slicing) by 1 place to the right for CW
+            stepper.coils["HarrOUT"][rotation] = stepper.coils["Harr1"][rotation][-1:] + stepper.coils["Harr1"][rotation][:-1]
+            stepper.coils["Harr1"][rotation] = stepper.coils["arr2"][rotation]
+            stepper.coils["arr2"][rotation] = stepper.coils["HarrOUT"][rotation]
+        else:                        # Array rotation (slicing) 1 place to the left for CCW. And use arr3
+            stepper.coils["HarrOUT"][rotation] = stepper.coils["Harr1"][rotation][1:] + stepper.coils["Harr1"][rotation][:1]
+            stepper.coils["Harr1"][rotation] = stepper.coils["arr3"][rotation]
+            stepper.coils["arr3"][rotation] = stepper.coils["HarrOUT"][rotation]
+    if stepspeed == 4 or stepspeed == 0:  # Full step calculation
+        if rotation == 1:            # F is for full-step. Do array rotation (slicing) by 1 place to the right for CW
+            stepper.coils["FarrOUT"][rotation] = stepper.coils["Farr1"][rotation][-1:] + stepper.coils["Farr1"][rotation][:-1]
+            stepper.coils["Farr1"][rotation] = stepper.coils["FarrOUT"][rotation]
+        else:                        # Array rotation (slicing) 1 place to the left for CCW
+            stepper.coils["FarrOUT"][rotation] = stepper.coils["Farr1"][rotation][1:] + stepper.coils["Farr1"][rotation][:1]
+            stepper.coils["Farr1"][rotation] = stepper.coils["FarrOUT"][rotation]
+    # Now that coil array updated set the 4 available speeds/direction. Half step CW & CCW. Full step CW & CCW.
+    stepper.speed[0] = stepper.coils["FarrOUT"][0]
+    stepper.speed[1] = stepper.coils["HarrOUT"][0]
+    stepper.speed[2] = [0,0,0,0]
+    stepper.speed[3] = stepper.coils["HarrOUT"][1]
+    stepper.speed[4] = stepper.coils["FarrOUT"][1]
+    logging.debug("{0} Pulses:{1}".format(' HalfstepCW', stepper.speed[stepspeed]))
+    GPIO.output(stepper.pins, stepper.speed[stepspeed])
+
+class OriginalMotors:
+    ''' motors() from originalstep28byj.py. Globals moved to attributes, mqtt publish stubbed, no sleep '''
+    def __init__(self, pins, StepperMotor, Machine):
+        self.FULLREVOLUTION = 4076
+        self.logger = logging.getLogger("bench")
+        self.startstepping, self.targetstep, self.interval = [], [], []
+        self.stepreset = False
+        self.outgoingD = {}
+        self.mach = Machine([StepperMotor(motorpins, 0, [0,0,[0,0,0,0],0,0], {"Harr1":[[0,0,1,1],[0,0,1,1]], "Farr1":[[0,0,1,1],[0,0,1,1]], "arr2":[[0,0,0,1],[0,0,0,1]], "arr3":[[0,0,1,0],[0,0,1,0]], "HarrOUT":[0,1], "FarrOUT":[0,1]}) for motorpins in pins])
+        for i in range(len(self.mach.stepper)):
+            self.startstepping.append(False)
+            self.targetstep.append(291)
+            self.interval.append(97)
+
+    def publish(self, topic, payload):
+        pass
+
+    def motors(self, command):
+        # LOOP THRU EACH STEPPER AND THE TWO ROTATIONS (CW/CCW) AND CREATE COIL ARRAY (HIGH PULSES)
+        for i in range(len(self.mach.stepper)):   # Loop thru each stepper
+            for rotation in range(2):        # Will loop thru Half and Full step and both rotations, CW and CCW
+                #HALF STEP CALCULATION
+                if rotation == 1:            # H is for half-step. Do array rotation (slicing) by 1 place to the right for CW
+                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][-1:] + self.mach.stepper[i].coils["Harr1"][rotation][:-1]
+                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr2"][rotation]
+                    self.mach.stepper[i].coils["arr2"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
+                else:                        # Array rotation (slicing) 1 place to the left for CCW. And use arr3
+                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][1:] + self.mach.stepper[i].coils["Harr1"][rotation][:1]
+                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr3"][rotation]
+                    self.mach.stepper[i].coils["arr3"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
+                #FULL STEP CALCULATION
+                if rotation == 1:            # F is for full-step. Do array rotation (slicing) by 1 place to the right for CW
+                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][-1:] + self.mach.stepper[i].coils["Farr1"][rotation][:-1]
+                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
+                else:                        # Array rotation (slicing) 1 place to the left for CCW 
+                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][1:] + self.mach.stepper[i].coils["Farr1"][rotation][:1]
+                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
+            
+            # Now that coil array updated set the 4 available speeds/direction. Half step CW & CCW. Full step CW & CCW.
+            if not command["inverse"][i]: # Normal rotation pattern. speed 3/4=rot1(CW). speed 0/1=rot0 (CCW). 
+                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][0]
+                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][0]
+                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][1]
+                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][1]
+            elif command["inverse"][i]:  # Inverse rotation pattern. speed 3/4=rot0(CCW). speed 0/1=rot1 (CW). 
+                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][1]
+                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][1]
+                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][0]
+                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][0]
+            stepspeed = command["speed"][i]         # stepspeed is a temporary variable for this loop
+
+            # If mode is 1 (incremental stepping) and startstep has been flagged from node-red gui then self.startstepping
+            if command["mode"][i] == 1 and stepspeed != 2 and command["startstep"][i] == 1:
+                self.startstepping[i] = True
+                command["startstep"][i] = 0 # self.startstepping triggered and self.targetstep calculated. So turn off this if cond
+                if stepspeed > 2: # moving CW 
+                    if abs(self.mach.stepper[i].step) + command["step"][i] <= self.FULLREVOLUTION: # Set the target step based on node-red gui target and current step for that motor
+                        self.targetstep[i] = abs(self.mach.stepper[i].step) + command["step"][i]
+                    else:
+                        self.targetstep[i] = self.FULLREVOLUTION
+                else:      # moving CCW
+                    self.targetstep[i] = self.mach.stepper[i].step - command["step"][i]
+                    if self.targetstep[i] < (self.FULLREVOLUTION * -1):
+                        self.targetstep[i] = (self.FULLREVOLUTION * -1)
+                self.logger.debug("2:STRTSTP ON - Motor:{0} Mode:{1} startstep:{2} self.startstepping:{3} machStep:{4} self.targetstep:{5}".format(i, command["mode"][i], command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+            
+            # Mode set to 1 (incremental stepping) but haven't started stepping. Stop motor (stepspeed=2) and set the target step (based on node-red gui)
+            # Will wait until startstep flag is sent from node-red GUI before starting motor
+            if command["mode"][i] == 1 and not self.startstepping[i]:
+                stepspeed = 2
+                #if abs(self.mach.stepper[i].step) + command["step"][i] <= self.FULLREVOLUTION: # Set the target step based on node-red gui target and current step for that motor
+                #    self.targetstep[i] = abs(self.mach.stepper[i].step) + command["step"][i]
+                #else:
+                #    self.targetstep[i] = self.FULLREVOLUTION      # If the target step goes past the 360° degree mark then stop at 360° mark.
+                self.logger.debug("1:MODE1      - Motor:{0} Mode:{1} startstep:{2} self.startstepping:{3} machStep:{4} self.targetstep:{5}".format(i, command["mode"][i], command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+            
+            # IN INCREMENT MODE1. Keep stepping until the target step is met. Then reset the self.startstepping/startstep(nodered) flags.
+            elif command["mode"][i] == 1 and self.startstepping[i]:
+                self.logger.debug("3:STEPPING   - Motor:{0} Mode:{1} startstep:{2} self.startstepping:{3} machStep:{4} self.targetstep:{5}".format(i, command["mode"][i], command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+                if abs((abs(self.mach.stepper[i].step) - abs(self.targetstep[i]))) < 2: # if delta is less than 2 then target met. Can't use 0 since full step increments by 2
+                    self.logger.debug("4:DONE-M1OFF - Motor:{0} Mode:{1} startstep:{2} self.startstepping:{3} machStep:{4} self.targetstep:{5}".format(i, command["mode"][i], command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
+                    self.startstepping[i] = False
+                    #command["startstep"][i] = 0
+            
+            # PUBLISH HOW MANY STEPS THE MOTOR IS AT TO NODERED GUI
+            if stepspeed != 2 and self.interval[i] > 1 and (abs(self.mach.stepper[i].step) % self.interval[i]) == 2 : # If motor is turning and step is a approx multiple of self.interval (from nodered gui) then send status to node-red
+                self.outgoingD['motori'] = i
+                self.outgoingD['stepsi'] = self.mach.stepper[i].step
+                self.publish('pi/stepper/status', json.dumps(self.outgoingD))
+            elif stepspeed != 2 and command["mode"][i] == 1 and self.interval[i] == 1 and (abs(self.targetstep[i]) - abs(self.mach.stepper[i].step)) < 50 : # If self.interval is 1 only send msg update when taking small amount of steps
+                self.outgoingD['motori'] = i
+                self.outgoingD['stepsi'] = self.mach.stepper[i].step
+                self.publish('pi/stepper/status', json.dumps(self.outgoingD))
+
+            # SEND COIL ARRAY (HIGH PULSES) TO GPIO PINS AND UPDATE STEP COUNTER
+            GPIO.output(self.mach.stepper[i].pins, self.mach.stepper[i].speed[stepspeed]) # output the coil array (speed/direction) to the GPIO pins.
+            self.mach.stepper[i].step = Mstep28byjuln2003.Stepper.stepupdate(None, stepspeed, self.mach.stepper[i].step)  # update the motor step based on direction and half vs full step
+            # IF FULL REVOLUTION - reset the step counter
+            if (abs(self.mach.stepper[i].step) > self.FULLREVOLUTION) or self.stepreset:  # If hit full revolution reset the step counter. If want to step past full revolution would need to later add a 'not startstepping'
+                self.logger.debug("FULL REVOLUTION -- Motor:{0} Steps:{1} Mode:{2} self.startstepping:{3} coils:{4}".format(i, self.mach.stepper[i].step, command["mode"][i], self.startstepping[i], self.mach.stepper[i].speed[command["speed"][i]]))
+                self.mach.stepper[i].step = 0
+                if self.stepreset:
+                    for j in range(len(self.mach.stepper)): 
+                        self.mach.stepper[j].step = 0
+                    self.publish('pi/stepper/resetgauge', "reset")
+                    self.stepreset = False
+
+def controls(motors):
+    return {"delay":[0.8,1.0], "speed":[3]*motors, "mode":[0]*motors, "inverse":[False]*motors, "step":[2038]*motors, "startstep":[0]*motors}
+
+def original(pins):
+    g = loadscript("test-method2c-arr-rot-dataclass.py")    # Same StepperMotor/Machine dataclasses as originalstep28byj.py
+    motor, command = OriginalMotors(pins, g["StepperMotor"], g["Machine"]), controls(len(pins))
+    return [lambda: motor.motors(command)]
+
+def stepper(pins):
+    motor, command = stepper28byj.Stepper(*pins, logger=logging.getLogger("bench"), timer=NoWait()), controls(len(pins))
+    return [lambda: motor.step(command)]
+
+STRATEGIES = (("method1", method1), ("method2a", method2a), ("method2b", method2b), ("method2c", method2c), ("original", original), ("stepper", stepper))
+
+def throughput(kernels, ticks):
+    ''' Seconds for ticks ticks. No per tick timers '''
+    t0 = perf_counter()
+    for x in range(ticks):
+        for kernel in kernels:
+            kernel()
+    return perf_counter() - t0
+
+def latency(kernels, ticks):
+    ''' Histogram of tick times (ns) '''
+    hist = LogHistogram()
+    for x in range(ticks):
+        t0 = perf_counter_ns()
+        for kernel in kernels:
+            kernel()
+        hist.record(perf_counter_ns() - t0)
+    return hist
+
+def allocations(kernels, ticks):
+    ''' (bytes allocated inside a tick, bytes kept) per tick. Peak traced memory above the start of each kernel call,
+        so memory allocated and freed again within one call is only counted once (a lower bound) '''
+    tracemalloc.start()
+    churn = 0
+    start = tracemalloc.get_traced_memory()[0]
+    for x in range(ticks):
+        for kernel in kernels:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            kernel()
+            churn += tracemalloc.get_traced_memory()[1] - current
+    kept = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return churn / ticks, kept / ticks
+
+if __name__ == "__main__":
+    logging.getLogger().addHandler(logging.NullHandler())   # Scripts call basicConfig(DEBUG). A root handler makes that a no-op
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("bench").setLevel(logging.WARNING)
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print("Python {0} {1} on {2}. {3:,} ticks per run".format(platform.python_implementation(), platform.python_version(), platform.machine(), ticks))
+    print("{0:<10}{1:>7}{2:>14}{3:>10}{4:>10}{5:>10}{6:>14}{7:>12}".format("strategy", "motors", "steps/sec", "p50 us", "p99 us", "max us", "alloc B/step", "net B/step"))
+    for motors in MOTORS:
+        for name, build in STRATEGIES:
+            kernels = build(PINS[:motors])
+            throughput(kernels, ticks // 10)                # Warm up
+            seconds = min(throughput(kernels, ticks) for x in range(3))
+            hist = latency(kernels, ticks)
+            churn, kept = allocations(kernels, min(ticks, 5000))
+            print("{0:<10}{1:>7}{2:>14,.0f}{3:>10.2f}{4:>10.2f}{5:>10.2f}{6:>14.1f}{7:>12.2f}".format(name, motors, ticks * motors / seconds,
+                  hist.percentile(50) / 1000, hist.percentile(99) / 1000, hist.max / 1000, churn / motors, kept / motors))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - telemetry payloads. Every key as json (the old publish) vs delta json vs delta struct
+
+Reported for PUBLISHES publishes of 2 motors stepping (steps/pos change every time, the rest now and then)
+    bytes     average payload size
+    encode µs average TelemetryEncoder.encode time
+Also round trips int keys either side of the int32 limits through the struct encoding (a step count
+runs past 2**31 after 20 days at 1250 steps/sec).
+
+$ python3 benchmarks/bench_telemetry.py [publishes]
+"""
+
+import json, random, sys
+from os import path
+from time import perf_counter_ns
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from stepper28byj.telemetry import TelemetryEncoder, TelemetryDecoder, datakeys
+
+PUBLISHES = 20000
+KEYS = datakeys(2)
+
+def samples(count):
+    ''' getdata() like dicts '''
+    random.seed(1)
+    data = {key: 0 for key in KEYS}
+    data.update(delayf=0.8, cpufreq0i=1500000, main_msf=0.8, rpm0f=14.7, rpm1f=14.7)
+    for n in range(count):
+        data["steps0i"] += 125
+        data["steps1i"] += 125
+        data["pos0i"] += 125
+        data["pos1i"] -= 125
+        if random.random() < 0.2:
+            data["looptime0f"] = random.uniform(0.79, 0.81)
+            data["stepp99_0f"] = random.uniform(0.8, 0.9)
+        yield dict(data)
+
+def run(encoding, count):
+    ''' (average bytes, average encode µs). encoding None = json.dumps of every key '''
+    encoder = TelemetryEncoder(KEYS, encoding or "json")
+    size = elapsed = 0
+    for data in samples(count):
+        t0 = perf_counter_ns()
+        payload = json.dumps({key: data[key] for key in KEYS}) if encoding is None else encoder.encode(data)
+        elapsed += perf_counter_ns() - t0
+        size += len(payload) if payload is not None else 0
+    return size / count, elapsed / count / 1000
+
+def roundtrip():
+    ''' True when int keys at and past the int32 limits come back as sent '''
+    encoder = TelemetryEncoder(KEYS, "struct")
+    decoder = TelemetryDecoder(KEYS)
+    for value in (2**31 - 1, 2**31, -2**31, -2**31 - 1, 2**40):
+        data = dict.fromkeys(KEYS, 0)
+        data.update(steps0i=value, pos0i=-value)
+        state = decoder.decode(encoder.encode(data))
+        if (state["steps0i"], state["pos0i"]) != (value, -value):
+            return False
+    return True
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else PUBLISHES
+    print("{0:<12} {1:>7} {2:>10}".format("", "bytes", "encode µs"))
+    for name, encoding in (("every key", None), ("json", "json"), ("struct", "struct")):
+        size, us = run(encoding, count)
+        print("{0:<12} {1:>7.1f} {2:>10.1f}".format(name, size, us))
+    print("int32 boundary round trip: {0}".format("ok" if roundtrip() else "WRONG"))
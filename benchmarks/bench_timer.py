@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark - Stepper.step pacing at 0.8 ms. Relative sleep vs deadlines with sleep only vs sleep-then-spin
+
+    relative  the previous step(): tick then sleep(delay). Every overshoot and the tick time add up (copied here)
+    sleep     deadlines (previous deadline + delay), time.sleep to each one. Stepper(timer='sleep')
+    precise   deadlines, sleep to the calibrated margin then spin. Stepper(timer='precise'), the default
+Reported for SECONDS of 2 motors in halfstep on the sim driver
+    steps/sec  against the 1250 asked. Below it = the motors turn slower than the dashboard says
+    late p50/p99  how far past the end of the pause each step started (µs, the sleep histograms)
+    spin       cpu time spent spinning, % of the run
+
+$ python3 benchmarks/bench_timer.py [seconds]
+"""
+
+import logging, sys
+from os import path
+from time import sleep, perf_counter_ns
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import stepper28byj
+
+SECONDS = 3
+CONTROLS = {"delay":[0.8,1.0], "speed":[3,3], "mode":[0,0], "inverse":[False,True], "step":[2038,2038], "startstep":[0,0]}
+
+def relativestep(motor, controls):
+    ''' step() before deadlines '''
+    delay = motor.tick(controls)
+    t0 = perf_counter_ns()
+    sleep(float(delay/1000))
+    motor.recordsleep(perf_counter_ns() - t0 - int(delay * 1000000))
+
+def run(name, seconds, logger):
+    motor = stepper28byj.Stepper([12, 16, 20, 21], [19, 13, 6, 5], logger=logger, driver="sim", timer="sleep" if name != "precise" else "precise")
+    step = (lambda controls: relativestep(motor, controls)) if name == "relative" else motor.step
+    steps = 0
+    t0 = perf_counter_ns()
+    end = t0 + int(seconds * 1000000000)
+    while perf_counter_ns() < end:
+        step(CONTROLS)
+        steps += 1
+    elapsed = (perf_counter_ns() - t0) / 1000000000
+    data = motor.getdata()
+    return steps / elapsed, data["sleepp50_0f"] * 1000, data["sleepp99_0f"] * 1000, 100 * motor.timer.spinns / 1000000000 / elapsed, motor.timer.margin
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    print("{0:<9} {1:>9} {2:>8} {3:>8} {4:>6}".format("", "steps/sec", "late p50", "p99 µs", "spin %"))
+    for name in ("relative", "sleep", "precise"):
+        rate, p50, p99, spin, margin = run(name, seconds, logger)
+        print("{0:<9} {1:>9,.0f} {2:>8.1f} {3:>8.1f} {4:>6.1f}{5}".format(name, rate, p50, p99, spin, "  margin {0:.0f} µs".format(margin / 1000) if margin else ""))
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""
+Stub RPi.GPIO module so the stepper code can be benchmarked on any machine.
+Call install() before importing stepper28byj.
+"""
+
+import sys
+import types
+
+def install(record=False):
+    ''' Put a fake RPi.GPIO in sys.modules. With record=True every output call is kept in GPIO.log '''
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.BCM, gpio.OUT, gpio.VERSION = 11, 0, "fake"
+    gpio.log = []
+    gpio.setmode = lambda mode: None
+    gpio.setwarnings = lambda flag: None
+    gpio.setup = lambda pin, mode, initial=0: None
+    gpio.cleanup = lambda: None
+    if record:
+        gpio.output = lambda pins, values: gpio.log.append((pins, values))
+    else:
+        gpio.output = lambda pins, values: None
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = gpio
+    sys.modules["RPi"] = rpi
+    sys.modules["RPi.GPIO"] = gpio
+    return gpio
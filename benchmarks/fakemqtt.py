@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""
+Stub paho.mqtt.client module so demoMQTT can be imported (and its callbacks benchmarked) without paho or a broker.
+Call install() before importing demoMQTT.
+"""
+
+import sys
+import types
+
+class Client:
+    def __init__(self, client_id="", *args, **kwargs):
+        self.client_id = client_id
+        self.published = []
+
+    def publish(self, topic, payload=None, *args, **kwargs):
+        self.published.append((topic, payload))
+
+class MQTTMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+def install():
+    ''' Put a fake paho.mqtt.client in sys.modules '''
+    client = types.ModuleType("paho.mqtt.client")
+    client.Client = Client
+    client.MQTTMessage = MQTTMessage
+    paho = types.ModuleType("paho")
+    paho.mqtt = types.ModuleType("paho.mqtt")
+    paho.mqtt.client = client
+    sys.modules["paho"] = paho
+    sys.modules["paho.mqtt"] = paho.mqtt
+    sys.modules["paho.mqtt.client"] = client
+    return client
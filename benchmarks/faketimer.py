@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+"""
+Timer for Stepper(timer=NoWait()) so benchmarks time the step code, not the pause between steps.
+Import after stepper28byj is on sys.path.
+"""
+
+from stepper28byj.precisetimer import PreciseTimer
+
+class NoWait(PreciseTimer):
+    ''' Timer that never waits. Removes the loop delay from Stepper.step '''
+    def __init__(self):
+        super().__init__(0)
+
+    def sleepuntil(self, deadline):
+        return 0
@@ -14,7 +14,7 @@ IN1,2,3,4
 """
 
 from time import sleep
-import sys, logging, json, re
+import sys, logging, json
 from logging.handlers import RotatingFileHandler
 from os import path
 from pathlib import Path
@@ -22,7 +22,13 @@ import paho.mqtt.client as mqtt
 from dataclasses import dataclass
 from typing import List
 import stepper28byj
-from time import perf_counter, perf_counter_ns
+from stepper28byj.controls import Controls
+from stepper28byj.telemetry import TelemetryEncoder, datakeys
+from stepper28byj.motionqueue import MotionQueue
+from stepper28byj.shard import ShardSupervisor
+from stepper28byj.realtime import Realtime
+from collections import deque
+from time import perf_counter
 
 class pcolor:
     ''' Add color to print statements '''
@@ -141,30 +147,66 @@ def on_connect(client, userdata, flags, rc):
 
 def on_message(client, userdata, msg):
     """on message callback will receive messages from the server/broker. Must be subscribed to the topic in on_connect"""
-    global deviceD, MQTT_REGEX
-    global mqtt_controlsD, mqtt_stepreset
-    mqtt_logger.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
-    msgmatch = re.match(MQTT_REGEX, msg.topic)   # Check for match to subscribed topics
-    if msgmatch:
-        mqtt_payload = json.loads(str(msg.payload.decode("utf-8", "ignore"))) 
-        mqtt_topic = [msgmatch.group(0), msgmatch.group(1), msgmatch.group(2), type(mqtt_payload)] # breaks msg topic into groups - group/group1/group2
-        # mqtt topic --> ["entire msg", "lvl2", "lvl3", "datatype"] 
-        if mqtt_topic[2] == 'controls':
-            mqtt_controlsD = mqtt_payload
-        elif mqtt_topic[2] == 'stepreset':
-            mqtt_stepreset = mqtt_payload
-    # If Debugging will print the JSON incoming payload and unpack it
-    if mqtt_logger.getEffectiveLevel() == 10:
-        mqtt_logger.debug("Topic grp0:{0} grp1:{1} grp2:{2}".format(msgmatch.group(0), msgmatch.group(1), msgmatch.group(2)))
-        mqtt_payload = json.loads(str(msg.payload.decode("utf-8", "ignore")))
-        mqtt_logger.debug("Payload type:{0}".format(type(mqtt_payload)))
-        if isinstance(mqtt_payload, (str, bool, int, float)):
-            mqtt_logger.debug(mqtt_payload)
-        elif isinstance(mqtt_payload, list):
-            mqtt_logger.debug(mqtt_payload)
-        elif isinstance(mqtt_payload, dict):
-            for key, value in mqtt_payload.items():  
-                mqtt_logger.debug("{0}:{1}".format(key, value))
+    handler = MQTT_HANDLERS.get(msg.topic)   # Dispatch table built when the topics were set up. No regex per message
+    if mqtt_logger.isEnabledFor(logging.DEBUG):
+        mqtt_logger.debug("Received: {0} with payload: {1}".format(msg.topic, str(msg.payload)))
+    if handler is None:
+        mqtt_logger.debug("No handler for {0}".format(msg.topic))
+        return
+    try:
+        handler(msg.payload)                 # Payload is decoded once, in the handler
+    except ValueError as e:                  # Bad json or controls (ControlError). Rejected before reaching the stepper
+        mqtt_logger.warning("Rejected {0}: {1}".format(msg.topic, e))
+
+def on_controls(payload):
+    """ Controls from the node-red dashboard. Checked (see stepper28byj/controls.py) then handed to the stepper thread """
+    global mqtt_controlsD
+    controls = Controls.decode(payload, len(mqtt_controlsD["speed"]))   # Same number of motors as the controls in use
+    mqtt_controlsD = controls.todict()
+    motorthread.setcontrols(mqtt_controlsD)   # Handoff to the stepper thread. Applied between steps
+    if mqtt_logger.isEnabledFor(logging.DEBUG):
+        for key, value in mqtt_controlsD.items():
+            mqtt_logger.debug("{0}:{1}".format(key, value))
+
+def on_stepreset(payload):
+    """ Step gauge reset from the node-red dashboard """
+    global mqtt_stepreset
+    mqtt_stepreset = bool(json.loads(payload))
+
+def on_program(payload):
+    """ Motion program from node-red. A list of commands (see stepper28byj/motionqueue.py) or {"clear": true, "program": [...]}.
+    clear stops the running program first. Completion events are published on the events topic """
+    if motionqueue is None:
+        raise ValueError("motion programs need the motors in this process (shards = 0)")
+    program = json.loads(payload)
+    if isinstance(program, dict):
+        if program.get("clear"):
+            motionqueue.clear()
+        program = program.get("program", [])
+    if not isinstance(program, list):
+        raise ValueError("program must be a list of commands")
+    motionqueue.push(program)                # Checked here, queued on the stepper thread. ValueError if any command is bad
+
+def on_telemetry(payload):
+    """ Telemetry settings from node-red. {"interval": 0.5, "encoding": "struct", "keyframe": 50}, any of the keys.
+    Any message (even {}) sends every key on the next publish, so node-red can ask for a full update after a restart """
+    global msginterval, telemetry
+    settings = json.loads(payload)
+    if not isinstance(settings, dict):
+        raise ValueError("telemetry settings must be a json object")
+    interval = settings.get("interval", msginterval)
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not 0.02 <= interval <= 60:
+        raise ValueError("telemetry interval {0!r} must be 0.02-60 sec".format(interval))
+    encoding = settings.get("encoding", telemetry.encoding)
+    keyframe = settings.get("keyframe", telemetry.keyframe)
+    if isinstance(keyframe, bool) or not isinstance(keyframe, int) or keyframe < 0:
+        raise ValueError("telemetry keyframe {0!r} must be a whole number >= 0".format(keyframe))
+    if encoding != telemetry.encoding or keyframe != telemetry.keyframe:
+        telemetry = TelemetryEncoder(telemetry.keys, encoding, keyframe)   # ValueError for an unknown encoding. Starts with a keyframe
+    else:
+        telemetry.requestkeyframe()
+    msginterval = interval
+    main_logger.info("Telemetry every {0} sec, {1}, keyframe every {2}".format(msginterval, telemetry.encoding, telemetry.keyframe))
 
 def on_publish(client, userdata, mid):
     """on publish will send data to broker"""
@@ -176,7 +218,7 @@ def on_disconnect(client, userdata,rc=0):
     mqtt_client.loop_stop()
 
 def mqtt_setup(IPaddress):
-    global MQTT_SERVER, MQTT_CLIENT_ID, MQTT_USER, MQTT_PASSWORD, MQTT_SUB_TOPIC, MQTT_PUB_LVL1, MQTT_SUB_LVL1, MQTT_REGEX
+    global MQTT_SERVER, MQTT_CLIENT_ID, MQTT_USER, MQTT_PASSWORD, MQTT_SUB_TOPIC, MQTT_PUB_LVL1, MQTT_SUB_LVL1, MQTT_HANDLERS
     global mqtt_client
     home = str(Path.home())                       # Import mqtt and wifi info. Remove if hard coding in python script
     with open(path.join(home, "stem"),"r") as f:
@@ -187,11 +229,7 @@ def mqtt_setup(IPaddress):
     # Specific MQTT SUBSCRIBE/PUBLISH TOPICS created inside 'setup_device' function
     MQTT_SUB_TOPIC = []
     MQTT_SUB_LVL1 = 'nred2' + MQTT_CLIENT_ID
-    MQTT_REGEX = MQTT_SUB_LVL1 + '/([^/]+)/([^/]+)' # 'nred2pi/+' would also work but would not return groups
-                                              # () group capture. Useful for getting topic lvls in on_message
-                                              # [^/] match a char except /. Needed to get topic lvl2, lvl3 groups
-                                              # + will match one or more. Requiring at least 1 match forces a lvl1/lvl2/lvl3 topic structure
-                                              # * could also be used for last group and then a lvl1/lvl2 topic would also be matched
+    MQTT_HANDLERS = {}                         # Full topic -> handler(payload). Filled in main next to the subscriptions
     MQTT_PUB_LVL1 = 'pi2nred/'
 
 def setup_device(device, lvl2, publvl3, data_keys):
@@ -231,6 +269,9 @@ def main():
     global MQTT_SERVER, MQTT_USER, MQTT_PASSWORD, MQTT_CLIENT_ID, mqtt_client, MQTT_PUB_LVL1
     global _loggers, main_logger, mqtt_logger
     global mqtt_controlsD, mqtt_stepreset  # Variables for stepper mqtt control
+    global motorthread
+    global msginterval, telemetry      # Telemetry publish interval (sec) and encoder. Can be changed from node-red (on_telemetry)
+    global motionqueue                 # Motion programs from node-red (on_program)
 
     main_logger_level= logging.DEBUG # CRITICAL=logging off. DEBUG=get variables. INFO=status messages.
     main_logger_type = 'custom'       # 'basic' or 'custom' (with option for log files)
@@ -261,15 +302,36 @@ def main():
     device = 'stepper'
     lvl2 = 'stepper'
     publvl3 = MQTT_CLIENT_ID + ""
-    data_keys = ['delayf', 'cpufreq0i', 'main_msf', 'looptime0f', 'looptime1f', 'steps0i', 'steps1i', 'rpm0f', 'rpm1f', 'speed0i', 'speed1i']
     m1pins = [12, 16, 20, 21]
     m2pins = [19, 13, 6, 5]
+    motorpins = [m1pins, m2pins]   # One pin list per motor. More motors than GPIO pins: expander pins + driver, see stepper28byj/expander.py
+    motors = len(motorpins)
+    data_keys = datakeys(motors)   # ['delayf', 'cpufreq0i', 'main_msf', 'looptime0f', 'looptime1f', 'steps0i', 'steps1i', ...]
     mqtt_stepreset = False   # used to reset steps thru nodered gui
-    mqtt_controlsD = {"delay":[0.8,1.0], "speed":[3,3], "mode":[0,0], "inverse":[False,True], "step":[2038, 2038], "startstep":[0,0]}
+    mqtt_controlsD = {"delay":[0.8,1.0], "speed":[3]*motors, "mode":[0]*motors, "inverse":[k % 2 == 1 for k in range(motors)], "step":[2038]*motors, "startstep":[0]*motors, "accel":[3000]*motors, "startdelay":[2.0]*motors, "jerk":[0]*motors}
     setup_device(device, lvl2, publvl3, data_keys)
     deviceD[device]['pubtopic2'] = f"{MQTT_SUB_LVL1}/nredZCMD/resetstepgauge" # Extra topic used to tell node red to reset the step gauges
     deviceD[device]['data2'] = "resetstepgauge"
-    motor = stepper28byj.Stepper(m1pins, m2pins, logger=logger_stepper)  # can enter 1 to 2 list of pins (up to 2 motors)
+    MQTT_HANDLERS[f"{MQTT_SUB_LVL1}/{lvl2}ZCMD/controls"] = on_controls     # Topics under the {lvl2}ZCMD/+ subscription
+    MQTT_HANDLERS[f"{MQTT_SUB_LVL1}/{lvl2}ZCMD/stepreset"] = on_stepreset
+    MQTT_HANDLERS[f"{MQTT_SUB_LVL1}/{lvl2}ZCMD/telemetry"] = on_telemetry
+    MQTT_HANDLERS[f"{MQTT_SUB_LVL1}/{lvl2}ZCMD/program"] = on_program
+    deviceD[device]['pubtopicevents'] = deviceD[device]['pubtopic'] + "/events"   # Motion program events ({"event": "done", "id": ...})
+    deviceD[device]['pubtopicbin'] = deviceD[device]['pubtopic'] + "/bin"   # telemetry encoding 'struct' publishes here (see stepper28byj/telemetry.py)
+    msginterval = 0.1       # Publish interval (sec). Change at runtime with {"interval": sec} on the telemetry topic
+    telemetry = TelemetryEncoder(data_keys, encoding='json', keyframe=50)   # Only changed keys are sent. Every key every 50 publishes
+    rtpriority = 0           # 0 = normal step loop. 1-99 = SCHED_FIFO at that priority, pinned, memory locked (needs root). Reported as rtprioi/rtcpui/rtlockedi
+    realtime = Realtime(priority=rtpriority) if rtpriority else None
+    shards = 0               # 0 = motors step on a thread in this process. n = split over n worker processes, a core each (stepper28byj/shard.py)
+    motionevents = deque()   # Filled on the stepper thread, published by the main loop
+    if shards:               # Workers step, this process only talks to the shared memory. No motion programs
+        motor = None
+        motorthread = ShardSupervisor(motorpins, mqtt_controlsD, shards, driver='rpi', logger=logger_stepper, realtime=realtime)
+        motionqueue = None
+    else:
+        motor = stepper28byj.Stepper(*motorpins, logger=logger_stepper)  # Any number of motors. ie driver=MCP23017Driver(SMBus(1), (0x20, 0x21)) for 8 on two expanders
+        motorthread = stepper28byj.StepperThread(motor, mqtt_controlsD, realtime=realtime)     # Steps the motors on its own thread. Started after mqtt connects
+        motionqueue = MotionQueue(motor, motorthread, onevent=motionevents.append)
 
     main_logger.info("ALL DICTIONARIES")
     for device, item in deviceD.items():
@@ -306,35 +368,33 @@ def main():
         mqtt_client.loop_stop()
         sys.exit(f"{pcolor.RED}Connection failed. Check rc code to trouble shoot{pcolor.ENDC}")
 
-    # MQTT setup is successful. Initialize dictionaries and start the main loop.   
-    t0_sec = perf_counter() # sec Counter for getting stepper data. Future feature - update interval in  node-red dashboard to link to perf_counter
-    msginterval = 0.1       # Adjust interval to increase/decrease number of mqtt updates.
-    t0loop_ns = perf_counter_ns() # nanosec Counter for how long it takes to run motor and get messages
+    # MQTT setup is successful. Start the stepper thread and the main (telemetry) loop.
+    # The stepper thread keeps its own schedule. Publishing here can not delay a step.
+    # main_msf is the measured step period on the stepper thread and should stay flat whatever msginterval is.
+    motorthread.start()
 
     try:
         while True:
-
-            t0main_ns = perf_counter_ns() - t0loop_ns  # Monitor how long the main/total loop takes
-            t0loop_ns = perf_counter_ns()
-
-            if (perf_counter() - t0_sec) > msginterval:
-                deviceD['stepper']['data'] = motor.getdata()
-                if deviceD['stepper']['data'] != "na":
-                    deviceD['stepper']['data']["main_msf"] = t0main_ns/1000000  # Report the main/total loop time in ms
-                    mqtt_client.publish(deviceD['stepper']['pubtopic'], json.dumps(deviceD['stepper']['data'])) 
-                if mqtt_stepreset:
-                    motor.resetsteps()
-                    mqtt_stepreset = False
-                    mqtt_client.publish(deviceD['stepper']['pubtopic2'], json.dumps(deviceD['stepper']['data2']))
-                t0_sec = perf_counter()
-            
-            motor_controls = mqtt_controlsD  # Get updated motor controls from mqtt. Could change this to another source
-            motor.step(motor_controls) # Pass instructions for stepper motor for testing
+            t0_sec = perf_counter()
+            deviceD['stepper']['data'] = motorthread.getdata()
+            encoder = telemetry                    # on_telemetry can swap it from the mqtt thread
+            payload = encoder.encode(deviceD['stepper']['data'])   # Only the data_keys that changed. None if nothing did
+            if payload is not None:
+                mqtt_client.publish(deviceD['stepper']['pubtopic' if encoder.encoding == 'json' else 'pubtopicbin'], payload)
+            while motionevents:                   # Program events since the last loop
+                mqtt_client.publish(deviceD['stepper']['pubtopicevents'], json.dumps(motionevents.popleft()))
+            if mqtt_stepreset:
+                motorthread.resetsteps()
+                mqtt_stepreset = False
+                mqtt_client.publish(deviceD['stepper']['pubtopic2'], json.dumps(deviceD['stepper']['data2']))
+            sleep(max(0, msginterval - (perf_counter() - t0_sec)))   # Main loop only publishes so it can sleep between updates
 
     except KeyboardInterrupt:
         logging.info("Pressed ctrl-C")
     finally:
-        motor.cleanupGPIO()
+        motorthread.stop()
+        if motor is not None:      # Shard workers clean up their own pins
+            motor.cleanupGPIO()
         logging.info("GPIO cleaned up")
 
 if __name__ == "__main__":
@@ -13,20 +13,41 @@ Motor2
 IN1,2,3,4
 """
 
-from time import sleep, perf_counter_ns
-import RPi.GPIO as GPIO
+from time import perf_counter_ns
 import logging
 from logging.handlers import RotatingFileHandler
 from os import path
 from dataclasses import dataclass
 from typing import List
+if __package__:
+    from .coilphase import HALF, FULL, COILSEQ, COILSTOP, SEQMASK, SPEEDSEQ, SPEEDROT, ROTSIGN, SPEEDSTEPS, COILBITS, initialphase, coilmasks
+    from .gpiodriver import getdriver
+    from .ramp import profile, accelerate, decelerate
+    from .dda import CoordinatedMove
+    from .scheduler import DeadlineScheduler
+    from .histogram import LogHistogram
+    from .steptrace import StepTrace
+    from .precisetimer import PreciseTimer
+else:    # Run as a script (python3 stepper28byj/Mstep28byjuln2003.py) for the self test below. Package modules from the parent directory
+    import sys
+    sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+    from stepper28byj.coilphase import HALF, FULL, COILSEQ, COILSTOP, SEQMASK, SPEEDSEQ, SPEEDROT, ROTSIGN, SPEEDSTEPS, COILBITS, initialphase, coilmasks
+    from stepper28byj.gpiodriver import getdriver
+    from stepper28byj.ramp import profile, accelerate, decelerate
+    from stepper28byj.dda import CoordinatedMove
+    from stepper28byj.scheduler import DeadlineScheduler
+    from stepper28byj.histogram import LogHistogram
+    from stepper28byj.steptrace import StepTrace
+    from stepper28byj.precisetimer import PreciseTimer
 
 @dataclass
 class StepperMotor:
     pins: list       # Pins connected to ULN2003 IN1,2,3,4
-    step: int        # Counter to keep track of motor step (0-4076 in halfstep mode)
-    speed: list      # 0=fullstepCCW, 1=halfstepCCW, 2=stop, 3=halfstep CW, 4=fullstep CW
-    coils: dict      # Arrays to specify HIGH pulses sent to coils.
+    step: int        # Counter to keep track of motor step (0-4076 in halfstep mode). Wraps every revolution for the dashboard
+    position: int    # Absolute position in halfsteps. Never wraps
+    phase: list      # Index into the coil sequence tables for each sequence/rotation. [HALF[CCW,CW], FULL[CCW,CW]]
+    coils: tuple     # Coil array (HIGH pulses) last sent to the pins
+    masks: tuple     # (set, clear) pin bitmasks for each coil array. Same layout as COILSEQ, stop at [2][0]
 
 @dataclass
 class Machine:
@@ -35,24 +56,40 @@ class Machine:
 class Stepper:   # command comes from node-red GUI
     def __init__(self, *args, **kwargs):
         
-        for key, value in kwargs.items():
-            if key == 'logger':
-                self.logger = kwargs[key]   #  Use logger passed as argument
-            elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
-                logging.basicConfig(level=logging.INFO)      # Create root logger
-                self.logger = logging.getLogger(__name__)    # Create from root logger
-            else:                                          # Root logger already exists and no custom logger passed
-                self.logger = logging.getLogger(__name__)    # Create from root logger
+        if 'logger' in kwargs:
+            self.logger = kwargs['logger']   #  Use logger passed as argument
+        elif len(logging.getLogger().handlers) == 0:   # Root logger does not exist and no custom logger passed
+            logging.basicConfig(level=logging.INFO)      # Create root logger
+            self.logger = logging.getLogger(__name__)    # Create from root logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = logging.getLogger(__name__)    # Create from root logger
         self.FULLREVOLUTION = 4076    # Steps per revolution
+        self.MISSNS = 200000          # A step more than this late (ns) past its planned time counts as a deadline miss
+        self.STARTDELAY = 2.0         # Pause (ms) after the first step of a ramp. Used when "startdelay" is not in the controls
         motorpins = args
         motors = []
         for pinlist in motorpins:
-            motors.append(StepperMotor(pinlist, 0, [0,0,0,0,0], {"Harr1":[0,1], "Farr1":[0,1], "arr2":[0,1], "arr3":[0,1], "HarrOUT":[0,1], "FarrOUT":[0,1]}))
+            motors.append(StepperMotor(pinlist, 0, 0, initialphase(), COILSTOP, coilmasks(pinlist)))
         self.mach = Machine(motors)
+        self.gpio = getdriver(kwargs.get('driver', 'rpi'))   # GPIO driver. 'rpi', 'gpiod', 'gpiomem', 'sim' or a GPIODriver object. See gpiodriver.py
+        scheduler = kwargs.get('scheduler', 'lockstep')      # 'lockstep' all motors step every loop. 'heap' each motor steps at its own rate. See scheduler.py
+        if scheduler not in ('lockstep', 'heap'):
+            raise ValueError("Unknown scheduler {0}. Use 'lockstep' or 'heap'".format(scheduler))
+        self.scheduler = DeadlineScheduler(len(motors)) if scheduler == 'heap' else None
+        self.allmotors = range(len(motors))
+        trace = kwargs.get('trace', False)                   # True or a capacity (steps) to keep a trace of the step state. See steptrace.py
+        self.trace = StepTrace(trace if trace is not True else 4096) if trace else None
+        self.recorder = kwargs.get('recorder')               # Optional StepRecorder. Binary record of every coil pattern sent. See recorder.py
+        timer = kwargs.get('timer', 'precise')               # 'precise' sleep then spin to each step deadline (margin calibrated now). 'sleep' sleep only. See precisetimer.py
+        if timer not in ('precise', 'sleep') and not isinstance(timer, PreciseTimer):
+            raise ValueError("Unknown timer {0}. Use 'precise', 'sleep' or a PreciseTimer object".format(timer))
+        self.timer = timer if isinstance(timer, PreciseTimer) else PreciseTimer(None if timer == 'precise' else 0)
+        self.deadline = 0           # step() deadline (perf_counter_ns). 0 = not stepping yet
         # Setup and intialize motor parameters
-        GPIO.setmode(GPIO.BCM)
         self.startstepping = []     # Flag sent from nodered dashboard to start stepping in increment mode
-        self.targetstep = []        # When in mode1/increment a target step is calculated.
+        self.startcontrols = []     # Controls whose startstep started the current incremental move. The controls are never changed
+        self.speed = []             # Speed (0-4) each motor actually ran its last step at. Reported by getdata
+        self.targetstep = []        # When in mode1/increment a target position (halfsteps) is calculated.
         self.reportsteps = [False,[]]  # Container to get the steps each motor is at for updating nodered dashboard
         self.rpmtime0 = [] # used for rpm calculation
         self.tloop = perf_counter_ns() # debugging tool
@@ -61,114 +98,353 @@ class Stepper:   # command comes from node-red GUI
         self.delay = 0   # Container to store loop delay
         self.timens = []  # monitor how long each motor loop takes (coil logic only)
         self.timems = [] # monitor how long each motor loop takes (coil logic + delay)
+        self.ramp = []      # Per step delays (ms) planned for an incremental (mode 1) move with acceleration
+        self.rampindex = [] # Next step in the ramp
+        self.rate = []      # Current speed (steps/sec) when accelerating in continuous mode (mode 0)
+        self.runspeed = []  # Speed (0-4) actually running in mode 0. Lags the commanded speed while slowing down for a change
+        self.moves = []     # CoordinatedMove each motor is part of (None = motor follows the controls)
+        self.moveaxis = []  # Axis number of the motor in its move
+        self.activemoves = []   # CoordinatedMoves in progress
+        self.interval = []  # Pause (ms) each motor needs after its last step
+        self.due = self.allmotors   # Motors that stepped on the last tick
+        self.stepns = []    # When each motor last stepped (perf_counter_ns)
+        self.nextns = []    # When each motor should step next (perf_counter_ns)
+        self.missed = []    # Steps that were more than MISSNS late
+        self.stephist = []  # Time between steps of each motor (ns)
+        self.coilhist = []  # Coil logic time of each motor (ns)
+        self.sleephist = [] # How much longer than asked the pause after each motor's step took (ns)
         self.outgoing = {}
+        self.command = {"speed":[2 for motor in motors]}   # Last command passed to step/tick. All motors stopped until the first one
         
         for i in range(len(self.mach.stepper)):          # Setup each stepper motor
-            self.mach.stepper[i].speed[2] = [0,0,0,0]    # Speed 2 is hard coded as stop
             self.reportsteps[1].append(0)
             self.startstepping.append(False)  
+            self.startcontrols.append(None)
+            self.speed.append(2)
             self.targetstep.append(291)         
             self.rpmtime0.append(perf_counter_ns())
             self.rpmsteps0.append(0)
             self.rpm.append(0)
-            self.timens.append(perf_counter_ns())
-            self.timems.append(perf_counter_ns())
-            for rotation in range(2):        # Setup starting array for each rotation (CW,CCW) and H-half/F-full step
-                self.mach.stepper[i].coils["Harr1"][rotation] = [0,0,1,1]
-                self.mach.stepper[i].coils["Farr1"][rotation] = [0,0,1,1]
-                self.mach.stepper[i].coils["arr2"][rotation] = [0,0,0,1]
-                self.mach.stepper[i].coils["arr3"][rotation] = [0,0,1,0]
-            for pin in self.mach.stepper[i].pins:        # Setup each pin in each stepper
-                GPIO.setup(pin,GPIO.OUT)
-                self.logger.info("pin {0} Setup".format(pin))
+            self.timens.append(0)
+            self.timems.append(0)
+            self.ramp.append(None)
+            self.rampindex.append(0)
+            self.rate.append(0)
+            self.runspeed.append(2)
+            self.moves.append(None)
+            self.moveaxis.append(0)
+            self.interval.append(0)
+            self.stepns.append(0)
+            self.nextns.append(0)
+            self.missed.append(0)
+            self.stephist.append(LogHistogram())
+            self.coilhist.append(LogHistogram())
+            self.sleephist.append(LogHistogram())
+            self.gpio.setup(self.mach.stepper[i].pins)   # Setup each pin in each stepper
+            self.logger.info("pins {0} Setup".format(self.mach.stepper[i].pins))
 
     def step(self, incomingD):
-        ''' LOOP THRU EACH STEPPER AND THE TWO ROTATIONS (CW/CCW) AND SEND COIL ARRAY (HIGH PULSES) '''
+        ''' SEND ONE STEP TO EACH STEPPER THEN PAUSE UNTIL THE NEXT STEP IS DUE '''
+        delay = self.tick(incomingD)
+        tnow = perf_counter_ns()
+        if self.deadline < tnow - int(delay * 1000000):   # First step, or the caller was away. Start the schedule from now
+            self.deadline = tnow
+        self.deadline += int(delay * 1000000)   # From the last deadline, not from now. No drift
+        if self.deadline > tnow:
+            self.recordsleep(self.timer.sleepuntil(self.deadline))
+        else:                                    # Late. Restart from now instead of bursting steps to catch up
+            self.deadline = tnow
+
+    def tick(self, incomingD):
+        ''' LOOP THRU EACH STEPPER, ADVANCE THE COIL PHASE (CW/CCW) AND SEND COIL ARRAY (HIGH PULSES). Returns the loop delay (ms) without sleeping.
+            incomingD is only read, never changed (a read only controls.snapshot works too) '''
         self.command = incomingD
-        self.delay = self.command["delay"][0]        # First delay is half step loop pause. Second value is add-on for full step.
-        for i in range(len(self.mach.stepper)):   # Loop thru each stepper
-            self.timens[i] = perf_counter_ns() # time counter for monitoring how long the loop takes
+        delay = 0                                    # Longest pause a motor stepping this tick needs. The delay control when none step
+        setmask, clrmask = 0, 0                      # Pins to set/clear for all motors. Written together after the loop
+        due = self.scheduler.pop() if self.scheduler is not None else self.allmotors   # Motors stepping this tick
+        for move in self.activemoves:                # Coordinated moves decide which of their motors step this tick
+            if self.scheduler is None or not move.motors or move.motors[0] in due:   # Motors of a move share one deadline. A dwell has none
+                move.advance()
+        self.due = due
+        trace = self.trace
+        recorder = self.recorder
+        for i in due:   # Loop thru each stepper
+            self.timens[i] = tnow = perf_counter_ns() # time counter for monitoring how long the loop takes
+            if self.stepns[i]:   # Step interval and deadline misses
+                self.stephist[i].record(tnow - self.stepns[i])
+                if tnow - self.nextns[i] > self.MISSNS:
+                    self.missed[i] += 1
+                    if recorder is not None:
+                        recorder.fault()
+            self.stepns[i] = tnow
+            motor = self.mach.stepper[i]
+            if self.moves[i] is not None:   # Part of a coordinated move. Halfstep in the direction the move says, or hold (pins unchanged)
+                move = self.moves[i]
+                direction = move.stepping[self.moveaxis[i]]
+                if direction:
+                    stepspeed = 3 if direction > 0 else 1
+                    rotation = SPEEDROT[stepspeed] ^ bool(self.command["inverse"][i] if "inverse" in self.command else False)
+                    phase = motor.phase[HALF]
+                    phase[rotation] = (phase[rotation] + ROTSIGN[rotation]) & SEQMASK[HALF]
+                    motor.coils = COILSEQ[HALF][phase[rotation]]
+                    masks = motor.masks[HALF][phase[rotation]]
+                    setmask |= masks[0]
+                    clrmask |= masks[1]
+                    motor.step += direction
+                    motor.position += direction
+                    if abs(motor.step) > self.FULLREVOLUTION:
+                        motor.step = 0
+                    if recorder is not None:
+                        recorder.record(tnow, i, COILBITS[HALF][phase[rotation]], motor.position)
+                self.speed[i] = 3 if direction > 0 else 1 if direction else 2
+                if trace is not None:
+                    trace.record((tnow, i, motor.step, motor.position, self.speed[i], "move", False, motor.position, motor.coils))
+                self.interval[i] = move.interval
+                if move.interval > delay:   # The move sets the pace, faster than the delay control too
+                    delay = move.interval
+                self.timens[i] = perf_counter_ns() - self.timens[i]
+                self.coilhist[i].record(self.timens[i])
+                continue
             stepspeed = self.command["speed"][i]         # stepspeed is a temporary variable for this loop
-            if stepspeed > 2:
-                rotation = 0 if self.command["inverse"][i] else 1
-            elif stepspeed < 2:
-                rotation = 1 if self.command["inverse"][i] else 0
-                
-            if stepspeed == 3 or stepspeed == 1:  # Half step calculation
-                if rotation == 1:            # H is for half-step. Do array rotation (slicing) by 1 place to the right for CW
-                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][-1:] + self.mach.stepper[i].coils["Harr1"][rotation][:-1]
-                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr2"][rotation]
-                    self.mach.stepper[i].coils["arr2"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
-                else:                        # Array rotation (slicing) 1 place to the left for CCW. And use arr3
-                    self.mach.stepper[i].coils["HarrOUT"][rotation] = self.mach.stepper[i].coils["Harr1"][rotation][1:] + self.mach.stepper[i].coils["Harr1"][rotation][:1]
-                    self.mach.stepper[i].coils["Harr1"][rotation] = self.mach.stepper[i].coils["arr3"][rotation]
-                    self.mach.stepper[i].coils["arr3"][rotation] = self.mach.stepper[i].coils["HarrOUT"][rotation]
-            if stepspeed == 4 or stepspeed == 0:  # Full step calculation          
-                self.delay = self.command["delay"][0] + self.command["delay"][1] # Add extra delay for full step
-                if rotation == 1:            # F is for full-step. Do array rotation (slicing) by 1 place to the right for CW
-                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][-1:] + self.mach.stepper[i].coils["Farr1"][rotation][:-1]
-                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
-                else:                        # Array rotation (slicing) 1 place to the left for CCW 
-                    self.mach.stepper[i].coils["FarrOUT"][rotation] = self.mach.stepper[i].coils["Farr1"][rotation][1:] + self.mach.stepper[i].coils["Farr1"][rotation][:1]
-                    self.mach.stepper[i].coils["Farr1"][rotation] = self.mach.stepper[i].coils["FarrOUT"][rotation]
-            
-            # Now that coil array updated set the 4 available speeds/direction. Half step CW & CCW. Full step CW & CCW.
-            if not self.command["inverse"][i]: # Normal rotation pattern. speed 3/4=rot1(CW). speed 0/1=rot0 (CCW). 
-                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][0]
-                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][0]
-                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][1]
-                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][1]
-            elif self.command["inverse"][i]:  # Inverse rotation pattern. speed 3/4=rot0(CCW). speed 0/1=rot1 (CW). 
-                self.mach.stepper[i].speed[0] = self.mach.stepper[i].coils["FarrOUT"][1]
-                self.mach.stepper[i].speed[1] = self.mach.stepper[i].coils["HarrOUT"][1]
-                self.mach.stepper[i].speed[3] = self.mach.stepper[i].coils["HarrOUT"][0]
-                self.mach.stepper[i].speed[4] = self.mach.stepper[i].coils["FarrOUT"][0]
-            
-
-            # If mode is 1 (incremental stepping) and startstep has been flagged from node-red gui then startstepping
-            if self.command["mode"][i] == 1 and stepspeed != 2 and self.command["startstep"][i] == 1:
-                self.startstepping[i] = True
-                self.command["startstep"][i] = 0 # startstepping triggered and targetstep calculated. So turn off this if cond
-                if stepspeed > 2: # moving CW 
-                    if abs(self.mach.stepper[i].step) + self.command["step"][i] <= self.FULLREVOLUTION: # Set the target step based on node-red gui target and current step for that motor
-                        self.targetstep[i] = abs(self.mach.stepper[i].step) + self.command["step"][i]
-                    else:
-                        self.targetstep[i] = self.FULLREVOLUTION
-                else:      # moving CCW
-                    self.targetstep[i] = self.mach.stepper[i].step - self.command["step"][i]
-                    if self.targetstep[i] < (self.FULLREVOLUTION * -1):
-                        self.targetstep[i] = (self.FULLREVOLUTION * -1)
-                self.logger.debug("2:STRTSTP ON - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
-            
-            # Mode set to 1 (incremental stepping) but haven't started stepping. Stop motor (stepspeed=2) and set the target step (based on node-red gui)
-            # Will wait until startstep flag is sent from node-red GUI before starting motor
-            if self.command["mode"][i] == 1 and not self.startstepping[i]:
-                stepspeed = 2
-                self.command["speed"][i] = 2
-                self.logger.debug("1:MODE1      - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
-            
-            # IN INCREMENT MODE1. Keep stepping until the target step is met. Then reset the startstepping/startstep(nodered) flags.
-            elif self.command["mode"][i] == 1 and self.startstepping[i]:
-                self.logger.debug("3:STEPPING   - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
-                if abs((abs(self.mach.stepper[i].step) - abs(self.targetstep[i]))) < 2: # if delta is less than 2 then target met. Can't use 0 since full step increments by 2
-                    self.logger.debug("4:DONE-M1OFF - Motor:{0} Mode:{1} startstep:{2} startstepping:{3} machStep:{4} targetstep:{5}".format(i, self.command["mode"][i], self.command["startstep"][i], self.startstepping[i], self.mach.stepper[i].step, self.targetstep[i]))
-                    self.startstepping[i] = False
-                    #command["startstep"][i] = 0
+            interval = self.command["delay"][0]          # Pause this motor needs after its step. Loop delay is the longest one.
+            accel = self.command["accel"][i] if "accel" in self.command else 0   # Acceleration (steps/sec^2). 0 or missing = no ramp
+            if accel:
+                startrate = 1000 / (self.command["startdelay"][i] if "startdelay" in self.command else self.STARTDELAY)
+                if self.command["mode"][i] == 0:   # Continuous mode. Ramp speed up/down one step at a time
+                    stepspeed, rampinterval = self.rampspeed(i, stepspeed, accel, startrate)
+            if self.command["mode"][i] == 1:   # Incremental mode. Step towards the target position, hold when there
+                stepspeed = self.targetspeed(i, stepspeed, accel, startrate if accel else 0)
+            if stepspeed != 2:   # Advance the phase of the half or full step sequence. Inverse flips the rotation (sign of the phase step)
+                seq = SPEEDSEQ[stepspeed]
+                rotation = SPEEDROT[stepspeed] ^ bool(self.command["inverse"][i])
+                phase = motor.phase[seq]
+                phase[rotation] = (phase[rotation] + ROTSIGN[rotation]) & SEQMASK[seq]
+                if seq == FULL:
+                    interval = self.command["delay"][0] + self.command["delay"][1] # Add extra delay for full step
+                if accel and self.command["mode"][i] == 0:
+                    interval = rampinterval
+                elif self.ramp[i]:   # Pause for this step comes from the planned ramp
+                    interval = self.ramp[i][min(self.rampindex[i], len(self.ramp[i]) - 1)]
+                    self.rampindex[i] += 1
 
             # SEND COIL ARRAY (HIGH PULSES) TO GPIO PINS AND UPDATE STEP COUNTER
-            GPIO.output(self.mach.stepper[i].pins, self.mach.stepper[i].speed[stepspeed]) # output the coil array (speed/direction) to the GPIO pins.
-            self.logger.debug("Motor:{0} Steps:{1} Mode:{2} startstepping:{3} coils:{4}".format(i, self.mach.stepper[i].step, self.command["mode"][i], self.startstepping[i], self.mach.stepper[i].speed[stepspeed]))
-            self.mach.stepper[i].step = self.stepupdate(stepspeed, self.mach.stepper[i].step)  # update the motor step based on direction and half vs full step
+            if recorder is not None and (stepspeed != 2 or motor.coils is not COILSTOP):   # Record pattern changes. Stopped motors only once
+                recorder.record(tnow, i, COILBITS[seq][phase[rotation]] if stepspeed != 2 else 0, motor.position + SPEEDSTEPS[stepspeed])
+            motor.coils = COILSEQ[seq][phase[rotation]] if stepspeed != 2 else COILSTOP   # coil array (speed/direction) is a table lookup
+            masks = motor.masks[seq][phase[rotation]] if stepspeed != 2 else motor.masks[2][0]   # pins for the coil array (speed/direction)
+            setmask |= masks[0]
+            clrmask |= masks[1]
+            motor.step = self.stepupdate(stepspeed, motor.step)  # update the motor step based on direction and half vs full step
+            motor.position += SPEEDSTEPS[stepspeed]              # absolute position never wraps
+            self.speed[i] = stepspeed
+            if trace is not None:   # Raw step state. Only formatted when the trace is dumped
+                trace.record((tnow, i, motor.step, motor.position, stepspeed, self.command["mode"][i], self.startstepping[i], self.targetstep[i], motor.coils))
             
-            # IF FULL REVOLUTION - reset the step counter
-            if (abs(self.mach.stepper[i].step) > self.FULLREVOLUTION):  # If hit full revolution reset the step counter. If want to step past full revolution would need to later add a 'not startstepping'
-                self.logger.debug("FULL REVOLUTION -- Motor:{0} Steps:{1} Mode:{2} startstepping:{3} coils:{4}".format(i, self.mach.stepper[i].step, self.command["mode"][i], self.startstepping[i], self.mach.stepper[i].speed[self.command["speed"][i]]))
-                self.mach.stepper[i].step = 0
+            # IF FULL REVOLUTION - reset the step counter. Only the dashboard gauge wraps, position keeps counting
+            if (abs(motor.step) > self.FULLREVOLUTION):
+                motor.step = 0
             
+            self.interval[i] = interval
+            if interval > delay and stepspeed != 2:   # Motors step together so the loop waits for the slowest one. Stopped motors do not hold it back
+                delay = interval
+
             # Timers to monitor how long the loops is taking
             self.timens[i] = perf_counter_ns() - self.timens[i]
+            self.coilhist[i].record(self.timens[i])
+        self.delay = delay if delay else self.command["delay"][0]   # Nothing stepped. First delay is half step loop pause. Second value is add-on for full step.
+        for i in due:
             self.timems[i] = (self.timens[i]/1000000) + self.delay
-        sleep(float(self.delay/1000))  # delay can be updated from node-red gui. Needs optimal setting for the motors.
+        self.gpio.write(setmask, clrmask)   # output the coil arrays of every motor to the GPIO pins in one driver call
+        if self.scheduler is not None:      # Each motor is due again after its own interval. Pause until the first one
+            for i in due:
+                self.scheduler.push(i, self.interval[i])
+            self.delay = self.scheduler.wait()
+        for i in due:   # Planned time of the next step. Lockstep motors wait for the loop delay, heap motors for their own interval
+            self.nextns[i] = self.stepns[i] + int((self.interval[i] if self.scheduler is not None else self.delay) * 1000000)
+        if self.activemoves:
+            for move in self.activemoves:
+                if move.done:       # Finished. Motors go back to following the controls
+                    for i in move.motors:
+                        self.moves[i] = None
+                    if move.ondone is not None:
+                        move.ondone(move)
+            self.activemoves = [move for move in self.activemoves if not move.done]
+        return self.delay
+
+    def idle(self):
+        ''' True when nothing moves until new controls or a new move comes in. No moves running, every motor
+            stopped on its last tick (coils off) and the controls keep it stopped '''
+        if self.activemoves:
+            return False
+        command = self.command
+        for i, motor in enumerate(self.mach.stepper):
+            if self.speed[i] != 2 or motor.coils is not COILSTOP:
+                return False
+            if command["speed"][i] == 2:      # Told to stop. Paused incremental moves too, new controls carry on
+                continue
+            if command["mode"][i] != 1 or self.startstepping[i]:   # Continuous mode ramping through a stop, or an incremental move heading for its target
+                return False
+        return True
+
+    def resume(self):
+        ''' After a pause in ticking (idle). The gap is not counted as a slow or missed step '''
+        for i in self.allmotors:
+            self.stepns[i] = 0
+
+    def move_coordinated(self, deltas, speed=None, accel=0, jerk=0, startspeed=None, endspeed=None):
+        ''' Move several motors together so they start and finish on the same tick.
+            deltas - halfsteps for each motor, as a list (one per motor) or dict {motor index: halfsteps}
+            speed - steps/sec of the motor moving furthest. Default is the delay control. Faster than the delay control is fine,
+                    but with the lockstep scheduler motors stepping on the controls at the same time hold the move to their pace
+            accel/jerk - optional ramp for the motor moving furthest (see ramp.profile)
+            startspeed/endspeed - steps/sec the ramp starts/ends at. Default 1000/STARTDELAY (from/to a stop). Used to blend moves
+        Returns the CoordinatedMove. move.done is True when finished. '''
+        pairs = deltas.items() if isinstance(deltas, dict) else enumerate(deltas)
+        motors, counts = [], []
+        for i, delta in pairs:
+            if delta:
+                if self.moves[i] is not None:
+                    raise ValueError("Motor {0} is already in a coordinated move".format(i))
+                motors.append(i)
+                counts.append(int(delta))
+        delay = self.movedelay(speed)
+        major = max((abs(c) for c in counts), default=0)
+        rest = 1000 / self.STARTDELAY
+        delays = profile(major, 1000 / delay, accel, startspeed or rest, endspeed or rest, jerk) if accel and major else None   # Lazy, nothing planned up front. Often called on the stepper thread
+        move = CoordinatedMove(motors, counts, delay, delays)
+        if not move.done:
+            for axis, i in enumerate(motors):
+                self.moves[i] = move
+                self.moveaxis[i] = axis
+            if self.scheduler is not None:
+                self.scheduler.sync(motors)
+            self.activemoves.append(move)
+        return move
+
+    def movedelay(self, speed):
+        ''' Pause (ms) between ticks of a move at speed (steps/sec). Default is the delay control '''
+        return 1000 / speed if speed else (self.command["delay"][0] if "delay" in self.command else self.STARTDELAY)
+
+    def compile_move(self, deltas, speed=None, accel=0, jerk=0):
+        ''' Pre-render a coordinated move from the current motor phases for play(). Same arguments as move_coordinated.
+            Needs numpy. Returns a CompiledMove (see compiler.py) '''
+        from .compiler import compilemove
+        return compilemove(self, deltas, speed, accel, jerk)
+
+    def play(self, move):
+        ''' Send a CompiledMove to the pins. Blocks until the move is done. Use from the thread that calls tick()
+            (ie StepperThread.call(lambda motor: motor.play(move))). Steps are not traced or recorded '''
+        for i, rotation, phase in zip(move.motors, move.rotations, move.startphase):
+            if self.moves[i] is not None:
+                raise ValueError("Motor {0} is already in a coordinated move".format(i))
+            if self.mach.stepper[i].phase[HALF][rotation] != phase:   # Motor stepped since the move was compiled
+                raise ValueError("Motor {0} is not at the phase the move was compiled from".format(i))
+        times, setmasks, clrmasks = move.playlists
+        write = self.gpio.write
+        late = 0
+        t0 = perf_counter_ns()
+        sleepuntil = self.timer.sleepuntil
+        for k in range(len(times)):
+            if sleepuntil(t0 + times[k]) > self.MISSNS:
+                late += 1
+            write(setmasks[k], clrmasks[k])
+        sleepuntil(t0 + move.durationns)   # Pause after the last tick so the next step is not early
+        tnow = perf_counter_ns()
+        for i, delta, rotation, phase in zip(move.motors, move.deltas, move.rotations, move.endphase):
+            motor = self.mach.stepper[i]
+            motor.phase[HALF][rotation] = phase
+            if delta:
+                motor.coils = COILSEQ[HALF][phase]
+            motor.position += delta
+            motor.step = self.gaugesteps(motor.step, delta)
+            self.missed[i] += late
+            self.stepns[i] = self.nextns[i] = tnow
+
+    def gaugesteps(self, step, delta):
+        ''' Dashboard step counter after delta halfsteps. Same as stepping one at a time (back to 0 past a full revolution) '''
+        wrap = self.FULLREVOLUTION + 1
+        if delta >= 0:
+            if step < 0 and delta <= -step:   # Stays on the negative side
+                return step + delta
+            return (max(step, 0) + delta + min(step, 0)) % wrap
+        if step > 0 and -delta <= step:
+            return step + delta
+        return -((-min(step, 0) - delta - max(step, 0)) % wrap)
+
+    def recordsleep(self, overshootns):
+        ''' Record how much longer than the tick delay the pause took (ns). Called after sleeping (step or StepperThread) '''
+        for i in self.due:
+            self.sleephist[i].record(overshootns)
+
+    def abortmove(self, move):
+        ''' Stop a coordinated move where it is and turn the coils of its motors off. Motors go back to following the controls '''
+        if move not in self.activemoves:
+            return
+        clrmask = 0
+        for i in move.motors:
+            self.moves[i] = None
+            self.mach.stepper[i].coils = COILSTOP
+            if self.recorder is not None:
+                self.recorder.record(perf_counter_ns(), i, 0, self.mach.stepper[i].position)
+            clrmask |= self.mach.stepper[i].masks[2][0][1]
+        self.gpio.write(0, clrmask)
+        move.done = True
+        self.activemoves.remove(move)
+
+    def targetspeed(self, i, speed, accel, startrate):
+        ''' Incremental mode. Returns the speed (0-4) to run this step. Stop (2) while waiting for startstep or once the target is reached '''
+        motor = self.mach.stepper[i]
+        if self.command["startstep"][i] != 1:   # Rearm. The next startstep starts a new move
+            self.startcontrols[i] = None
+        elif speed != 2 and self.startcontrols[i] is not self.command:   # startstep flagged from node-red gui. Target is relative to where the motor is now
+            self.startstepping[i] = True
+            self.startcontrols[i] = self.command   # These controls started a move. The same startstep does not start another one
+            self.targetstep[i] = motor.position + (self.command["step"][i] if speed > 2 else -self.command["step"][i])
+            self.ramp[i] = None
+            if accel:   # Ramp for this move. Delays are worked out a step at a time as the move runs. Distance is in steps of the selected speed (full step moves 2)
+                stepsize = abs(SPEEDSTEPS[speed])
+                interval = self.command["delay"][0] + (self.command["delay"][1] if stepsize == 2 else 0)
+                jerk = self.command["jerk"][i] if "jerk" in self.command else 0   # S-curve when jerk is set
+                self.ramp[i] = profile(-(-abs(self.targetstep[i] - motor.position) // stepsize), 1000 / interval, accel, startrate, None, jerk)
+                self.rampindex[i] = 0
+            self.logger.debug("STRTSTP ON - Motor:%d position:%d targetstep:%d", i, motor.position, self.targetstep[i])
+        if not self.startstepping[i]:   # Wait for startstep. Hold the motor stopped
+            return 2
+        remaining = self.targetstep[i] - motor.position
+        if remaining == 0:              # Target met exactly. Reset the startstepping flag and wait for the next startstep
+            self.logger.debug("DONE-M1OFF - Motor:%d position:%d", i, motor.position)
+            self.startstepping[i] = False
+            self.ramp[i] = None
+            return 2
+        if speed == 2:                  # Paused from node-red. Carry on when the speed is set again
+            return 2
+        if SPEEDSEQ[speed] == FULL and abs(remaining) > 1:
+            return 4 if remaining > 0 else 0
+        return 3 if remaining > 0 else 1   # Halfstep. Also used for the last halfstep of a full step move with an odd distance
+
+    def move_by(self, i, delta, speed=None, accel=0, jerk=0):
+        ''' Move motor i by delta halfsteps (any number of revolutions). Returns the CoordinatedMove '''
+        return self.move_coordinated({i: delta}, speed, accel, jerk)
+
+    def move_to(self, i, position, speed=None, accel=0, jerk=0):
+        ''' Move motor i to an absolute position (halfsteps). Returns the CoordinatedMove '''
+        return self.move_by(i, position - self.mach.stepper[i].position, speed, accel, jerk)
+
+    def rampspeed(self, i, speed, accel, startrate):
+        ''' Continuous mode with acceleration. Returns the speed (0-4) to run this step and the pause (ms) after it '''
+        running = self.runspeed[i]
+        rate = self.rate[i]
+        if running != speed and running != 2 and rate > startrate:   # Speed/direction changed. Slow down the running speed to the start speed first
+            self.rate[i] = decelerate(rate, accel, startrate)
+            return running, 1000 / rate
+        self.runspeed[i] = speed
+        if speed == 2:
+            self.rate[i] = 0
+            return speed, self.command["delay"][0]
+        cruiserate = 1000 / (self.command["delay"][0] + (self.command["delay"][1] if SPEEDSEQ[speed] == FULL else 0))
+        rate = max(rate, min(startrate, cruiserate))
+        self.rate[i] = accelerate(rate, accel, cruiserate) if rate < cruiserate else decelerate(rate, accel, cruiserate)
+        return speed, 1000 / rate
 
     def getdata(self):
         ''' RETURN MOTOR DATA INCLUDING STEPS, RPMS, ETC '''
@@ -179,12 +455,21 @@ class Stepper:   # command comes from node-red GUI
             self.rpmsteps0[i] = self.mach.stepper[i].step
             self.rpmtime0[i] = perf_counter_ns()
             self.outgoing['steps' + str(i) + 'i'] = self.mach.stepper[i].step
+            self.outgoing['pos' + str(i) + 'i'] = self.mach.stepper[i].position
             self.outgoing['rpm'+ str(i) + 'f'] = self.rpm[i]
             self.outgoing['looptime'+ str(i) + 'f'] = self.timems[i]
-            self.outgoing['speed'+ str(i) + 'i'] = self.command["speed"][i]
+            self.outgoing['speed'+ str(i) + 'i'] = self.speed[i]
+            for name, hist in (('step', self.stephist[i]), ('coil', self.coilhist[i]), ('sleep', self.sleephist[i])):   # Timing percentiles in ms
+                self.outgoing[name + 'p50_' + str(i) + 'f'] = hist.percentile(50) / 1000000
+                self.outgoing[name + 'p99_' + str(i) + 'f'] = hist.percentile(99) / 1000000
+                self.outgoing[name + 'max' + str(i) + 'f'] = hist.max / 1000000
+            self.outgoing['missed' + str(i) + 'i'] = self.missed[i]
         self.outgoing['delayf'] = self.delay
-        f0 = open("/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq")
-        self.outgoing['cpufreq0i'] = int(int(f0.read()) / 1000)
+        try:
+            with open("/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq") as f0:
+                self.outgoing['cpufreq0i'] = int(int(f0.read()) / 1000)
+        except OSError:   # No cpufreq (not a Pi, VM, container)
+            self.outgoing['cpufreq0i'] = 0
         return self.outgoing
 
     def resetsteps(self):
@@ -205,8 +490,13 @@ class Stepper:   # command comes from node-red GUI
             stp = stp
         return stp
 
+    def dumptrace(self):
+        ''' Write the step trace (Stepper(..., trace=True)) to the logger at DEBUG and clear it '''
+        if self.trace is not None:
+            self.trace.dump(self.logger)
+
     def cleanupGPIO(self):
-        GPIO.cleanup()
+        self.gpio.cleanup()
 
 if __name__ == "__main__":
 
@@ -243,7 +533,7 @@ if __name__ == "__main__":
     main_logger.info("setup logging module")
     reportsteps = []
     incomingD={"delay":[0.8,1.0], "speed":[3,3], "mode":[0,0], "inverse":[False,False], "step":[2038, 2038], "startstep":[0,0]}
-    data_keys = ['delayf', 'cpufreq0i', 'looptime0f', 'looptime1f', 'steps0i', 'steps1i', 'rpm0f', 'rpm1f', 'speed0i', 'speed1i']
+    data_keys = ['delayf', 'cpufreq0i', 'looptime0f', 'looptime1f', 'steps0i', 'steps1i', 'pos0i', 'pos1i', 'rpm0f', 'rpm1f', 'speed0i', 'speed1i', 'stepp99_0f', 'stepp99_1f', 'missed0i', 'missed1i']
     m1pins = [12, 16, 20, 21]
     m2pins = [19, 13, 6, 5]
     motor = Stepper(m1pins, m2pins, logger=logger_stepper)  # can enter 1 to 2 list of pins (up to 2 motors)
@@ -257,5 +547,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         main_logger.info("Pressed ctrl-C")
     finally:
-        GPIO.cleanup()
+        motor.cleanupGPIO()
         main_logger.info("GPIO cleaned up")
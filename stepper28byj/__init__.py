@@ -1 +1,3 @@
-from .Mstep28byjuln2003 import Stepper
\ No newline at end of file
+from .Mstep28byjuln2003 import Stepper
+from .stepperthread import StepperThread
+from .aio import AsyncStepper
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+asyncio facade for the Stepper
+
+All motors step on one StepperThread, not one per motor. That thread shares the GIL with the
+event loop, so a coroutine that keeps the cpu busy holds the steps up until the interpreter
+switches threads (sys.getswitchinterval, 5 ms by default, several steps at 0.8 ms). While it runs
+AsyncStepper lowers the switch interval to switchinterval (SWITCHINTERVAL) and puts the old one back
+on stop. The interval is process wide. It bounds the hold up, it does not remove it: busy
+coroutines still add up to switchinterval to a step. switchinterval=None leaves it alone. For
+step timing that does not depend on the event loop at all run the motors in worker processes
+(stepper28byj.shard.ShardSupervisor, each has its own GIL). Moves are started on the stepper thread between steps and each one returns a
+future that is resolved from the stepper thread when the move finishes.
+
+    async with AsyncStepper(stepper28byj.Stepper(m1pins, m2pins)) as motor:
+        await motor.move_to(0, 4076, speed=500)
+        await asyncio.gather(motor.move_by(0, -2038), motor.move_by(1, 2038))
+
+Cancelling a move (task.cancel(), asyncio.wait_for timeout) stops it where it is and turns
+its coils off.
+
+A move runs at its own speed, above the 1 ms delay of the default controls too. With the default
+lockstep Stepper every motor steps on one loop delay though, so moves running at the same time go
+at the pace of the slowest one. Stepper(..., scheduler='heap') gives each motor its own rate.
+"""
+
+import asyncio
+import sys
+from .stepperthread import StepperThread
+
+SWITCHINTERVAL = 0.0002   # GIL switch interval while stepping (s)
+
+class AsyncStepper:
+    def __init__(self, motor, controls=None, logger=None, switchinterval=SWITCHINTERVAL):
+        self.motor = motor               # stepper28byj.Stepper object
+        if controls is None:             # Motors stopped (speed 2) and only move when told to. The delay does not limit move speed
+            count = len(motor.mach.stepper)
+            controls = {"delay":[1.0,1.0], "speed":[2]*count, "mode":[0]*count, "inverse":[False]*count, "step":[0]*count, "startstep":[0]*count}
+        self.thread = StepperThread(motor, controls, logger)
+        self.switchinterval = switchinterval   # None = leave sys.getswitchinterval as it is
+        self.oldinterval = None          # The interval before start, put back on stop
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def start(self):
+        if self.switchinterval is not None:
+            self.oldinterval = sys.getswitchinterval()
+            sys.setswitchinterval(self.switchinterval)
+        self.thread.start()
+
+    async def stop(self):
+        ''' Stop the stepper thread without blocking the event loop '''
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.thread.stop)
+        finally:
+            if self.oldinterval is not None:
+                sys.setswitchinterval(self.oldinterval)
+                self.oldinterval = None
+
+    def setcontrols(self, controls):
+        self.thread.setcontrols(controls)
+
+    def getdata(self):
+        return self.thread.getdata()
+
+    async def move_coordinated(self, deltas, speed=None, accel=0, jerk=0):
+        ''' Move several motors together. See Stepper.move_coordinated '''
+        return await self._move(lambda motor: motor.move_coordinated(deltas, speed, accel, jerk))
+
+    async def move_by(self, i, delta, speed=None, accel=0, jerk=0):
+        ''' Move motor i by delta halfsteps '''
+        return await self._move(lambda motor: motor.move_by(i, delta, speed, accel, jerk))
+
+    async def move_to(self, i, position, speed=None, accel=0, jerk=0):
+        ''' Move motor i to an absolute position (halfsteps). Position is read on the stepper thread when the move starts '''
+        return await self._move(lambda motor: motor.move_to(i, position, speed, accel, jerk))
+
+    async def _move(self, startmove):
+        ''' Start a move on the stepper thread and wait for it to finish. Returns the CoordinatedMove '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        started = []                     # The move, once the stepper thread has started it
+
+        def finished(move):
+            try:
+                loop.call_soon_threadsafe(_setresult, future, move)
+            except RuntimeError:         # Event loop already closed
+                pass
+
+        def start(motor):                # Runs on the stepper thread
+            try:
+                move = startmove(motor)
+            except Exception as e:
+                loop.call_soon_threadsafe(_setexception, future, e)
+                return
+            started.append(move)
+            if move.done:                # Nothing to move
+                finished(move)
+            else:
+                move.ondone = finished
+
+        self.thread.call(start)
+        try:
+            return await future
+        except asyncio.CancelledError:   # Queued after start so the move exists when this runs
+            self.thread.call(lambda motor: motor.abortmove(started[0]) if started else None)
+            raise
+
+def _setresult(future, result):
+    if not future.done():
+        future.set_result(result)
+
+def _setexception(future, e):
+    if not future.done():
+        future.set_exception(e)
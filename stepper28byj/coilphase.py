@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Coil sequence tables for the 28BYJ-48 / ULN2003
+
+Instead of rotating lists with slicing every step, each motor keeps a small
+integer phase (index into these tables) per sequence and rotation. Stepping
+adds +1 (CW) or -1 (CCW) to the phase and the coil pattern is a table lookup.
+Nothing is allocated per step.
+
+Tables produce exactly the same coil sequence as the original array rotation
+(slicing) method in test-method2c-arr-rot-dataclass.py
+"""
+
+HALF = 0    # Index of the half step sequence (8 patterns)
+FULL = 1    # Index of the full step sequence (4 patterns)
+
+COILSEQ = (
+    ((1,0,0,1), (1,0,0,0), (1,1,0,0), (0,1,0,0), (0,1,1,0), (0,0,1,0), (0,0,1,1), (0,0,0,1)),   # Half step
+    ((1,0,0,1), (1,1,0,0), (0,1,1,0), (0,0,1,1)),                                               # Full step
+)
+COILSTOP = (0,0,0,0)    # Speed 2 is hard coded as stop
+SEQMASK = (7, 3)        # Phase wraps with a bit mask. len(seq) - 1
+
+# Speed 0=fullstepCCW, 1=halfstepCCW, 2=stop, 3=halfstep CW, 4=fullstep CW
+SPEEDSEQ = (FULL, HALF, None, HALF, FULL)   # Which sequence each speed uses
+SPEEDROT = (0, 0, None, 1, 1)               # Rotation for each speed when not inversed (0=CCW, 1=CW). Inverse flips it.
+ROTSIGN = (-1, 1)                           # Phase direction for rotation 0 (CCW) and 1 (CW)
+SPEEDSTEPS = (-2, -1, 0, 1, 2)              # Halfsteps each speed moves the position
+
+# Coil patterns as bitmasks. Bit 0 = IN1 ... bit 3 = IN4. Used by the step recorder
+COILBITS = tuple(tuple(sum(level << k for k, level in enumerate(pattern)) for pattern in seq) for seq in COILSEQ)
+
+def initialphase():
+    ''' Starting phase for each sequence and rotation. [HALF[CCW,CW], FULL[CCW,CW]] '''
+    # Same starting point as the slicing method. First CW halfstep sends (1,0,0,1), first CCW halfstep sends (0,1,1,0)
+    return [[5, 7], [3, 3]]
+
+def coilmasks(pins):
+    ''' (set, clear) BCM pin bitmasks for every coil array of a motor. Same layout as COILSEQ plus the stop array at [2][0] '''
+    masks = []
+    for seq in COILSEQ + ((COILSTOP,),):
+        seqmasks = []
+        for pattern in seq:
+            setmask, clrmask = 0, 0
+            for pin, level in zip(pins, pattern):
+                if level:
+                    setmask |= 1 << pin
+                else:
+                    clrmask |= 1 << pin
+            seqmasks.append((setmask, clrmask))
+        masks.append(tuple(seqmasks))
+    return tuple(masks)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Move compiler. Pre-renders a coordinated move into arrays so playback only indexes and writes pins
+
+    move = motor.compile_move([4076, -2038], speed=1000, accel=3000)
+    motor.play(move)         # blocks until the move is done
+    motor.play(motor.compile_move([-4076, 2038], speed=1000, accel=3000))
+
+compilemove() does the work of CoordinatedMove (integer DDA), the coil phase tables and the ramp
+for every tick at once with numpy:
+    timens    int64   when each tick is sent, from the start of the move
+    setmasks  uint64  pins to set on each tick (bit n = BCM pin n)
+    clrmasks  uint64  pins to clear on each tick
+Renders are cached (moves repeat) so a move is only rendered once for each start phase.
+The pin output is the same as Stepper.move_coordinated. numpy is only needed to compile.
+"""
+
+from functools import lru_cache
+from .coilphase import HALF, SPEEDROT, ROTSIGN, SEQMASK
+
+class CompiledMove:
+    def __init__(self, motors, deltas, rotations, startphase, endphase, timens, setmasks, clrmasks, durationns):
+        self.motors = motors             # Motor index of each axis
+        self.deltas = deltas             # Halfsteps each axis moves
+        self.rotations = rotations       # Rotation (0=CCW, 1=CW after inverse) of each axis. Which phase counter it uses
+        self.startphase = startphase     # Half step phase of each axis the render starts from
+        self.endphase = endphase         # Half step phase of each axis when done
+        self.timens = timens             # numpy arrays, one entry per tick
+        self.setmasks = setmasks
+        self.clrmasks = clrmasks
+        self.durationns = durationns     # Start of the first tick to the end of the pause after the last one
+        self.playlists = (timens.tolist(), setmasks.tolist(), clrmasks.tolist())   # Python ints index faster than numpy scalars
+
+    def __len__(self):
+        return len(self.playlists[0])
+
+def compilemove(stepper, deltas, speed=None, accel=0, jerk=0):
+    ''' CompiledMove for deltas (list or dict of halfsteps) starting from the stepper's current phases. Same options as move_coordinated '''
+    pairs = deltas.items() if isinstance(deltas, dict) else enumerate(deltas)
+    motors, counts = [], []
+    for i, delta in pairs:
+        if delta:
+            motors.append(i)
+            counts.append(int(delta))
+    delay, accel = stepper.movedelay(speed), accel or 0
+    inverse = stepper.command["inverse"] if "inverse" in stepper.command else [False] * len(stepper.mach.stepper)
+    rotations = tuple(SPEEDROT[3 if c > 0 else 1] ^ bool(inverse[i]) for i, c in zip(motors, counts))
+    startphase = tuple(stepper.mach.stepper[i].phase[HALF][r] for i, r in zip(motors, rotations))
+    masks = tuple(stepper.mach.stepper[i].masks[HALF] for i in motors)
+    timens, setmasks, clrmasks, durationns = render(masks, tuple(counts), rotations, startphase, delay, accel, jerk, 1000 / stepper.STARTDELAY)
+    endphase = tuple((p + ROTSIGN[r] * abs(c)) & SEQMASK[HALF] for p, r, c in zip(startphase, rotations, counts))
+    return CompiledMove(motors, counts, rotations, startphase, endphase, timens, setmasks, clrmasks, durationns)
+
+@lru_cache(maxsize=64)
+def render(masks, counts, rotations, startphase, delay, accel, jerk, startrate):
+    ''' (timens, setmasks, clrmasks, durationns) for a move. All ticks of all axes in one pass per axis. Cached, do not modify the arrays '''
+    import numpy as np
+    from .ramp import profile
+    major = max((abs(c) for c in counts), default=0)
+    if accel and major:
+        intervals = np.fromiter(profile(major, 1000 / delay, accel, startrate, None, jerk), dtype=np.float64, count=major)
+    else:
+        intervals = np.full(major, float(delay))
+    ends = np.cumsum(np.rint(intervals * 1000000).astype(np.int64))   # Pause after each tick (ms) -> end of each tick (ns)
+    timens = np.concatenate((np.zeros(1, dtype=np.int64), ends[:-1])) if major else ends
+    ticks = np.arange(1, major + 1, dtype=np.int64)
+    setmasks = np.zeros(major, dtype=np.uint64)
+    clrmasks = np.zeros(major, dtype=np.uint64)
+    for axismasks, count, rotation, phase in zip(masks, counts, rotations, startphase):
+        taken = (major // 2 + ticks * abs(count)) // major          # Bresenham: steps this axis has taken after each tick
+        stepping = np.diff(taken, prepend=0).astype(bool)         # Ticks this axis steps on (same as CoordinatedMove.advance)
+        phases = (phase + ROTSIGN[rotation] * taken[stepping]) & SEQMASK[HALF]
+        table = np.array(axismasks, dtype=np.uint64)              # (set, clear) pins for each half step phase
+        setmasks[stepping] |= table[phases, 0]
+        clrmasks[stepping] |= table[phases, 1]
+    return timens, setmasks, clrmasks, int(ends[-1]) if major else 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Stepper controls from node-red, decoded and checked before they reach Stepper.tick
+
+    controls = Controls.decode(msg.payload, motors=2)   # ControlError if anything is wrong
+    motorthread.setcontrols(controls.todict())
+
+Payload is the json controls dict. One value per motor in each list except delay
+    delay      [halfstep pause ms, add-on ms for full step]   > 0, >= 0
+    speed      0-4 (0 CCW full, 1 CCW half, 2 stop, 3 CW half, 4 CW full)
+    mode       0 continuous, 1 incremental
+    inverse    true/false
+    step       halfsteps to move in incremental mode (>= 0)
+    startstep  1 starts an incremental move
+    accel      steps/sec² (>= 0)         optional
+    startdelay ms (> 0)                  optional
+    jerk       steps/sec³ (>= 0)         optional
+Other keys are ignored.
+
+snapshot(controls) freezes a controls dict (read only mapping of tuples) for handing to another thread.
+StepperThread.setcontrols does this so the step loop only ever sees whole, unchanging controls.
+"""
+
+import json
+import sys
+from types import MappingProxyType
+from dataclasses import dataclass
+from typing import List, Optional
+
+class ControlError(ValueError):
+    ''' Payload is not valid controls. Raised before anything is changed '''
+
+NUMBER = (int, float)
+WHOLE = (int,)
+REQUIRED = frozenset(("delay", "speed", "mode", "inverse", "step", "startstep"))
+BIG = sys.float_info.max     # Upper limit when there is none. Also rejects inf (and nan, which fails every comparison)
+
+def _numbers(payload, name, count, low, high=BIG, types=NUMBER, strict=False):
+    ''' payload[name] if it is a list of count numbers in low..high (strict: above low). bools are not numbers here '''
+    values = payload[name]
+    if type(values) is not list or len(values) != count:
+        raise ControlError("{0} needs a list of {1} values, got {2!r}".format(name, count, values))
+    for value in values:
+        if type(value) not in types or not low <= value <= high or (strict and value == low):
+            limits = "above {0}".format(low) if strict else "{0}..{1}".format(low, high if high is not BIG else "max")
+            raise ControlError("{0} value {1!r} is not {2} {3}".format(name, value, "a whole number" if types is WHOLE else "a number", limits))
+    return values
+
+@dataclass
+class Controls:
+    delay: List[float]
+    speed: List[int]
+    mode: List[int]
+    inverse: List[bool]
+    step: List[int]
+    startstep: List[int]
+    accel: Optional[List[float]] = None
+    startdelay: Optional[List[float]] = None
+    jerk: Optional[List[float]] = None
+
+    @classmethod
+    def decode(cls, payload, motors):
+        ''' Controls from a json payload (bytes or str) for a number of motors. Raises ControlError '''
+        try:
+            data = json.loads(payload)
+        except ValueError as e:      # Bad json or bad utf-8
+            raise ControlError("payload is not json: {0}".format(e)) from None
+        if not isinstance(data, dict):
+            raise ControlError("payload must be a json object, got {0}".format(type(data).__name__))
+        if not data.keys() >= REQUIRED:
+            raise ControlError("{0} missing".format(", ".join(sorted(REQUIRED - data.keys()))))
+        delay = _numbers(data, "delay", 2, 0)
+        if delay[0] <= 0:
+            raise ControlError("delay {0!r} must be more than 0".format(delay[0]))
+        inverse = data["inverse"]
+        if type(inverse) is not list or len(inverse) != motors or not all(value is True or value is False for value in inverse):
+            raise ControlError("inverse needs a list of {0} true/false, got {1!r}".format(motors, inverse))
+        return cls(delay,
+                   _numbers(data, "speed", motors, 0, 4, WHOLE),
+                   _numbers(data, "mode", motors, 0, 1, WHOLE),
+                   inverse,
+                   _numbers(data, "step", motors, 0, BIG, WHOLE),
+                   _numbers(data, "startstep", motors, 0, 1, WHOLE),
+                   _numbers(data, "accel", motors, 0) if "accel" in data else None,
+                   _numbers(data, "startdelay", motors, 0, strict=True) if "startdelay" in data else None,
+                   _numbers(data, "jerk", motors, 0) if "jerk" in data else None)
+
+    def todict(self):
+        ''' Controls dict for Stepper.tick/StepperThread.setcontrols. Optional controls only when set '''
+        controls = {"delay": self.delay, "speed": self.speed, "mode": self.mode, "inverse": self.inverse, "step": self.step, "startstep": self.startstep}
+        for name in ("accel", "startdelay", "jerk"):
+            value = getattr(self, name)
+            if value is not None:
+                controls[name] = value
+        return controls
+
+def snapshot(controls):
+    ''' Read only copy of a controls dict. Lists become tuples. A new object every call so Stepper.tick sees it as new controls '''
+    return MappingProxyType({key: tuple(value) if isinstance(value, list) else value for key, value in controls.items()})
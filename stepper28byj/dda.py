@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+"""
+Coordinated multi-motor moves with an integer DDA (Bresenham)
+
+The motor with the most steps (major axis) steps every tick. Each other motor adds its step count
+to an error accumulator every tick and steps when it passes the major count. All motors start on
+the same tick and finish on the same tick. Integer math only in the loop.
+"""
+
+class CoordinatedMove:
+    def __init__(self, motors, deltas, delay, delays=None):
+        self.motors = list(motors)                          # Motor index (in Stepper.mach.stepper) of each axis
+        self.direction = [1 if d > 0 else -1 for d in deltas]
+        self.counts = [abs(d) for d in deltas]              # Halfsteps each axis has to take
+        self.major = max(self.counts) if self.counts else 0 # Ticks the move takes
+        self.errors = [self.major // 2 for d in deltas]     # Start half way so the minor axis steps are centered
+        self.stepping = [0 for d in deltas]                 # Direction each axis steps this tick (+1, -1 or 0). Updated in place
+        self.delay = delay                                  # Pause (ms) after each tick when there is no delay array
+        self.delays = delays                                # Optional per tick delays (ms), read in tick order. ie a ramp.profile()
+        self.interval = delay                               # Pause (ms) after the current tick
+        self.index = 0                                      # Ticks done
+        self.done = self.major == 0
+        self.ondone = None                                  # Optional callback ondone(move). Called by Stepper.tick when the move finishes
+
+    def advance(self):
+        ''' Decide which axes step on this tick '''
+        if self.index >= self.major:
+            for k in range(len(self.stepping)):
+                self.stepping[k] = 0
+            self.done = True
+            return
+        major = self.major
+        for k in range(len(self.counts)):
+            self.errors[k] += self.counts[k]
+            if self.errors[k] >= major:
+                self.errors[k] -= major
+                self.stepping[k] = self.direction[k]
+            else:
+                self.stepping[k] = 0
+        self.interval = self.delays[self.index] if self.delays is not None else self.delay
+        self.index += 1
+        self.done = self.index >= major
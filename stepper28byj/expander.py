@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Port expander drivers. Many more motors than the Pi has GPIO pins
+
+Pins are numbered across the expanders instead of BCM numbers
+    MCP23017Driver   16 pins per chip (I2C). Chip k has pins 16k-16k+15 (GPA0-7 then GPB0-7). 4 motors per chip
+    HC595Driver      chain of 74HC595 shift registers (SPI). Chip k has pins 8k-8k+7 (QA-QH). 2 motors per chip
+
+    motor = Stepper([0,1,2,3], [4,5,6,7], ..., [60,61,62,63], driver=MCP23017Driver(SMBus(1), (0x20, 0x21, 0x22, 0x23)))
+    motor = Stepper(*[[4*m, 4*m+1, 4*m+2, 4*m+3] for m in range(16)], driver=HC595Driver(spidev, chips=8))
+
+Stepper.tick already gathers the coil pins of every motor into one set/clear mask, so each tick is
+    MCP23017  one I2C write per chip that changed (OLATA and OLATB together, sequential addressing)
+    74HC595   one SPI transfer for the whole chain (latched by CE going high, wire RCLK to CE)
+The bus objects only need the smbus2 (write_i2c_block_data) or spidev (writebytes) call.
+FakeI2CBus and FakeSPIBus stand in for them for testing and benchmarking without the chips.
+"""
+
+from .gpiodriver import GPIODriver
+
+class MCP23017Driver(GPIODriver):
+    IODIRA = 0x00     # Direction registers. 0 = output. IOCON.BANK=0 (power on) register layout
+    OLATA = 0x14      # Output latches. OLATB (0x15) follows in the same write
+
+    def __init__(self, bus, addresses=(0x20,)):
+        super().__init__()
+        self.bus = bus
+        self.addresses = tuple(addresses)
+        self.writes = 0                  # Bus transactions sent
+        for address in self.addresses:   # Every pin an output, LOW
+            bus.write_i2c_block_data(address, self.OLATA, [0, 0])
+            bus.write_i2c_block_data(address, self.IODIRA, [0, 0])
+
+    def setup(self, pins):
+        for pin in pins:
+            if not 0 <= pin < 16 * len(self.addresses):
+                raise ValueError("Pin {0} is not on the MCP23017s (0-{1})".format(pin, 16 * len(self.addresses) - 1))
+        super().setup(pins)
+
+    def write(self, setmask, clrmask):
+        ''' Both ports of each chip whose pins changed, in one transaction per chip '''
+        levels = (self.levels | setmask) & ~clrmask
+        changed = levels ^ self.levels
+        self.levels = levels
+        k = 0
+        while changed:
+            if changed & 0xFFFF:
+                port = levels & 0xFFFF
+                self.bus.write_i2c_block_data(self.addresses[k], self.OLATA, [port & 0xFF, port >> 8])
+                self.writes += 1
+            changed >>= 16
+            levels >>= 16
+            k += 1
+
+    def cleanup(self):
+        for address in self.addresses:
+            self.bus.write_i2c_block_data(address, self.OLATA, [0, 0])
+        super().cleanup()
+
+class HC595Driver(GPIODriver):
+    def __init__(self, spi, chips=1):
+        super().__init__()
+        self.spi = spi
+        self.chips = chips
+        self.writes = 0                  # Bus transactions sent
+        spi.writebytes(bytes(chips))     # Shift registers power up with random outputs. All LOW
+
+    def setup(self, pins):
+        for pin in pins:
+            if not 0 <= pin < 8 * self.chips:
+                raise ValueError("Pin {0} is not on the 74HC595 chain (0-{1})".format(pin, 8 * self.chips - 1))
+        super().setup(pins)
+
+    def write(self, setmask, clrmask):
+        ''' Whole chain in one transfer. Last chip first, it is shifted furthest (MSB first, QH first) '''
+        levels = (self.levels | setmask) & ~clrmask
+        if levels != self.levels:
+            self.levels = levels
+            self.spi.writebytes(levels.to_bytes(self.chips, "big"))
+            self.writes += 1
+
+    def cleanup(self):
+        self.spi.writebytes(bytes(self.chips))
+        super().cleanup()
+
+class FakeI2CBus:
+    ''' smbus2 stand in. Keeps the register values written to each address '''
+    def __init__(self):
+        self.registers = {}      # (address, register) -> value
+        self.transactions = 0
+
+    def write_i2c_block_data(self, address, register, data):
+        for n, value in enumerate(data):   # Sequential addressing. Each byte goes to the next register
+            self.registers[(address, register + n)] = value
+        self.transactions += 1
+
+    def outputs(self, address):
+        ''' GPA0-7, GPB0-7 latch levels of one chip as a 16 bit value '''
+        return self.registers.get((address, MCP23017Driver.OLATA), 0) | self.registers.get((address, MCP23017Driver.OLATA + 1), 0) << 8
+
+class FakeSPIBus:
+    ''' spidev stand in. Shifts the bytes through a chain of 74HC595s '''
+    def __init__(self):
+        self.chain = b""         # Bytes latched, first chip in the chain last
+        self.transactions = 0
+
+    def writebytes(self, data):
+        self.chain = bytes(data)
+        self.transactions += 1
+
+    def outputs(self):
+        ''' Outputs of the whole chain. Bit 8k+n = chip k output n '''
+        return int.from_bytes(self.chain, "big")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+GPIO drivers for the Stepper
+
+Every driver has the same three calls
+    setup(pins)               set pins as outputs (LOW)
+    write(setmask, clrmask)   set/clear every coil pin of every motor in one call. Bit n = BCM pin n
+    cleanup()                 turn pins off and release them
+
+Pick one when creating the Stepper. Stepper(m1pins, m2pins, driver='sim')
+    'rpi'      RPi.GPIO (default)
+    'gpiod'    Linux gpio character device (libgpiod python bindings v1 or v2)
+    'gpiomem'  register writes through /dev/gpiomem (see gpiomem.py)
+    'sim'      in memory. Records coil states and timestamps. Runs anywhere.
+Hardware libraries are only imported when their driver is created.
+"""
+
+from array import array
+from time import perf_counter_ns
+
+class GPIODriver:
+    ''' Base class. Keeps the pin levels so drivers can skip pins that did not change '''
+    def __init__(self):
+        self.pins = []
+        self.levels = 0     # Bitmask of pins currently HIGH
+
+    def setup(self, pins):
+        self.pins.extend(pins)
+
+    def write(self, setmask, clrmask):
+        raise NotImplementedError
+
+    def cleanup(self):
+        self.pins = []
+        self.levels = 0
+
+    def pinlevels(self, pins):
+        ''' Levels of pins as a list. ie [1,0,0,1] '''
+        return [(self.levels >> pin) & 1 for pin in pins]
+
+class RPiGPIODriver(GPIODriver):
+    ''' RPi.GPIO. Only the pins that changed are written (1-2 per motor per halfstep instead of 4) '''
+    def __init__(self):
+        super().__init__()
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BCM)
+
+    def setup(self, pins):
+        for pin in pins:
+            self.GPIO.setup(pin, self.GPIO.OUT, initial=0)
+        super().setup(pins)
+
+    def write(self, setmask, clrmask):
+        changed = (setmask & ~self.levels) | (clrmask & self.levels)
+        self.levels = (self.levels | setmask) & ~clrmask
+        while changed:
+            lowbit = changed & -changed
+            pin = lowbit.bit_length() - 1
+            self.GPIO.output(pin, (setmask >> pin) & 1)
+            changed ^= lowbit
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+        super().cleanup()
+
+class GpiodDriver(GPIODriver):
+    ''' Linux gpio character device. All pins on the chip are written with one request (one ioctl) '''
+    def __init__(self, chip="/dev/gpiochip0", consumer="stepper28byj"):
+        super().__init__()
+        import gpiod
+        self.gpiod = gpiod
+        self.chip = chip
+        self.consumer = consumer
+        self.request = None
+        self.v2 = hasattr(gpiod, "request_lines")     # libgpiod 2.x python bindings
+
+    def setup(self, pins):
+        super().setup(pins)
+        if self.request is not None:                  # Lines are requested together. Release and request again with the new pins
+            self.request.release()
+        if self.v2:
+            settings = self.gpiod.LineSettings(direction=self.gpiod.line.Direction.OUTPUT, output_value=self.gpiod.line.Value.INACTIVE)
+            self.request = self.gpiod.request_lines(self.chip, consumer=self.consumer, config={tuple(self.pins): settings})
+            self.values = (self.gpiod.line.Value.INACTIVE, self.gpiod.line.Value.ACTIVE)
+        else:
+            self.request = self.gpiod.Chip(self.chip).get_lines(self.pins)
+            self.request.request(consumer=self.consumer, type=self.gpiod.LINE_REQ_DIR_OUT, default_vals=[0] * len(self.pins))
+
+    def write(self, setmask, clrmask):
+        levels = (self.levels | setmask) & ~clrmask
+        if levels == self.levels:
+            return
+        self.levels = levels
+        if self.v2:
+            self.request.set_values({pin: self.values[(levels >> pin) & 1] for pin in self.pins})
+        else:
+            self.request.set_values([(levels >> pin) & 1 for pin in self.pins])
+
+    def cleanup(self):
+        if self.request is not None:
+            self.write(0, self.levels)
+            self.request.release()
+            self.request = None
+        super().cleanup()
+
+class SimGPIODriver(GPIODriver):
+    ''' In memory GPIO for testing/benchmarking anywhere. Ring buffer of (timestamp ns, pin levels) for the last capacity writes '''
+    def __init__(self, capacity=65536):
+        super().__init__()
+        self.capacity = capacity
+        self.times = array('q', bytes(8 * capacity))    # Preallocated so recording does not allocate
+        self.states = array('Q', bytes(8 * capacity))
+        self.count = 0                                   # Total writes since setup
+
+    def write(self, setmask, clrmask):
+        self.levels = (self.levels | setmask) & ~clrmask
+        k = self.count % self.capacity
+        self.times[k] = perf_counter_ns()
+        self.states[k] = self.levels
+        self.count += 1
+
+    def history(self):
+        ''' Recorded (timestamp ns, pin levels) oldest first '''
+        first = max(0, self.count - self.capacity)
+        return [(self.times[k % self.capacity], self.states[k % self.capacity]) for k in range(first, self.count)]
+
+def getdriver(driver="rpi"):
+    ''' Driver object from a name. A GPIODriver object is returned as is '''
+    if isinstance(driver, GPIODriver):
+        return driver
+    if driver == "rpi":
+        return RPiGPIODriver()
+    if driver == "gpiod":
+        return GpiodDriver()
+    if driver == "gpiomem":
+        from .gpiomem import GPIOMem
+        return GPIOMem()
+    if driver == "sim":
+        return SimGPIODriver()
+    raise ValueError("Unknown GPIO driver {0}. Use 'rpi', 'gpiod', 'gpiomem', 'sim' or a GPIODriver object".format(driver))
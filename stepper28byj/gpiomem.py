@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Register level GPIO output through /dev/gpiomem (BCM2835/BCM2711 GPIO block)
+
+All coil pins of all motors are set with one write to GPSET0 and cleared with one write to GPCLR0,
+so the cost per step does not grow with the number of motors.
+
+Any file of at least 4096 bytes can stand in for /dev/gpiomem for testing. EmulatedGPIOMem
+also keeps GPLEV0 up to date so the pin levels can be read back.
+"""
+
+import mmap
+import os
+from .gpiodriver import GPIODriver
+
+class GPIOMem(GPIODriver):
+    GPFSEL0 = 0x00   # Function select registers (3 bits per pin, 10 pins per register). 001 = output
+    GPSET0 = 0x1C    # Write 1 bits to set pins 0-31 HIGH
+    GPCLR0 = 0x28    # Write 1 bits to set pins 0-31 LOW
+    GPLEV0 = 0x34    # Pin levels 0-31
+    BLOCKSIZE = 4096
+
+    def __init__(self, path="/dev/gpiomem"):
+        super().__init__()
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        self.mem = mmap.mmap(self.fd, self.BLOCKSIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.regs = memoryview(self.mem).cast('I')   # 32 bit registers
+        self.setreg = self.GPSET0 // 4
+        self.clrreg = self.GPCLR0 // 4
+
+    def setup(self, pins):
+        ''' Set pins as outputs '''
+        for pin in pins:
+            if not 0 <= pin < 32:
+                raise ValueError("GPIO {0} is not in the GPSET0/GPCLR0 bank (0-31)".format(pin))
+            reg, shift = self.GPFSEL0 // 4 + pin // 10, (pin % 10) * 3
+            self.regs[reg] = (self.regs[reg] & ~(7 << shift)) | (1 << shift)
+        super().setup(pins)
+
+    def write(self, setmask, clrmask):
+        ''' Set and clear every coil pin of every motor. One register write each '''
+        self.regs[self.setreg] = setmask
+        self.regs[self.clrreg] = clrmask
+        self.levels = (self.levels | setmask) & ~clrmask
+
+    def level(self):
+        ''' Bitmask of pin levels (GPLEV0) '''
+        return self.regs[self.GPLEV0 // 4]
+
+    def cleanup(self):
+        ''' Turn the pins off, set them back to inputs and unmap '''
+        clrmask = 0
+        for pin in self.pins:
+            clrmask |= 1 << pin
+        self.write(0, clrmask)
+        for pin in self.pins:
+            reg, shift = self.GPFSEL0 // 4 + pin // 10, (pin % 10) * 3
+            self.regs[reg] = self.regs[reg] & ~(7 << shift)
+        super().cleanup()
+        self.regs.release()
+        self.mem.close()
+        os.close(self.fd)
+
+class EmulatedGPIOMem(GPIOMem):
+    ''' For testing with a plain file. SET/CLR writes also update GPLEV0 like the hardware would '''
+    def __init__(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) < self.BLOCKSIZE:
+            with open(path, "wb") as f:
+                f.write(bytes(self.BLOCKSIZE))
+        super().__init__(path)
+        self.levreg = self.GPLEV0 // 4
+
+    def write(self, setmask, clrmask):
+        super().write(setmask, clrmask)
+        self.regs[self.levreg] = (self.regs[self.levreg] | setmask) & ~clrmask & 0xFFFFFFFF
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Fixed memory latency histogram
+
+Log2 buckets split in 8 sub-buckets (about 12% resolution) from 1ns up to 2^39-1 ns (~9 minutes).
+Values below 16ns get a bucket each. Longer ones are counted in overflow and report as max. The bucket array is allocated once so record()
+can stay on in the step loop.
+"""
+
+from array import array
+
+SUBBITS = 3                     # 8 sub-buckets per power of 2
+SUB = 1 << SUBBITS
+SIZE = (40 - SUBBITS) * SUB     # Top bucket ends at 2^39-1 ns. Larger values are overflow
+
+class LogHistogram:
+    def __init__(self):
+        self.buckets = array('Q', bytes(8 * SIZE))
+        self.count = 0
+        self.overflow = 0       # Values past the last bucket
+        self.max = 0
+
+    def record(self, ns):
+        ''' Add one value (ns) '''
+        if ns < 2 * SUB:
+            self.buckets[ns if ns > 0 else 0] += 1
+        else:
+            shift = ns.bit_length() - SUBBITS - 1
+            k = shift * SUB + (ns >> shift)     # ns >> shift is 8-15. Top 4 bits of the value
+            if k < SIZE:
+                self.buckets[k] += 1
+            else:
+                self.overflow += 1
+        self.count += 1
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, pct):
+        ''' Value (ns) below which pct percent of the recorded values are. Upper edge of the bucket, never above max. max when it falls in the overflow '''
+        if not self.count:
+            return 0
+        rank = self.count * pct / 100
+        total = 0
+        for k in range(SIZE):
+            total += self.buckets[k]
+            if total >= rank and total:
+                return min(bucketlimit(k), self.max)
+        return self.max        # Rank is in the overflow
+
+    def reset(self):
+        for k in range(SIZE):
+            self.buckets[k] = 0
+        self.count = 0
+        self.overflow = 0
+        self.max = 0
+
+def bucketlimit(k):
+    ''' Largest value (ns) that goes in bucket k '''
+    if k < 2 * SUB:
+        return k
+    shift = k // SUB - 1
+    return ((k % SUB + SUB + 1) << shift) - 1
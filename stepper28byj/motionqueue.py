@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+Motion command queue. A whole program of moves runs back to back on the stepper thread
+
+    queue = MotionQueue(motor, thread=motorthread, onevent=print)
+    queue.push([{"cmd": "set_speed", "speed": 1000, "accel": 3000},
+                {"cmd": "move_by", "motor": 0, "steps": 4076, "id": "out"},
+                {"cmd": "move_by", "motor": 0, "steps": 2038},           # Same direction. Blends, no stop in between
+                {"cmd": "dwell", "ms": 500},
+                {"cmd": "move_to", "position": [0, 0], "id": "home"}])
+
+Commands (json friendly dicts, "id" is optional and comes back in the events)
+    move_by    "steps": [halfsteps per motor]  or "motor": i, "steps": halfsteps
+    move_to    "position": [position per motor] or "motor": i, "position": halfsteps. null/missing motors do not move
+    dwell      "ms": pause. Motors follow the controls meanwhile (ie stopped)
+    set_speed  "speed" (steps/sec, null = delay control), "accel", "jerk". Used by the moves after it
+    Moves can also have their own "speed", "accel", "jerk".
+
+The next move starts from the tick that finishes the last one (no idle ticks in between). When a move
+is started the queue looks ahead (LOOKAHEAD commands, up to a dwell) and plans the speed it ends at,
+so moves with acceleration do not slow down to a stop between them. The speed at the join is limited
+so no motor changes speed by more than the start speed (1000/STARTDELAY steps/sec), the same jump a
+move from a stop makes. Moving on in the same direction keeps speed, reversing a motor comes down to
+the start speed. The planner also makes sure every move can still slow down in time for the rest
+of the program.
+
+onevent(event) is called on the stepper thread after every command
+    {"event": "done", "id": ..., "cmd": "move_by", "position": [...]}
+and {"event": "idle", "position": [...]} when the queue runs out. Keep it short (ie append to a deque).
+"""
+
+from collections import deque
+from math import sqrt
+from time import perf_counter_ns
+
+LOOKAHEAD = 16
+COMMANDS = ("move_by", "move_to", "dwell", "set_speed")
+
+class Dwell:
+    ''' Pause in a program. Looks like a CoordinatedMove with no motors to Stepper.tick '''
+    def __init__(self, ms):
+        self.motors = []
+        self.stepping = []
+        self.untilns = perf_counter_ns() + int(ms * 1000000)
+        self.done = False
+        self.ondone = None
+
+    def advance(self):
+        self.done = perf_counter_ns() >= self.untilns
+
+def _number(command, name, low=0, whole=False, none=False):
+    value = command.get(name)
+    if value is None and none:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int if whole else (int, float)) or not low <= value < float("inf"):
+        raise ValueError("{0} {1} needs {2} >= {3}, got {4!r}".format(command.get("cmd"), name, "a whole number" if whole else "a number", low, value))
+    return value
+
+def parse(command, motors):
+    ''' Checked copy of one program command. ValueError if it is not valid '''
+    if not isinstance(command, dict) or command.get("cmd") not in COMMANDS:
+        raise ValueError("Program commands need a cmd of {0}, got {1!r}".format(", ".join(COMMANDS), command))
+    name = command["cmd"]
+    out = {"cmd": name, "id": command.get("id")}
+    if name in ("move_by", "move_to"):
+        key = "steps" if name == "move_by" else "position"
+        if "motor" in command:
+            motor = command["motor"]
+            if isinstance(motor, bool) or not isinstance(motor, int) or not 0 <= motor < motors:
+                raise ValueError("{0} motor must be 0-{1}, got {2!r}".format(name, motors - 1, motor))
+            values = {motor: command.get(key)}
+        else:
+            if not isinstance(command.get(key), list) or len(command[key]) != motors:
+                raise ValueError("{0} {1} needs a list of {2} values, got {3!r}".format(name, key, motors, command.get(key)))
+            values = {i: value for i, value in enumerate(command[key]) if value is not None}
+        for value in values.values():
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError("{0} {1} must be whole halfsteps, got {2!r}".format(name, key, value))
+        out["targets"] = values
+        for name2 in ("speed", "accel", "jerk"):
+            if name2 in command:
+                out[name2] = _number(command, name2, none=True)
+    elif name == "dwell":
+        out["ms"] = _number(command, "ms")
+    else:
+        for name2 in ("speed", "accel", "jerk"):
+            if name2 in command:
+                out[name2] = _number(command, name2, none=True)
+    if out.get("speed") == 0:
+        raise ValueError("{0} speed must be above 0 (or null for the delay control)".format(name))
+    return out
+
+class MotionQueue:
+    def __init__(self, stepper, thread=None, onevent=None):
+        self.stepper = stepper           # stepper28byj.Stepper
+        self.thread = thread             # StepperThread running the stepper. None = push/clear are called between ticks on the tick thread
+        self.onevent = onevent
+        self.pending = deque()           # Checked commands waiting. Only used on the stepper thread
+        self.current = None              # (command, CoordinatedMove or Dwell) running
+        self.settings = {"speed": None, "accel": 0, "jerk": 0}   # set_speed values for the following moves
+        self.entryspeed = None           # Speed the next move starts at (steps/sec). None = from a stop
+
+    def push(self, program):
+        ''' Add a list of commands to the end of the queue. All are checked first, ValueError and nothing is added if one is bad '''
+        commands = [parse(command, len(self.stepper.mach.stepper)) for command in program]
+        def push(motor):
+            self.pending.extend(commands)
+            self.next()
+        self._onthread(push)
+
+    def clear(self):
+        ''' Drop the waiting commands and stop the running move where it is (coils off) '''
+        def clear(motor):
+            self.pending.clear()
+            if self.current is not None:
+                command, move = self.current
+                self.current = None
+                self.entryspeed = None
+                motor.abortmove(move)
+        self._onthread(clear)
+
+    @property
+    def busy(self):
+        return self.current is not None or bool(self.pending)
+
+    def _onthread(self, fn):
+        if self.thread is not None:
+            self.thread.call(fn)
+        else:
+            fn(self.stepper)
+
+    def next(self, ran=False):
+        ''' Start the next command if nothing is running. Stepper thread only. ran = a command just finished '''
+        if self.current is not None:
+            return
+        stepper = self.stepper
+        while self.pending:
+            command = self.pending[0]
+            name = command["cmd"]
+            if name == "set_speed":
+                self.pending.popleft()
+                self.settings.update((key, command[key]) for key in ("speed", "accel", "jerk") if key in command)
+                self._event(command)
+                ran = True
+                continue
+            if name == "dwell":
+                self.pending.popleft()
+                move = Dwell(command["ms"])
+                self.entryspeed = None
+                move.ondone = self._finished
+                stepper.activemoves.append(move)
+                self.current = (command, move)
+                return
+            plan = self._plan()
+            self.pending.popleft()
+            deltas, speed, accel, jerk, endspeed = plan
+            if not any(deltas.values()):  # Already there
+                self._event(command)
+                ran = True
+                continue
+            try:
+                move = stepper.move_coordinated(deltas, speed, accel, jerk, self.entryspeed, endspeed)
+            except ValueError as e:       # A motor is busy with another move. Give up on the rest of the program
+                self.pending.clear()
+                self.entryspeed = None
+                if self.onevent is not None:
+                    self.onevent({"event": "error", "id": command["id"], "cmd": name, "error": str(e)})
+                return
+            self.entryspeed = endspeed
+            move.ondone = self._finished
+            self.current = (command, move)
+            return
+        self.entryspeed = None
+        if ran:
+            self._event({"event": "idle"})
+
+    def _finished(self, move):
+        ''' CoordinatedMove/Dwell ondone. Called by Stepper.tick at the end of the tick the move finished on '''
+        if self.current is None or self.current[1] is not move:
+            return
+        command = self.current[0]
+        self.current = None
+        self._event(command)
+        self.next(True)
+
+    def _event(self, command):
+        if self.onevent is not None:
+            positions = [motor.position for motor in self.stepper.mach.stepper]
+            if "event" in command:
+                self.onevent({"event": command["event"], "position": positions})
+            else:
+                self.onevent({"event": "done", "id": command["id"], "cmd": command["cmd"], "position": positions})
+
+    def _plan(self):
+        ''' (deltas, speed, accel, jerk, endspeed) for the first pending command (a move) looking ahead at the ones after it '''
+        stepper = self.stepper
+        rest = 1000 / stepper.STARTDELAY
+        positions = [motor.position for motor in stepper.mach.stepper]
+        settings = dict(self.settings)
+        window = []                      # (deltas, major, speed steps/sec, accel, jerk) of the moves coming up
+        for command in self.pending:
+            if len(window) == LOOKAHEAD:
+                break
+            name = command["cmd"]
+            if name == "dwell":          # Stops. Plan down to a stop here
+                break
+            if name == "set_speed":
+                settings.update((key, command[key]) for key in ("speed", "accel", "jerk") if key in command)
+                continue
+            deltas = {}
+            for i, target in command["targets"].items():
+                deltas[i] = target if name == "move_by" else target - positions[i]
+                positions[i] += deltas[i]
+            major = max(abs(d) for d in deltas.values()) if deltas else 0
+            if not major and window:     # Does not move. Makes no difference to the plan
+                continue
+            speed = command.get("speed", settings["speed"])
+            window.append((deltas, major, 1000 / stepper.movedelay(speed), command.get("accel", settings["accel"]) or 0, command.get("jerk", settings["jerk"]) or 0))
+        first = window[0]
+        if not first[3] or not first[1]:
+            return first[0], first[2], first[3], first[4], None
+        exitspeed = rest                 # Backward pass. Every move has to be able to slow down for the ones after it
+        for k in range(len(window) - 1, 0, -1):
+            deltas, major, speed, accel, jerk = window[k]
+            entry = self._junction(window[k - 1], window[k], rest)
+            if accel:
+                entry = min(entry, sqrt(exitspeed * exitspeed + 2 * accel * (major - 1)))
+            exitspeed = entry
+        startspeed = self.entryspeed or rest   # Forward. What the first move can reach from where it starts
+        endspeed = min(exitspeed, sqrt(startspeed * startspeed + 2 * first[3] * (first[1] - 1)), first[2])
+        return first[0], first[2], first[3], first[4], max(endspeed, rest)
+
+    @staticmethod
+    def _junction(before, after, rest):
+        ''' Highest speed (steps/sec) two moves can join at. Each motor's speed changes by at most rest (the start speed) '''
+        if not before[3] or not after[3] or not before[1] or not after[1]:   # No ramp on one side. Join from/to a stop
+            return rest
+        speed = min(before[2], after[2])
+        for i in set(before[0]) | set(after[0]):
+            change = abs(before[0].get(i, 0) / before[1] - after[0].get(i, 0) / after[1])   # Speed of motor i as a share of the move speed
+            if change * speed > rest:
+                speed = rest / change
+        return max(speed, rest)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Sleep-then-spin timer for sub millisecond step periods
+
+time.sleep wakes up late, 50-100 µs typically and several hundred µs now and then on a Pi, which
+is a big part of a 0.8 ms step. PreciseTimer sleeps until margin before an absolute deadline
+(perf_counter_ns) and spin-waits the rest
+
+    timer = PreciseTimer()                 # margin calibrated now
+    deadline = perf_counter_ns()
+    while True:
+        tick()
+        deadline += periodns               # From the last deadline, not from now. No drift
+        late = timer.sleepuntil(deadline)  # ns past the deadline when it returned
+
+The margin is calibrated by timing CALIBRATIONS sleeps of CALIBRATENS (after WARMUP) and taking the PERCENTILE
+overshoot (capped at MAXMARGIN), so most sleeps wake before the deadline and the spin is short.
+PreciseTimer(margin=0) only sleeps (no spin). The spin holds the GIL and a cpu for up to the margin
+every step, which is the price of the accuracy. Stepper(timer='sleep') turns it off.
+"""
+
+from time import sleep, perf_counter_ns
+
+CALIBRATENS = 500000       # Sleep timed during calibration (ns)
+CALIBRATIONS = 100
+PERCENTILE = 80
+WARMUP = 10                # Sleeps not counted. The first few after a quiet spell wake up slowest
+MAXMARGIN = 1000000        # Longest spin (ns)
+
+def calibrate(samples=CALIBRATIONS, sleepns=CALIBRATENS, percentile=PERCENTILE):
+    ''' Margin (ns) the sleep should stop short of a deadline by. Takes about samples * sleepns '''
+    overshoots = []
+    for x in range(WARMUP + samples):
+        t0 = perf_counter_ns()
+        sleep(sleepns / 1000000000)
+        overshoots.append(perf_counter_ns() - t0 - sleepns)
+    overshoots = sorted(overshoots[WARMUP:])
+    return min(overshoots[min(len(overshoots) - 1, len(overshoots) * percentile // 100)], MAXMARGIN)
+
+class PreciseTimer:
+    def __init__(self, margin=None):
+        self.margin = calibrate() if margin is None else margin   # Spin the last margin ns before a deadline
+        self.late = 0          # Sleeps that went past the deadline (margin too small that time)
+        self.spinns = 0        # Total time spun (ns)
+
+    def sleepuntil(self, deadline):
+        ''' Return at deadline (perf_counter_ns). Returns how late (ns) it actually was, 0 or more '''
+        tnow = perf_counter_ns()
+        wait = deadline - tnow - self.margin
+        if wait > 0:
+            sleep(wait / 1000000000)
+            tnow = perf_counter_ns()
+        if tnow >= deadline:
+            if wait > 0:       # The sleep alone went past the deadline. Margin too small for this one
+                self.late += 1
+            return tnow - deadline
+        spin = tnow
+        while tnow < deadline:
+            tnow = perf_counter_ns()
+        self.spinns += tnow - spin
+        return tnow - deadline
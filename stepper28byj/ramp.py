@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""
+Trapezoidal acceleration/deceleration ramps
+
+Speeds are in steps/sec (coil transitions/sec), acceleration in steps/sec^2 and delays in ms
+to match the node-red "delay" control. A step sent at speed v is followed by a 1000/v ms pause.
+
+Trapezoid is a move's delays worked out one step at a time in closed form, ramp[k] is the pause after step k.
+SCurve is a jerk limited (7 segment) move for loads that resonate when acceleration changes abruptly.
+Its delays come from integrating the move step by step. Each one is worked out the first time it is
+read and kept, so a repeat of the move only indexes them.
+Both are planned in constant time, so starting a long move on the step thread costs nothing.
+profile() picks one and caches it by its arguments (jobs repeat the same moves). The S-curves it
+keeps fill at most CACHESTEPS delays between them.
+trapezoid()/scurve() fill a whole delay array when one is wanted.
+accelerate()/decelerate() give the next speed for continuous mode where the distance is unknown.
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+from math import sqrt
+
+CACHESTEPS = 1 << 20       # Worked out S-curve delays kept by the profile() cache (8 bytes each)
+CACHESIZE = 256            # Ramps kept by the profile() cache
+
+class Trapezoid:
+    def __init__(self, distance, maxspeed, accel, startspeed, endspeed=None):
+        ''' Ramp up from startspeed to maxspeed, cruise, ramp down to endspeed over distance steps '''
+        endspeed = startspeed if endspeed is None else endspeed
+        if startspeed <= 0 or endspeed <= 0:
+            raise ValueError("Start and end speed must be above 0 steps/sec")
+        startspeed, endspeed = min(startspeed, maxspeed), min(endspeed, maxspeed)
+        self.distance = distance
+        self.accel = accel
+        self.v0sq, self.v1sq, self.vmaxsq = startspeed * startspeed, endspeed * endspeed, maxspeed * maxspeed
+
+    def __len__(self):
+        return self.distance
+
+    def __getitem__(self, k):
+        ''' Pause (ms) after step k '''
+        if not 0 <= k < self.distance:
+            raise IndexError("step {0} is outside the {1} step ramp".format(k, self.distance))
+        vsq = min(self.vmaxsq, self.v0sq + 2 * self.accel * k, self.v1sq + 2 * self.accel * (self.distance - 1 - k))   # Speed limited by the accel ramp, cruise and the decel ramp
+        return 1000 / sqrt(vsq)
+
+def trapezoid(distance, maxspeed, accel, startspeed, endspeed=None):
+    ''' Per step delays (ms) to move distance steps as an array. See Trapezoid '''
+    return array('d', Trapezoid(distance, maxspeed, accel, startspeed, endspeed))
+
+def accelerate(speed, accel, maxspeed):
+    ''' Speed after one more step at accel. Never above maxspeed '''
+    return min(sqrt(speed * speed + 2 * accel), maxspeed)
+
+def decelerate(speed, accel, minspeed):
+    ''' Speed after one more step slowing down at accel. Never below minspeed '''
+    return max(sqrt(max(speed * speed - 2 * accel, 0)), minspeed)
+
+class SCurve:
+    def __init__(self, distance, maxspeed, accel, jerk, startspeed, endspeed=None):
+        ''' Acceleration ramps up/down at jerk (steps/sec^3) and never exceeds accel '''
+        endspeed = startspeed if endspeed is None else endspeed
+        if startspeed <= 0 or endspeed <= 0:
+            raise ValueError("Start and end speed must be above 0 steps/sec")
+        startspeed, endspeed = min(startspeed, maxspeed), min(endspeed, maxspeed)
+        peak = maxspeed
+        if _scurvedistance(startspeed, peak, accel, jerk) + _scurvedistance(endspeed, peak, accel, jerk) > distance:
+            low, high = max(startspeed, endspeed), maxspeed    # Too short to reach maxspeed. Find the highest peak speed that fits
+            for x in range(40):
+                peak = (low + high) / 2
+                if _scurvedistance(startspeed, peak, accel, jerk) + _scurvedistance(endspeed, peak, accel, jerk) > distance:
+                    high = peak
+                else:
+                    low = peak
+            peak = low
+        cruise = distance - _scurvedistance(startspeed, peak, accel, jerk) - _scurvedistance(endspeed, peak, accel, jerk)
+        # 7 segments as (duration sec, jerk). Jerk up, constant accel, jerk down, cruise, then the mirror image to slow down.
+        # Last entry holds the end speed in case rounding leaves part of a step after the 7th segment.
+        t1, t2 = _scurvetimes(startspeed, peak, accel, jerk)
+        t5, t6 = _scurvetimes(endspeed, peak, accel, jerk)
+        self.segments = ((t1, jerk), (t2, 0), (t1, -jerk), (cruise / peak, 0), (t5, -jerk), (t6, 0), (t5, jerk), (float("inf"), 0))
+        self.distance = distance
+        self.v, self.a, self.seg = startspeed, 0.0, 0
+        self.left, self.j = self.segments[0]      # Time left in the current segment and its jerk
+        self.delays = array('d')                  # Delays worked out so far
+        self.lock = threading.Lock()              # Shared by moves on different threads. One extends the delays at a time
+
+    def __len__(self):
+        return self.distance
+
+    def __getitem__(self, k):
+        ''' Pause (ms) after step k. Worked out (one step of work each) the first time it is read '''
+        delays = self.delays
+        if 0 <= k < len(delays):
+            return delays[k]
+        if not 0 <= k < self.distance:
+            raise IndexError("step {0} is outside the {1} step ramp".format(k, self.distance))
+        with self.lock:
+            while len(delays) <= k:
+                delays.append(self.nextdelay())
+        return delays[k]
+
+    def nextdelay(self):
+        ''' Integrate the move over one more step. Returns the time it took (ms) '''
+        v, a, j, left = self.v, self.a, self.j, self.left
+        remaining, steptime = 1.0, 0.0             # Distance (steps) left to the next step and time taken so far
+        while True:
+            dt = remaining / v                     # Solve v*dt + a*dt^2/2 + j*dt^3/6 = remaining with Newton
+            for x in range(6):
+                dt -= (v*dt + a*dt*dt/2 + j*dt*dt*dt/6 - remaining) / (v + a*dt + j*dt*dt/2)
+            if dt <= left:                         # Step lands inside this segment
+                v, a, left = v + a*dt + j*dt*dt/2, a + j*dt, left - dt
+                steptime += dt
+                break
+            dt = left                              # Segment ends before the step. Move to the segment boundary and carry on
+            remaining -= v*dt + a*dt*dt/2 + j*dt*dt*dt/6
+            v, a = v + a*dt + j*dt*dt/2, a + j*dt
+            steptime += dt
+            self.seg += 1
+            left, j = self.segments[self.seg]
+            if self.seg in (3, 7):                 # Acceleration is zero on cruise and at the end. Stops rounding errors adding up.
+                a = 0.0
+        self.v, self.a, self.j, self.left = v, a, j, left
+        return steptime * 1000
+
+def scurve(distance, maxspeed, accel, jerk, startspeed, endspeed=None):
+    ''' Per step delays (ms) for a jerk limited move as an array. See SCurve '''
+    return array('d', SCurve(distance, maxspeed, accel, jerk, startspeed, endspeed))
+
+_profiles = OrderedDict()  # Arguments -> ramp, least recently used first
+
+def profile(distance, maxspeed, accel, startspeed, endspeed=None, jerk=0):
+    ''' Delays for a move, worked out as they are read. SCurve when jerk is set, otherwise Trapezoid.
+        Cached, the same arguments give the same ramp object. Shared between moves so do not modify it '''
+    key = (distance, maxspeed, accel, startspeed, endspeed, jerk)
+    ramp = _profiles.get(key)
+    if ramp is not None:
+        _profiles.move_to_end(key)
+        return ramp
+    ramp = SCurve(distance, maxspeed, accel, jerk, startspeed, endspeed) if jerk else Trapezoid(distance, maxspeed, accel, startspeed, endspeed)
+    if distance <= CACHESTEPS:             # Longer ones would push everything else out
+        _profiles[key] = ramp
+        kept = sum(len(cached) for cached in _profiles.values() if isinstance(cached, SCurve))   # Most delays they can fill
+        while kept > CACHESTEPS or len(_profiles) > CACHESIZE:
+            key, dropped = _profiles.popitem(last=False)
+            kept -= len(dropped) if isinstance(dropped, SCurve) else 0
+    return ramp
+
+def _scurvetimes(vfrom, vto, accel, jerk):
+    ''' Jerk time and constant acceleration time to change speed from vfrom to vto '''
+    dv = vto - vfrom
+    if dv <= 0:
+        return 0.0, 0.0
+    if dv >= accel * accel / jerk:      # Reaches max acceleration
+        return accel / jerk, dv / accel - accel / jerk
+    return sqrt(dv / jerk), 0.0          # Triangle acceleration. Never reaches max acceleration
+
+def _scurvedistance(vfrom, vto, accel, jerk):
+    ''' Steps taken to change speed from vfrom to vto. Symmetric S-curve so average speed is the midpoint '''
+    t1, t2 = _scurvetimes(vfrom, vto, accel, jerk)
+    return (vfrom + vto) / 2 * (2 * t1 + t2)
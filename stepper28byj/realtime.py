@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+Real-time mode for the step loop. Opt in, Linux only
+
+    motorthread = StepperThread(motor, controls, realtime=Realtime(priority=50))
+
+Applied on the stepper thread when it starts
+    SCHED_FIFO  priority 1-99. The step loop runs ahead of every normal process when its sleep ends
+    cpu         pins the thread. None = the last isolated cpu (isolcpus=3 on the kernel command line
+                in /boot/cmdline.txt keeps everything else off it), or the last cpu if none are isolated
+    mlockall    MCL_CURRENT|MCL_FUTURE. No page faults from swapped out or lazily mapped memory.
+                The thread stack is mapped when the thread starts so it is locked (faulted in) with the rest
+    prefault    glibc malloc told not to give memory back (no trim, no mmap for big blocks), then
+                prefault bytes are allocated, touched and freed so the heap has resident pages ready
+Each step falls back on its own. Without permission (not root, no CAP_SYS_NICE/CAP_IPC_LOCK, no rtprio
+in /etc/security/limits.conf) it logs a warning and carries on. getdata() reports what is in effect
+    rtprioi    SCHED_FIFO priority, 0 = normal scheduling
+    rtcpui     cpu the loop is pinned to, -1 = not pinned
+    rtlockedi  1 = memory locked
+"""
+
+import ctypes
+import ctypes.util
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+M_TRIM_THRESHOLD = -1   # glibc mallopt
+M_MMAP_MAX = -4
+OFF = {"rtprioi": 0, "rtcpui": -1, "rtlockedi": 0}   # getdata() without real-time mode
+
+def isolatedcpus():
+    ''' cpus taken out of the scheduler with isolcpus= (empty if none or not Linux) '''
+    try:
+        with open("/sys/devices/system/cpu/isolated") as f:
+            text = f.read().strip()
+    except OSError:
+        return []
+    cpus = []
+    for part in filter(None, text.split(",")):
+        low, _, high = part.partition("-")
+        cpus.extend(range(int(low), int(high or low) + 1))
+    return cpus
+
+@dataclass
+class Realtime:
+    priority: int = 50                 # SCHED_FIFO priority asked for. 0 = leave the scheduler alone
+    cpu: Optional[int] = None          # cpu asked for. None = pick one (see module docstring), -1 = do not pin
+    lockmemory: bool = True
+    prefault: int = 8 * 1024 * 1024    # Heap bytes to touch
+    fifo: int = 0                      # In effect after apply()
+    pinned: int = -1
+    locked: bool = False
+    errors: List[str] = field(default_factory=list)
+
+    def apply(self, logger=None):
+        ''' Set up the calling thread. Never raises for missing permissions, see errors '''
+        self.errors = []
+        if self.priority:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))   # 0 = this thread on Linux
+                self.fifo = self.priority
+            except (OSError, AttributeError) as e:
+                self.errors.append("SCHED_FIFO {0}: {1}".format(self.priority, e))
+        cpu = self.cpu
+        if cpu is None and hasattr(os, "sched_getaffinity"):
+            isolated = isolatedcpus()
+            cpu = isolated[-1] if isolated else max(os.sched_getaffinity(0))
+        if cpu is not None and cpu >= 0:
+            try:
+                os.sched_setaffinity(0, {cpu})
+                self.pinned = cpu
+            except (OSError, AttributeError) as e:
+                self.errors.append("cpu {0}: {1}".format(cpu, e))
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if self.lockmemory:
+            try:
+                if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+                    raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+                self.locked = True
+            except (OSError, AttributeError) as e:
+                self.errors.append("mlockall: {0}".format(e))
+        if self.prefault:
+            try:
+                if not (libc.mallopt(M_TRIM_THRESHOLD, -1) and libc.mallopt(M_MMAP_MAX, 0)):
+                    raise OSError("mallopt refused")
+            except (OSError, AttributeError) as e:       # Not glibc. The touched pages may go back to the system
+                self.errors.append("prefault: {0}".format(e))
+            heap = bytearray(self.prefault)      # Zeroed, so every page is written
+            del heap
+        if logger is not None:
+            logger.info("Real-time mode: SCHED_FIFO {0}, cpu {1}, memory {2}".format(self.fifo or "off", self.pinned if self.pinned >= 0 else "any", "locked" if self.locked else "not locked"))
+            for error in self.errors:
+                logger.warning("Real-time mode fallback. {0}".format(error))
+        return self
+
+    def getdata(self):
+        return {"rtprioi": self.fifo, "rtcpui": self.pinned, "rtlockedi": int(self.locked)}
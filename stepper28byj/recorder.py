@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+Binary step recorder for finding missed steps after the fact
+
+Every coil pattern sent to the pins is stored as a fixed width record
+    timens    int64   perf_counter_ns when the motor stepped
+    position  int64   absolute position (halfsteps) after the step
+    motor     uint16  motor index
+    coils     uint16  coil pattern bitmask. Bit 0 = IN1 ... bit 3 = IN4. 0 = coils off
+in a preallocated ring buffer (bytearray) holding the last capacity records.
+
+    motor = stepper28byj.Stepper(m1pins, m2pins, recorder=StepRecorder(faultpath="/tmp/steps.bin"))
+    motor.recorder.dump("/tmp/steps.bin")        # on demand
+With faultpath set the last faultrecords records are also dumped on the first deadline miss (see
+Stepper.MISSNS) and when the stepper thread dies. The tick only copies them (330 kB for the default,
+well under a step) and a background thread writes the file. rearm() allows the next fault dump, no
+sooner than FAULTINTERVAL after the last one.
+
+File is a 16 byte header (magic, record size) followed by the records oldest first.
+    read(path)     numpy structured array in one call (needs numpy)
+    records(path)  list of (timens, position, motor, coils) tuples, no numpy needed
+"""
+
+import struct
+import threading
+from time import perf_counter_ns
+
+MAGIC = b"STPTRC1\0"
+RECORD = struct.Struct("<qqHH")
+HEADER = struct.Struct("<8sII")      # magic, record size, reserved
+DTYPE = [("timens", "<i8"), ("position", "<i8"), ("motor", "<u2"), ("coils", "<u2")]
+FAULTRECORDS = 1 << 14       # Records copied for a fault dump. 6.5 s of 2 motors at 1250 steps/sec
+FAULTINTERVAL = 10000000000  # Shortest time between fault dumps (ns)
+
+class StepRecorder:
+    def __init__(self, capacity=1 << 20, faultpath=None, faultrecords=FAULTRECORDS):
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)   # Preallocated. Oldest records are overwritten
+        self.count = 0                                    # Total records since start
+        self.faultpath = faultpath                        # Dump here on a fault. None = only dump on demand
+        self.armed = True                                 # Only the first fault is dumped until rearm()
+        self.faultrecords = faultrecords                  # Records leading up to a fault that are dumped
+        self.faultns = None                               # perf_counter_ns of the last fault dump
+        self.writer = None                                # Thread writing the last fault dump
+
+    def record(self, timens, motor, coils, position):
+        RECORD.pack_into(self.buffer, (self.count % self.capacity) * RECORD.size, timens, position, motor, coils)
+        self.count += 1
+
+    def chunks(self, records=None):
+        ''' Views of the last records records (all buffered when None), oldest first '''
+        count = min(self.count, self.capacity, self.capacity if records is None else records)
+        view = memoryview(self.buffer)
+        end = (self.count % self.capacity) * RECORD.size
+        start = end - count * RECORD.size
+        if start >= 0:
+            return [view[start:end]]
+        return [view[start + len(self.buffer):], view[:end]]   # Wrapped. Oldest records are at the end of the buffer
+
+    def dump(self, path):
+        ''' Write the buffered records to path, oldest first. Returns the number of records written '''
+        return _write(path, self.chunks())
+
+    def fault(self):
+        ''' Dump the last faultrecords to faultpath once. Called by the Stepper on a deadline miss and by StepperThread on an error.
+            Copies them here and writes them on a background thread '''
+        if not self.armed or self.faultpath is None:
+            return
+        tnow = perf_counter_ns()
+        if self.faultns is not None and tnow - self.faultns < FAULTINTERVAL or self.writer is not None and self.writer.is_alive():
+            return             # Too soon after the last dump. Stays armed
+        self.armed = False
+        self.faultns = tnow
+        snapshot = [bytes(chunk) for chunk in self.chunks(self.faultrecords)]   # Recording carries on over the buffer
+        self.writer = threading.Thread(target=_write, args=(self.faultpath, snapshot), name="stepper-recorder", daemon=True)
+        self.writer.start()
+
+    def wait(self, timeout=None):
+        ''' Wait for a fault dump to finish writing '''
+        if self.writer is not None:
+            self.writer.join(timeout)
+
+    def rearm(self):
+        self.armed = True
+
+def _write(path, chunks):
+    ''' Header then the record bytes. Returns the number of records written '''
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, RECORD.size, 0))
+        for chunk in chunks:
+            f.write(chunk)
+    return sum(len(chunk) for chunk in chunks) // RECORD.size
+
+def _checkheader(f, path):
+    magic, size, reserved = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError("{0} is not a step recorder file".format(path))
+
+def read(path):
+    ''' All records in a numpy structured array (fields timens, position, motor, coils) '''
+    import numpy as np
+    with open(path, "rb") as f:
+        _checkheader(f, path)
+        return np.fromfile(f, dtype=np.dtype(DTYPE))
+
+def records(path):
+    ''' All records as (timens, position, motor, coils) tuples '''
+    with open(path, "rb") as f:
+        _checkheader(f, path)
+        return list(RECORD.iter_unpack(f.read()))
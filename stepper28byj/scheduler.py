@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Per motor step deadlines for Stepper(..., scheduler='heap')
+
+Lockstep (default) steps every motor on every loop and pauses for the slowest motor's delay.
+With the heap scheduler each motor has its own next step deadline in a min-heap. A loop
+steps only the motors that are due and then pauses until the earliest deadline, so a slow
+full step motor no longer slows down a fast halfstep motor next to it.
+
+Deadlines are schedule time (ns), not wall clock. The caller sleeps the returned delay
+(Stepper.step or StepperThread), same as in lockstep.
+"""
+
+from heapq import heappush, heappop
+
+class DeadlineScheduler:
+    def __init__(self, count):
+        self.clock = 0                                   # Schedule time (ns) of the current loop
+        self.deadline = [0 for i in range(count)]        # Next step time (ns) of each motor
+        self.heap = [(0, i) for i in range(count)]       # (deadline, motor). Old entries are skipped when popped
+        self.due = []                                    # Motors stepping this loop. Reused every loop
+
+    def pop(self):
+        ''' Motors due on this loop. The clock moves to the earliest deadline '''
+        heap, deadline, due = self.heap, self.deadline, self.due
+        due.clear()
+        self._dropstale()
+        clock = self.clock = heap[0][0]
+        while heap and heap[0][0] <= clock:
+            t, i = heappop(heap)
+            if t == deadline[i]:
+                due.append(i)
+                deadline[i] = -1                         # Stepping now. Any duplicate entry is stale until push()
+        return due
+
+    def push(self, i, interval):
+        ''' Motor i steps again interval ms after this loop '''
+        t = self.deadline[i] = self.clock + int(interval * 1000000)
+        heappush(self.heap, (t, i))
+
+    def wait(self):
+        ''' Pause (ms) from this loop until the next motor is due '''
+        self._dropstale()
+        return (self.heap[0][0] - self.clock) / 1000000
+
+    def sync(self, motors):
+        ''' Put motors on the same deadline (the earliest of them). Used when they start a coordinated move '''
+        t = min(self.deadline[i] for i in motors)
+        for i in motors:
+            if self.deadline[i] != t:
+                self.deadline[i] = t
+                heappush(self.heap, (t, i))
+
+    def _dropstale(self):
+        heap, deadline = self.heap, self.deadline
+        while heap[0][0] != deadline[heap[0][1]]:
+            heappop(heap)
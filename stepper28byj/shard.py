@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Motors split across worker processes. Each worker has its own GIL and is pinned to its own core
+
+    supervisor = ShardSupervisor([m1pins, m2pins, m3pins, m4pins], controls, shards=2)
+    supervisor.start()
+    supervisor.setcontrols(controls)       # Same calls as StepperThread
+    data = supervisor.getdata()            # datakeys(4) keys, numbered across all the motors
+    supervisor.stop()
+
+Every worker runs a Stepper and StepperThread step loop for its motors (motors are dealt out in order,
+shard 0 gets the first ones). Commands and status go through one multiprocessing.shared_memory block
+with a fixed layout, nothing is pickled after start
+    int64   header  version, motors, shards, commandseq, resetseq, stop
+    int64   statusseq per shard
+    float64 commands  delay[2], then per motor speed, mode, inverse, step, startstep, accel, startdelay, jerk (nan = not set)
+    float64 status    per shard the telemetry MACHINEKEYS, then per motor the telemetry MOTORKEYS
+commands and each shard's status are seqlocks. The one writer makes the sequence odd, writes, then makes
+it even. A reader copies the values and tries again if the sequence was odd or changed while it read.
+The supervisor is the only command writer, each worker the only writer of its own status.
+
+Workers check commandseq (one read) before every step and get new controls only when it changed,
+so a new commandseq is a new controls object to Stepper.tick (startstep starts one move, like mqtt).
+Status is written every STATUSNS. Idle workers (every motor stopped) block on a multiprocessing.Event
+the supervisor sets with every command, waking every STATUSNS for status and stop. Moves, motion programs and call() stay with a single process StepperThread.
+realtime=Realtime() runs every worker's step loop SCHED_FIFO with memory locked (see realtime.py).
+Each worker opens its own GPIO driver, so give it a driver name (or a picklable factory). RPi.GPIO,
+gpiod and gpiomem are fine from several processes on different pins. Expanders need a chip per shard.
+"""
+
+import logging
+import multiprocessing
+import os
+from dataclasses import replace
+from math import isnan, nan
+from multiprocessing import shared_memory
+from time import perf_counter_ns
+from .Mstep28byjuln2003 import Stepper
+from .stepperthread import StepperThread
+from .telemetry import MACHINEKEYS, MOTORKEYS
+
+VERSION = 1
+HEADER = ("version", "motors", "shards", "commandseq", "resetseq", "stop")
+COMMANDS = ("speed", "mode", "inverse", "step", "startstep", "accel", "startdelay", "jerk")
+OPTIONAL = ("accel", "startdelay", "jerk")
+STATUSNS = 20000000    # Worker status update period (ns)
+
+class ShardBlock:
+    ''' Fixed layout view of the shared memory block (see module docstring) '''
+    def __init__(self, buf, motors, shards):
+        self.motors = motors
+        self.shards = shards
+        nints = len(HEADER) + shards
+        self.ints = buf[:8 * nints].cast("q")
+        self.floats = buf[8 * nints:8 * nints + 8 * self.nfloats(motors, shards)].cast("d")
+        self.status0 = 2 + motors * len(COMMANDS)   # First status float
+
+    @staticmethod
+    def nfloats(motors, shards):
+        return 2 + motors * len(COMMANDS) + shards * len(MACHINEKEYS) + motors * len(MOTORKEYS)
+
+    @classmethod
+    def size(cls, motors, shards):
+        ''' Bytes needed '''
+        return 8 * (len(HEADER) + shards + cls.nfloats(motors, shards))
+
+    def release(self):
+        ''' Drop the views so the shared memory can be closed '''
+        self.ints.release()
+        self.floats.release()
+
+    def header(self, name):
+        return self.ints[HEADER.index(name)]
+
+    def setheader(self, name, value):
+        self.ints[HEADER.index(name)] = value
+
+    def writecontrols(self, controls):
+        ''' Supervisor side. Controls dict for every motor '''
+        seq = HEADER.index("commandseq")
+        floats = self.floats
+        self.ints[seq] += 1                # Odd. Workers wait
+        floats[0], floats[1] = controls["delay"][0], controls["delay"][1]
+        n = 2
+        for i in range(self.motors):
+            for name in COMMANDS:
+                values = controls.get(name)
+                floats[n] = values[i] if values is not None else nan
+                n += 1
+        self.ints[seq] += 1                # Even. Done
+
+    def readcontrols(self, motors):
+        ''' Worker side. (commandseq, controls dict for the motor numbers in motors) '''
+        seq = HEADER.index("commandseq")
+        while True:
+            before = self.ints[seq]
+            if before & 1:
+                continue
+            values = self.floats[:self.status0].tolist()
+            if self.ints[seq] == before:
+                break
+        controls = {"delay": values[:2]}
+        for k, name in enumerate(COMMANDS):
+            column = [values[2 + i * len(COMMANDS) + k] for i in motors]
+            if name in OPTIONAL:
+                if not any(isnan(value) for value in column):
+                    controls[name] = column
+            elif name == "inverse":
+                controls[name] = [bool(value) for value in column]
+            else:
+                controls[name] = [int(value) for value in column]
+        return before, controls
+
+    def _statusslots(self, shard, motors):
+        ''' Float index of each shard key then each (motor key, motor) in motors '''
+        slots = [self.status0 + shard * len(MACHINEKEYS) + k for k in range(len(MACHINEKEYS))]
+        motor0 = self.status0 + self.shards * len(MACHINEKEYS)
+        for k in range(len(MOTORKEYS)):
+            slots.extend(motor0 + i * len(MOTORKEYS) + k for i in motors)
+        return slots
+
+    def writestatus(self, shard, motors, data):
+        ''' Worker side. getdata() of the shard's Stepper. Its motors are numbered from 0 in data '''
+        seq = len(HEADER) + shard
+        keys = list(MACHINEKEYS) + [key.format(j) for key in MOTORKEYS for j in range(len(motors))]
+        self.ints[seq] += 1
+        for slot, key in zip(self._statusslots(shard, motors), keys):
+            self.floats[slot] = data.get(key, 0)
+        self.ints[seq] += 1
+
+    def readstatus(self, shard, motors):
+        ''' Supervisor side. Status values of one shard in _statusslots order '''
+        seq = len(HEADER) + shard
+        slots = self._statusslots(shard, motors)
+        while True:
+            before = self.ints[seq]
+            if before & 1:
+                continue
+            values = [self.floats[slot] for slot in slots]
+            if self.ints[seq] == before:
+                return values
+
+def _worker(shmname, shard, motors, pins, driver, cpu, realtime, wake):
+    ''' Worker process. Steps its motors until the stop flag is set or the supervisor goes away '''
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    logger = logging.getLogger("stepper28byj.shard{0}".format(shard))
+    parent = os.getppid()
+    shm = shared_memory.SharedMemory(shmname)
+    header = shm.buf[:8 * len(HEADER)].cast("q")   # Block size comes from the header
+    block = ShardBlock(shm.buf, header[HEADER.index("motors")], header[HEADER.index("shards")])
+    header.release()
+    motor = Stepper(*pins, logger=logger, driver=driver() if callable(driver) else driver)
+    seq, controls = block.readcontrols(motors)
+    if realtime is not None and realtime.cpu is None:   # Real-time on the cpu the worker is pinned to
+        realtime = replace(realtime, cpu=cpu if cpu is not None else -1)
+    thread = StepperThread(motor, controls, logger=logger, realtime=realtime)
+    state = {"seq": seq, "reset": block.header("resetseq"), "statusns": 0}
+    commandseq = HEADER.index("commandseq")
+    ints = block.ints
+
+    def poll():
+        ''' Before every step. New controls, step resets, status, stop '''
+        if ints[commandseq] != state["seq"]:
+            state["seq"], controls = block.readcontrols(motors)
+            thread.setcontrols(controls)
+        tnow = perf_counter_ns()
+        if tnow - state["statusns"] > STATUSNS:
+            state["statusns"] = tnow
+            reset = block.header("resetseq")
+            if reset != state["reset"]:
+                state["reset"] = reset
+                motor.resetsteps()
+            block.writestatus(shard, motors, thread.getdata())
+            if block.header("stop") or os.getppid() != parent:
+                thread.running.clear()
+
+    thread.poll = poll
+    thread.wake = wake                    # Set by the supervisor with every command. Idle workers block on it
+    thread.idlewait = STATUSNS / 1000000000   # Idle workers still check stop/parent and write status
+    try:
+        thread.run()             # Step loop on this process's main thread
+    finally:
+        motor.cleanupGPIO()
+        block.release()
+        shm.close()
+
+class ShardSupervisor:
+    def __init__(self, motorpins, controls, shards=None, driver="sim", cpus=None, logger=None, realtime=None):
+        self.motorpins = [list(pins) for pins in motorpins]
+        self.motors = len(self.motorpins)
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        if cpus is None:         # Leave the first cpu for the supervisor (mqtt, telemetry)
+            cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+            cpus = cpus[1:] or cpus
+        self.cpus = list(cpus)
+        if shards is None:
+            shards = min(self.motors, len(self.cpus))
+        if not 1 <= shards <= self.motors:
+            raise ValueError("shards must be 1-{0} for {1} motors, got {2}".format(self.motors, self.motors, shards))
+        self.shards = shards
+        self.driver = driver     # GPIO driver name (or picklable factory) each worker opens
+        self.realtime = realtime # realtime.Realtime for every worker's step loop. cpu None = the worker's cpu
+        per, extra = divmod(self.motors, shards)   # Motor numbers of each shard. The first ones get one more when they do not divide evenly
+        self.shardmotors = []
+        start = 0
+        for k in range(shards):
+            end = start + per + (k < extra)
+            self.shardmotors.append(list(range(start, end)))
+            start = end
+        self.shm = shared_memory.SharedMemory(create=True, size=ShardBlock.size(self.motors, shards))
+        self.block = ShardBlock(self.shm.buf, self.motors, shards)
+        self.block.setheader("version", VERSION)
+        self.block.setheader("motors", self.motors)
+        self.block.setheader("shards", shards)
+        self.block.writecontrols(controls)
+        self.processes = []
+        self.wakes = []          # multiprocessing.Event per worker. Wakes it from idle
+        self.outgoing = {}
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")   # Fresh interpreter. Nothing (GPIO handles, threads) inherited from the supervisor
+        for k, motors in enumerate(self.shardmotors):
+            cpu = self.cpus[k % len(self.cpus)] if self.cpus else None
+            self.wakes.append(context.Event())
+            process = context.Process(target=_worker, name="stepper-shard{0}".format(k), daemon=True,
+                                      args=(self.shm.name, k, motors, [self.motorpins[i] for i in motors], self.driver, cpu, self.realtime, self.wakes[k]))
+            process.start()
+            self.processes.append(process)
+        self.logger.info("{0} motors on {1} worker processes, cpus {2}".format(self.motors, self.shards, self.cpus))
+
+    def setcontrols(self, controls):
+        ''' New controls for every motor. Workers pick them up before their next step '''
+        self.block.writecontrols(controls)
+        self.wakeall()
+
+    def resetsteps(self):
+        ''' Reset the step counters on every shard (within STATUSNS) '''
+        self.block.setheader("resetseq", self.block.header("resetseq") + 1)
+        self.wakeall()
+
+    def wakeall(self):
+        for wake in self.wakes:
+            wake.set()
+
+    def getdata(self):
+        ''' Status of every shard as one datakeys(motors) dict. main_msf is the slowest shard's step period, idlei 1 when all are idle '''
+        out = self.outgoing
+        for k, motors in enumerate(self.shardmotors):
+            values = iter(self.block.readstatus(k, motors))
+            for key in MACHINEKEYS:
+                value = next(values)
+                if k == 0 or (key == "main_msf" and value > out[key]) or (key == "idlei" and value < out[key]):
+                    out[key] = int(value) if key[-1] == "i" else value
+            for key in MOTORKEYS:
+                for i in motors:
+                    value = next(values)
+                    out[key.format(i)] = int(value) if key[-1] == "i" else value
+        return out
+
+    @property
+    def alive(self):
+        ''' True while every worker is running. False before start and after stop '''
+        return bool(self.processes) and all(process.is_alive() for process in self.processes)
+
+    def stop(self, timeout=2.0):
+        ''' Stop the workers (coils off) and free the shared memory '''
+        self.block.setheader("stop", 1)
+        self.wakeall()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        self.block.release()
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+Offline 28BYJ-48 + ULN2003 simulator. Checks delay/accel settings for lost steps before running on hardware
+
+The rotor is a driven pendulum. Each coil pattern pulls the rotor towards its detent with a
+torque that goes as sin(electrical lag) and whose peak follows the pull-out torque vs step rate
+curve. Load inertia, friction and damping slow it down. When the rotor lags the field by more than
+half an electrical cycle (4 halfsteps) it falls into the next detent and 8 halfsteps are lost.
+
+Angles are in halfsteps at the output shaft (4076 per revolution), torques in N·m at the output shaft.
+Default MotorModel numbers are rough values for a 5V 28BYJ-48. Calibrate them on your motor.
+
+Timelines are lists of (time ns, coil bitmask) per motor. Bit 0 = IN1 ... bit 3 = IN4 (see recorder.py)
+    fromrecords(recorder.records(path))       coil patterns recorded on the Pi
+    fromcommands(stepper, commandlist)        a job (one controls dict per tick) run through a Stepper(driver='sim')
+    simulate(timeline, model)                 SimResult for one motor
+    check(timelines, model)                   {motor: SimResult}
+
+Runs much faster than real time. The rotor is only integrated while it moves (settled holds are skipped).
+"""
+
+from dataclasses import dataclass, field
+from math import sin, pi
+from .coilphase import HALF, COILSEQ, COILBITS, COILSTOP
+
+RADIANS = 2 * pi / 4076          # Radians per halfstep at the output shaft
+FIELD = {bits: k for k, bits in enumerate(COILBITS[HALF])}   # Coil bitmask -> detent (halfstep 0-7 of the electrical cycle)
+BALANCED = {bits: 1.0 if bin(bits).count("1") == 2 else 0.7071 for bits in FIELD}   # One coil on gives 1/sqrt(2) of the two coil torque
+
+@dataclass
+class MotorModel:
+    pullout: tuple = ((0, 0.034), (500, 0.030), (1000, 0.022), (1250, 0.016), (1500, 0.008), (1800, 0.0))   # (halfsteps/sec, peak torque N·m)
+    inertia: float = 1.2e-5       # Rotor inertia seen at the output shaft (through the gearbox) kg·m²
+    load: float = 0.0            # Load inertia kg·m²
+    friction: float = 0.002      # Gearbox + load friction torque N·m
+    damping: float = 0.001       # Viscous damping N·m per rad/s
+    maxdt: int = 200000          # Longest integration step ns
+
+    def torque(self, rate):
+        ''' Peak torque (N·m) at a step rate (halfsteps/sec). Straight lines between the pullout points '''
+        points = self.pullout
+        if rate <= points[0][0]:
+            return points[0][1]
+        for (r0, t0), (r1, t1) in zip(points, points[1:]):
+            if rate <= r1:
+                return t0 + (t1 - t0) * (rate - r0) / (r1 - r0)
+        return points[-1][1]
+
+@dataclass
+class SimResult:
+    steps: int = 0               # Coil pattern changes
+    lost: list = field(default_factory=list)   # (time ns, pattern number, halfsteps lost) for each slip
+    maxlag: float = 0.0          # Largest rotor lag behind the field (halfsteps)
+    error: int = 0               # Halfsteps the rotor ended up behind (+) or ahead (-) of the commanded position
+    timens: int = 0              # Simulated time
+
+    @property
+    def ok(self):
+        return not self.lost
+
+def simulate(timeline, model=None):
+    ''' Run the rotor model through a timeline of (time ns, coil bitmask). Returns a SimResult '''
+    model = model or MotorModel()
+    result = SimResult()
+    inertia = (model.inertia + model.load) * RADIANS   # Torque / inertia gives halfsteps/sec²
+    fr, damping, maxdt = model.friction, model.damping * RADIANS, model.maxdt
+    quarter = pi / 4
+    f = theta = None             # Field and rotor position (halfsteps, unwrapped)
+    v = 0.0                      # Rotor speed halfsteps/sec
+    slips = 0                    # Electrical cycles the rotor has fallen behind
+    maxlag = 0.0
+    for n in range(len(timeline)):
+        t, bits = timeline[n]
+        if bits in FIELD:
+            k = FIELD[bits]
+            if f is None:        # First pattern. Rotor snaps to it
+                f = theta = float(k)
+            else:
+                f += (k - f + 4) % 8 - 4   # Nearest detent in the direction of travel
+                result.steps += 1
+            peakscale = BALANCED[bits]
+        else:                    # Coils off. Rotor coasts
+            peakscale = 0.0
+        if f is None or n + 1 == len(timeline):
+            continue
+        interval = timeline[n + 1][0] - t
+        if interval <= 0:
+            continue
+        peak = model.torque(1e9 / interval) * peakscale
+        substeps = -(-interval // maxdt)
+        dt = interval / substeps / 1e9
+        for s in range(substeps):
+            lag = f - theta
+            torque = peak * sin(lag * quarter) - damping * v
+            if v > 0:
+                torque -= fr
+            elif v < 0:
+                torque += fr
+            elif -fr <= torque <= fr:   # Stiction. Not enough torque to start moving
+                torque = 0.0
+            else:
+                torque -= fr if torque > 0 else -fr
+            vnew = v + torque / inertia * dt
+            if not peak and v and (vnew > 0) != (v > 0):
+                vnew = 0.0       # Friction stops a coasting rotor, it does not reverse it
+            v = vnew
+            theta += v * dt
+            lag = f - theta
+            if lag > maxlag or -lag > maxlag:
+                maxlag = abs(lag)
+            cycles = int((lag + 4) // 8)   # Detent the rotor is in, counted in electrical cycles behind the field
+            if cycles != slips:
+                result.lost.append((t + int((s + 1) * dt * 1e9), n, (cycles - slips) * 8))
+                slips = cycles
+            if -0.5 < v < 0.5 and -0.05 < lag - 8 * slips < 0.05:
+                v, theta = 0.0, f - 8 * slips
+                break            # Settled on the detent. Nothing moves until the next pattern
+    if timeline:
+        result.timens = timeline[-1][0] - timeline[0][0]
+    result.maxlag = maxlag
+    result.error = 8 * slips
+    return result
+
+def fromrecords(records):
+    ''' Timelines {motor: [(time ns, coil bitmask)]} from StepRecorder records (timens, position, motor, coils) '''
+    timelines = {}
+    for timens, position, motor, coils in records:
+        timelines.setdefault(motor, []).append((timens, coils))
+    return timelines
+
+def fromcommands(stepper, commands):
+    ''' Timelines {motor: [(time ns, coil bitmask)]} from running a job through a Stepper(driver='sim'). One controls dict per tick.
+        Time comes from the tick delays, not the wall clock, so this runs as fast as tick() does '''
+    bits = {COILSTOP: 0}         # Coil array -> bitmask
+    for seq, masks in zip(COILSEQ, COILBITS):
+        bits.update(zip(seq, masks))
+    timelines = {i: [] for i in range(len(stepper.mach.stepper))}
+    timens = 0
+    for command in commands:
+        delay = stepper.tick(command)
+        for i, motor in enumerate(stepper.mach.stepper):
+            mask = bits[motor.coils]
+            timeline = timelines[i]
+            if not timeline or timeline[-1][1] != mask:
+                timeline.append((timens, mask))
+        timens += int(delay * 1000000)
+    for timeline in timelines.values():        # End of the job. Hold the last pattern long enough for the rotor to settle
+        if timeline:
+            timeline.append((timens + 100000000, timeline[-1][1]))
+    return timelines
+
+def check(timelines, model=None):
+    ''' {motor: SimResult} for every timeline '''
+    return {motor: simulate(timeline, model) for motor, timeline in timelines.items()}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Run a Stepper on its own thread
+
+The thread calls Stepper.tick and waits for an absolute deadline (previous deadline + loop delay)
+with the Stepper's timer (precisetimer.py, sleep then spin)
+so mqtt publishing, json encoding and logging in the main thread can not stretch a step.
+New controls are handed over as a read only snapshot (see controls.snapshot). setcontrols swaps one
+reference and the step loop reads it once per step, so there is no lock or queue on the hot path and
+a step never sees half of one message and half of the next. Other commands (resetsteps, call) come
+in through a queue and are applied between steps. Status is read with getdata().
+poll (optional, no arguments) is called before every step on the stepper thread. The shard workers
+(see shard.py) use it to pick up commands from shared memory.
+realtime=Realtime() (see realtime.py) runs the step loop SCHED_FIFO, pinned and with memory locked.
+
+When every motor is stopped (Stepper.idle) the coils are already off from the tick that stopped them,
+so the thread blocks on the wake event instead of ticking. setcontrols, resetsteps, call and stop set
+it, so stepping starts again right away. idlewait (sec) wakes it up anyway every so often (None = never).
+"""
+
+import threading
+import queue
+from time import perf_counter_ns
+from .controls import snapshot
+from .realtime import OFF
+
+class StepperThread(threading.Thread):
+    def __init__(self, motor, controls, logger=None, realtime=None):
+        super().__init__(name="stepper", daemon=True)
+        self.motor = motor               # stepper28byj.Stepper object
+        self.controls = snapshot(controls)   # Latest controls (delay, speed, mode, ...) passed to Stepper.tick. Replaced, never changed
+        self.logger = logger if logger is not None else motor.logger
+        self.commands = queue.SimpleQueue()   # Thread safe handoff. Items are (command name, value)
+        self.running = threading.Event()
+        self.periodns = 0       # Measured time between the last two coil transitions (ns)
+        self.overrunns = 0      # How late the last step was past its deadline (ns)
+        self.missed = 0         # Number of steps that started after their deadline
+        self.poll = None        # Called before every step on the stepper thread. Keep it short
+        self.wake = threading.Event()   # Set by every command. The thread waits on it while idle
+        self.idlewait = None    # Longest idle wait (sec). None = until a command comes in
+        self.idling = False     # Blocked with every motor stopped
+        self.realtime = realtime     # realtime.Realtime applied when the thread starts. None = normal thread
+
+    def setcontrols(self, controls):
+        ''' New controls (from mqtt/node-red). Used from the next step. Later changes to controls by the caller are not seen '''
+        self.controls = snapshot(controls)   # One reference swap. Atomic, the step loop picks up the old or the new snapshot
+        self.wake.set()
+
+    def resetsteps(self):
+        ''' Queue a step counter reset. Done on the stepper thread between steps '''
+        self.commands.put(("resetsteps", None))
+        self.wake.set()
+
+    def call(self, fn):
+        ''' Queue fn(motor) to run on the stepper thread between steps. ie starting a move '''
+        self.commands.put(("call", fn))
+        self.wake.set()
+
+    def getdata(self):
+        ''' Stepper data plus the measured step period. Safe to call from another thread '''
+        data = self.motor.getdata()
+        data["main_msf"] = self.periodns / 1000000   # Report the stepping period in ms
+        data["idlei"] = int(self.idling)
+        data.update(self.realtime.getdata() if self.realtime is not None else OFF)   # Real-time settings in effect
+        return data
+
+    def stop(self, timeout=1.0):
+        self.running.clear()
+        self.wake.set()
+        self.join(timeout)
+
+    def run(self):
+        self.running.set()
+        self.logger.info("Stepper thread started")
+        if self.realtime is not None:
+            self.realtime.apply(self.logger)     # On this thread. Falls back (warnings) without permission
+        try:
+            self.steploop()
+        except Exception:      # Keep the step record leading up to the error
+            if self.motor.recorder is not None:
+                self.motor.recorder.fault()
+                self.motor.recorder.wait()   # Written before the thread goes
+            raise
+        self.logger.info("Stepper thread stopped")
+
+    def steploop(self):
+        deadline = perf_counter_ns()
+        tprev = deadline
+        while self.running.is_set():
+            if self.poll is not None:
+                self.poll()
+            self.idling = False                   # Cleared after poll so status written coming out of an idle wait says idle
+            while not self.commands.empty():     # Apply any new commands between steps
+                name, value = self.commands.get_nowait()
+                if name == "resetsteps":
+                    self.motor.resetsteps()
+                elif name == "call":
+                    try:
+                        value(self.motor)
+                    except Exception:
+                        self.logger.exception("Stepper thread call failed")
+            tnow = perf_counter_ns()
+            self.periodns, tprev = tnow - tprev, tnow
+            delay = self.motor.tick(self.controls)
+            if self.motor.idle():                 # All stopped, coils off. Block until a command comes in
+                self.idling = True
+                self.wake.wait(self.idlewait)
+                self.wake.clear()                 # A command after this is seen on the next tick anyway
+                self.motor.resume()
+                deadline = tprev = perf_counter_ns()   # Fresh schedule. The idle time is not a late step
+                continue
+            deadline += int(delay * 1000000)      # Next deadline comes from the last deadline, not from now. No drift.
+            tnow = perf_counter_ns()
+            if deadline > tnow:
+                self.motor.recordsleep(self.motor.timer.sleepuntil(deadline))   # Sleep, then spin the calibrated margin
+            else:                                 # Late. Restart the schedule from now instead of bursting steps to catch up
+                self.missed += 1
+                self.overrunns = tnow - deadline
+                deadline = tnow
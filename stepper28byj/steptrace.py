@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+"""
+Debug trace of the step loop. Stepper(m1pins, trace=True)
+
+Each step the raw step state is stored as a tuple in a preallocated ring buffer. Nothing is
+formatted until the trace is dumped, so tracing costs a tuple per step and no tracing (the
+default) costs nothing.
+"""
+
+FIELDS = ("timens", "motor", "steps", "position", "speed", "mode", "startstepping", "targetstep", "coils")
+
+class StepTrace:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.buffer = [None] * capacity   # Preallocated. Old entries are overwritten
+        self.count = 0                    # Total entries since start
+
+    def record(self, entry):
+        self.buffer[self.count % self.capacity] = entry
+        self.count += 1
+
+    def entries(self):
+        ''' Recorded tuples oldest first '''
+        first = max(0, self.count - self.capacity)
+        return [self.buffer[k % self.capacity] for k in range(first, self.count)]
+
+    def lines(self):
+        ''' Entries formatted like the old debug log lines '''
+        return ["{0} Motor:{1} Steps:{2} Position:{3} Speed:{4} Mode:{5} startstepping:{6} targetstep:{7} coils:{8}".format(*entry) for entry in self.entries()]
+
+    def dump(self, logger):
+        ''' Write the trace to a logger (DEBUG) and clear it '''
+        for line in self.lines():
+            logger.debug(line)
+        self.count = 0
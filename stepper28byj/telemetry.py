@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+Compact telemetry. Only fields that changed since the last publish are sent, with a full keyframe every so often
+
+    encoder = TelemetryEncoder(data_keys, encoding='json', keyframe=50)
+    payload = encoder.encode(motorthread.getdata())     # None when nothing changed
+    if payload is not None:
+        mqtt_client.publish(topic, payload)
+
+Keys follow the data_keys naming, the last letter is the type: 'i' int, 'f' float ('steps0i', 'rpm0f').
+datakeys(motors) gives the keys for any number of motors (the changed mask grows a byte per 8 keys).
+Floats are rounded to digits decimals before comparing so jitter in the last digits is not a change.
+
+encoding='json'   json object of the changed keys. A keyframe has every key. Same format as before, just fewer keys
+encoding='struct' little endian binary
+    version  uint8   2
+    flags    uint8   bit 0 = keyframe
+    sequence uint16  counts up every payload (wraps). A gap means a payload was lost, wait for the next keyframe
+    changed  ceil(len(keys)/8) bytes. Bit n set = keys[n] follows
+    values   int64 ('i' keys) or float32 ('f' keys) for each changed key, in keys order. Step counts pass int32 after 20 days at 1250 steps/sec
+TelemetryDecoder keeps the full state on the receiving side (either encoding).
+"""
+
+import json
+import struct
+
+MACHINEKEYS = ("delayf", "cpufreq0i", "main_msf", "rtprioi", "rtcpui", "rtlockedi", "idlei")
+MOTORKEYS = ("looptime{0}f", "steps{0}i", "pos{0}i", "rpm{0}f", "speed{0}i", "stepp99_{0}f", "missed{0}i")
+VERSION = 2                # 1 packed 'i' keys as int32
+HEADER = struct.Struct("<BBH")
+FORMATS = {"i": "q", "f": "f"}   # struct format of each key type
+KEYFRAME = 1
+
+def datakeys(motors):
+    ''' Telemetry keys for a number of motors. Machine keys then each motor key for motor 0, 1, ... '''
+    return list(MACHINEKEYS) + [key.format(i) for key in MOTORKEYS for i in range(motors)]
+
+def _fieldtypes(keys):
+    types = []
+    for key in keys:
+        if key[-1] not in "if":
+            raise ValueError("Telemetry key {0} must end in i (int) or f (float)".format(key))
+        types.append(key[-1])
+    return types
+
+class TelemetryEncoder:
+    def __init__(self, keys, encoding='json', keyframe=50, digits=3):
+        if encoding not in ('json', 'struct'):
+            raise ValueError("Unknown telemetry encoding {0}. Use 'json' or 'struct'".format(encoding))
+        self.keys = list(keys)
+        self.types = _fieldtypes(self.keys)
+        self.encoding = encoding
+        self.keyframe = keyframe              # Send every key every keyframe encode() calls, changed or not (0 = only the first time)
+        self.digits = digits                  # Decimals floats are rounded to
+        self.last = [None] * len(self.keys)   # Values last sent
+        self.count = 0                        # encode() calls since the last keyframe. 0 = next one is a keyframe
+        self.sequence = 0
+        self.changed = {}                     # Reused for json payloads
+        self.structs = {}                     # Changed mask -> struct.Struct for the values. Reused every time the same fields change
+        self.maskbytes = (len(self.keys) + 7) // 8
+
+    def requestkeyframe(self):
+        ''' Send every key in the next payload. ie when node-red restarts '''
+        self.count = 0
+
+    def encode(self, data):
+        ''' Payload (str for json, bytes for struct) with the keys that changed, or None if nothing did '''
+        keyframe = self.count == 0
+        self.count = (self.count + 1) % self.keyframe if self.keyframe else 1
+        last, digits = self.last, self.digits
+        mask = 0
+        values = []
+        for n, key in enumerate(self.keys):
+            value = data.get(key, 0)
+            value = round(value, digits) if self.types[n] == "f" else int(value)
+            if keyframe or value != last[n]:
+                last[n] = value
+                mask |= 1 << n
+                values.append(value)
+        if not mask:
+            return None
+        if self.encoding == 'json':
+            changed = self.changed
+            changed.clear()
+            for n, value in zip(self.bits(mask), values):
+                changed[self.keys[n]] = value
+            return json.dumps(changed)
+        template = self.structs.get(mask)
+        if template is None:
+            if len(self.structs) > 256:       # Lots of different change patterns. Start over rather than grow
+                self.structs.clear()
+            template = self.structs[mask] = struct.Struct("<" + "".join(FORMATS[self.types[n]] for n in self.bits(mask)))
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        return HEADER.pack(VERSION, KEYFRAME if keyframe else 0, self.sequence) + mask.to_bytes(self.maskbytes, "little") + template.pack(*values)
+
+    @staticmethod
+    def bits(mask):
+        ''' Bit numbers set in mask, lowest first '''
+        n = 0
+        while mask:
+            if mask & 1:
+                yield n
+            mask >>= 1
+            n += 1
+
+class TelemetryDecoder:
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.types = _fieldtypes(self.keys)
+        self.data = {}            # Full state. Empty until the first keyframe
+        self.sequence = None      # Last struct sequence number
+        self.lost = 0             # struct payloads missed (sequence gaps)
+
+    def decode(self, payload):
+        ''' Apply a payload (json str or struct bytes). Returns the full state dict '''
+        if isinstance(payload, str) or payload[:1] == b"{":
+            self.data.update(json.loads(payload))
+            return self.data
+        version, flags, sequence = HEADER.unpack_from(payload)
+        if version != VERSION:
+            raise ValueError("Unknown telemetry version {0}".format(version))
+        if self.sequence is not None:
+            self.lost += (sequence - self.sequence - 1) & 0xFFFF
+        self.sequence = sequence
+        maskbytes = (len(self.keys) + 7) // 8
+        mask = int.from_bytes(payload[HEADER.size:HEADER.size + maskbytes], "little")
+        fields = list(TelemetryEncoder.bits(mask))
+        values = struct.unpack_from("<" + "".join(FORMATS[self.types[n]] for n in fields), payload, HEADER.size + maskbytes)
+        for n, value in zip(fields, values):
+            self.data[self.keys[n]] = value
+        return self.data
@@ -17,25 +17,25 @@ import utime
 import math
 
 class Stepper:   # command comes from node-red GUI
-    def __init__(self, m1pin, m2pin, numbermotors=1, setupinfo=False):
-        self.numbermotors = numbermotors
-        if self.numbermotors == 2:
-            self.stepperpin = [[Pin(m1pin[0], Pin.OUT),Pin(m1pin[1], Pin.OUT),Pin(m1pin[2], Pin.OUT),Pin(m1pin[3], Pin.OUT)]
-, [Pin(m2pin[0], Pin.OUT),Pin(m2pin[1], Pin.OUT),Pin(m2pin[2], Pin.OUT),Pin(m2pin[3], Pin.OUT)]]
-        elif self.numbermotors == 1:
-            self.stepperpin = [[Pin(m1pin[0], Pin.OUT),Pin(m1pin[1], Pin.OUT),Pin(m1pin[2], Pin.OUT),Pin(m1pin[3], Pin.OUT)], [0]]
+    def __init__(self, m1pin, m2pin=None, numbermotors=1, setupinfo=False, pins=None):
+        # pins: list of 4 pin lists, one per motor, for any number of motors. Otherwise m1pin/m2pin and numbermotors (1 or 2)
+        if pins is None:
+            pins = [m1pin, m2pin][:numbermotors]
+        self.numbermotors = len(pins)
+        n = self.numbermotors
+        self.stepperpin = [[Pin(pin, Pin.OUT) for pin in motorpins] for motorpins in pins]
         if setupinfo: print('Stepper - {0} motor(s) on  pins:{1} '.format(self.numbermotors, self.stepperpin))
-        self.steppersteps = [0, 0]           # Keep track of how many steps each motor has taken
-        self.stepperspeed = [[0,1,2,3,4], [0,1,2,3,4]]      # Will keep track of coil pulses for each speed
-        self.steppercoils = [{"Half":[0,1], "Full":[0,1], "arr2":[0,1], "arr3":[0,1], "HarrOUT":[0,1], "FarrOUT":[0,1]}, {"Half":[0,1], "Full":[0,1], "arr2":[0,1], "arr3":[0,1], "HarrOUT":[0,1], "FarrOUT":[0,1]}]
+        self.steppersteps = [0] * n           # Keep track of how many steps each motor has taken
+        self.stepperspeed = [[0,1,2,3,4] for i in range(n)]      # Will keep track of coil pulses for each speed
+        self.steppercoils = [{"Half":[0,1], "Full":[0,1], "arr2":[0,1], "arr3":[0,1], "HarrOUT":[0,1], "FarrOUT":[0,1]} for i in range(n)]
         self.FULLREVOLUTION = 4076    # Steps per revolution
         # Setup and intialize motor parameters
-        self.startstepping = [False,False]  # Flag send from node red gui to start stepping in incremental mode
-        self.targetstep = [291,291]         # When incremental stepping started will calculate the target step to stop at
-        self.rpmtime0 = [utime.ticks_us(), utime.ticks_us()]
-        self.rpmsteps0 = [0, 0]
-        self.rpm = [0,0]
-        self.seq = [0,0]
+        self.startstepping = [False] * n  # Flag send from node red gui to start stepping in incremental mode
+        self.targetstep = [291] * n         # When incremental stepping started will calculate the target step to stop at
+        self.rpmtime0 = [utime.ticks_us()] * n
+        self.rpmsteps0 = [0] * n
+        self.rpm = [0] * n
+        self.seq = [0] * n
         self.stepperstats = {}   # Container for sending stepper stats
         self.delay_us = 0   # Keep track of total delay/pause after sending pulses to motors
         for i in range(self.numbermotors):